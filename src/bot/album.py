@@ -0,0 +1,57 @@
+"""Сборка альбомов (media group) из отдельных сообщений"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import Message
+
+
+class AlbumCollector:
+    """
+    Собирает сообщения одного альбома по media_group_id
+
+    Telegram присылает альбом отдельными сообщениями с общим
+    media_group_id. Первое сообщение группы ждёт, пока в течение window
+    секунд не перестанут приходить новые, и возвращает весь альбом;
+    остальные сообщения только добавляются в группу.
+    """
+
+    def __init__(self, window: float = 0.6):
+        """
+        Args:
+            window: Тишина (сек), после которой альбом считается полученным (из config.image.album_window_seconds)
+        """
+        self.window = window
+        self._groups: Dict[Tuple[int, str], List[Message]] = {}
+        self._updated_at: Dict[Tuple[int, str], float] = {}
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        """
+        Добавить сообщение в альбом
+
+        Args:
+            message: Сообщение с media_group_id
+
+        Returns:
+            Все сообщения альбома (по порядку) для первого сообщения группы,
+            None для остальных
+        """
+        key = (message.chat.id, message.media_group_id)
+        loop = asyncio.get_running_loop()
+        self._updated_at[key] = loop.time()
+
+        group = self._groups.get(key)
+        if group is not None:
+            group.append(message)
+            return None
+
+        self._groups[key] = [message]
+        while True:
+            delay = self._updated_at[key] + self.window - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        del self._updated_at[key]
+        messages = self._groups.pop(key)
+        return sorted(messages, key=lambda m: m.message_id)
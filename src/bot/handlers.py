@@ -2,12 +2,14 @@
 
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from pathlib import Path
+from typing import List, Tuple, TYPE_CHECKING
 from loguru import logger
 
 from src.bot.states import ImageEditStates
+from src.bot.album import AlbumCollector
 from src.bot.keyboards import (
     create_confirm_keyboard,
     create_settings_keyboard,
@@ -16,12 +18,18 @@ from src.bot.keyboards import (
     create_user_settings_keyboard,
     create_user_gen_params_keyboard
 )
-from src.models.task import Task, WorkflowParams
+from src.models.task import Task, TaskLane, WorkflowParams
 from src.queue.task_queue import TaskQueue
+from src.queue.admission import AdmissionRejected
+from src.queue.eta import format_eta
 from src.models.config import Config
 from src.storage.file_manager import FileManager
 from src.storage.user_settings import UserSettingsManager
 
+if TYPE_CHECKING:
+    # Только для аннотаций: processor импортирует src.bot (циклический импорт)
+    from src.queue.processor import TaskProcessor
+
 router = Router()
 
 
@@ -50,7 +58,7 @@ async def cmd_start(message: Message):
         "/new — новая задача с настройками\n"
         "/settings — персональные настройки\n"
         "/status — статус очереди\n"
-        "/cancel — отменить задачу\n"
+        "/cancel — отменить задачу (/cancel ID — из очереди)\n"
         "/help — справка\n\n"
         "💡 <i>В /settings можно настроить промпт по умолчанию, "
         "автозапуск и параметры генерации</i>",
@@ -79,6 +87,9 @@ async def cmd_help(message: Message):
         "3. Опишите желаемые изменения\n"
         "4. Опционально: negative prompt или /skip\n"
         "5. Настройте параметры и подтвердите\n\n"
+        "🚫 <b>Отмена:</b>\n"
+        "• /cancel — отменить настройку задачи или показать задачи в очереди\n"
+        "• /cancel ID — удалить задачу из очереди\n\n"
         "⚙️ <b>Персональные настройки (/settings):</b>\n"
         "• <b>Промпт по умолчанию</b> — для фото без подписи\n"
         "• <b>Автозапуск</b> — убрать подтверждение\n"
@@ -97,12 +108,12 @@ async def cmd_help(message: Message):
 
 
 @router.message(Command("new"))
-async def cmd_new(message: Message, state: FSMContext):
+async def cmd_new(message: Message, state: FSMContext, file_manager: FileManager):
     """Команда /new — начать новую задачу"""
     logger.info(f"User {message.from_user.id} starting new task")
     
     # Очистить предыдущее состояние
-    await state.clear()
+    await _discard_state(state, file_manager)
     
     # Установить начальное состояние
     await state.set_state(ImageEditStates.waiting_for_image)
@@ -127,26 +138,75 @@ async def cmd_status(message: Message, task_queue: TaskQueue):
     
     await message.answer(
         "📊 <b>Статус очереди</b>\n\n"
-        f"📥 В очереди: {status['queue_size']}\n"
+        f"📥 В очереди: {status['queue_size']} "
+        f"(пакетных: {status['lane_sizes']['bulk']})\n"
         f"{processing_text}\n"
-        f"✅ Выполнено сегодня: {status['completed_today']}\n"
+        f"⏱ Ожидание новой задачи: {format_eta(status['estimated_wait'])}\n"
+        f"✅ Выполнено сегодня: {status['completed_today']} "
+        f"(за час: {status['completed_last_hour']})\n"
         f"📈 Всего выполнено: {status['total_completed']}\n"
-        f"📉 Успешность: {status['success_rate']}%",
+        f"📉 Успешность: {status['success_rate']}%\n"
+        f"🚫 Отклонено при перегрузке: {status['rejected_total']}\n"
+        f"⚡ Выполнено в быстром режиме: {status['degraded_total']}",
         parse_mode="HTML"
     )
 
 
 @router.message(Command("cancel"))
-async def cmd_cancel(message: Message, state: FSMContext):
-    """Команда /cancel — отменить текущую задачу"""
+async def cmd_cancel(message: Message, state: FSMContext, command: CommandObject,
+                     task_queue: TaskQueue, task_processor: "TaskProcessor",
+                     file_manager: FileManager):
+    """Команда /cancel — отменить текущую задачу или задачу в очереди (/cancel <id>)"""
+    user_id = message.from_user.id
+    
+    # /cancel <id> — отмена задачи, уже стоящей в очереди
+    if command.args:
+        short_id = command.args.strip().lower()
+        task = task_queue.find_user_task(user_id, short_id)
+        
+        if not task or not await task_queue.cancel_task(task.id, user_id=user_id):
+            current = task_queue.current_task
+            if current and current.user_id == user_id and current.id.startswith(short_id):
+                await message.answer("⏳ Эта задача уже обрабатывается и не может быть отменена")
+            else:
+                await message.answer(f"❌ Задача <code>{short_id}</code> не найдена в очереди", parse_mode="HTML")
+            return
+        
+        logger.info(f"User {user_id} cancelled queued task {task.id[:8]}")
+        
+        # Сообщение пакета общее: отмена учитывается в его сводном статусе (и для дубликатов)
+        await task_processor.report_cancelled(
+            task, f"🚫 <b>Задача отменена</b>\n\n🆔 ID: <code>{task.id[:8]}</code>"
+        )
+        
+        await message.answer(
+            f"🚫 <b>Задача <code>{task.id[:8]}</code> удалена из очереди</b>",
+            parse_mode="HTML"
+        )
+        return
+    
     current_state = await state.get_state()
     
     if current_state is None:
-        await message.answer("❌ Нет активной задачи для отмены")
+        pending = task_queue.find_user_tasks(user_id)
+        if not pending:
+            await message.answer("❌ Нет активной задачи для отмены")
+            return
+        
+        # Подсказать, как отменить задачи в очереди
+        lines = [
+            f"• <code>{task.id[:8]}</code> — позиция {task_queue.get_position(task.id)}"
+            for task in pending[:10]
+        ]
+        await message.answer(
+            "📋 <b>Ваши задачи в очереди:</b>\n\n" + "\n".join(lines) + "\n\n"
+            "Для отмены отправьте /cancel &lt;id&gt;",
+            parse_mode="HTML"
+        )
         return
     
-    await state.clear()
-    logger.info(f"User {message.from_user.id} cancelled task (state: {current_state})")
+    await _discard_state(state, file_manager)
+    logger.info(f"User {user_id} cancelled task (state: {current_state})")
     
     await message.answer(
         "🚫 <b>Задача отменена</b>\n\n"
@@ -156,7 +216,8 @@ async def cmd_cancel(message: Message, state: FSMContext):
 
 
 @router.message(Command("batch"))
-async def cmd_batch(message: Message, state: FSMContext, user_settings_manager: UserSettingsManager):
+async def cmd_batch(message: Message, state: FSMContext, user_settings_manager: UserSettingsManager,
+                    file_manager: FileManager):
     """Команда /batch — начать пакетную обработку"""
     logger.info(f"User {message.from_user.id} starting batch processing")
     
@@ -171,7 +232,7 @@ async def cmd_batch(message: Message, state: FSMContext, user_settings_manager:
         return
     
     # Очистить предыдущее состояние
-    await state.clear()
+    await _discard_state(state, file_manager)
     
     # Инициализировать список изображений
     await state.update_data(batch_images=[])
@@ -262,7 +323,7 @@ async def cmd_skip(message: Message, state: FSMContext, config: Config):
 async def handle_quick_photo_with_caption(message: Message, state: FSMContext, config: Config,
                                          file_manager: FileManager, bot: Bot,
                                          user_settings_manager: UserSettingsManager,
-                                         task_queue: TaskQueue):
+                                         task_queue: TaskQueue, task_processor: "TaskProcessor"):
     """
     Быстрая генерация: фото с подписью автоматически запускает процесс.
     Промпт берётся из caption, остальное - дефолтные настройки.
@@ -316,7 +377,7 @@ async def handle_quick_photo_with_caption(message: Message, state: FSMContext, c
         
         if auto_confirm:
             # Автоматический запуск
-            await _auto_start_task(message, state, config, task_queue)
+            await _auto_start_task(message, state, config, task_queue, task_processor, file_manager)
         else:
             # Показать подтверждение
             await state.set_state(ImageEditStates.confirming)
@@ -332,7 +393,7 @@ async def handle_quick_photo_with_caption(message: Message, state: FSMContext, c
 async def handle_quick_photo_without_caption(message: Message, state: FSMContext, config: Config,
                                              file_manager: FileManager, bot: Bot,
                                              user_settings_manager: UserSettingsManager,
-                                             task_queue: TaskQueue):
+                                             task_queue: TaskQueue, task_processor: "TaskProcessor"):
     """
     Быстрая генерация: фото без подписи использует промпт по умолчанию.
     Если промпт не установлен - просит его отправить.
@@ -390,7 +451,7 @@ async def handle_quick_photo_without_caption(message: Message, state: FSMContext
         
         if auto_confirm:
             # Автоматический запуск
-            await _auto_start_task(message, state, config, task_queue)
+            await _auto_start_task(message, state, config, task_queue, task_processor, file_manager)
         else:
             # Показать подтверждение
             await state.set_state(ImageEditStates.confirming)
@@ -609,7 +670,7 @@ async def callback_skip_negative(callback: CallbackQuery, state: FSMContext, con
 
 @router.callback_query(F.data == "task_confirm")
 async def callback_confirm(callback: CallbackQuery, state: FSMContext, 
-                          task_queue: TaskQueue, config: Config):
+                          task_queue: TaskQueue, config: Config, task_processor: "TaskProcessor"):
     """Подтверждение и постановка задачи в очередь"""
     current_state = await state.get_state()
     
@@ -644,7 +705,8 @@ async def callback_confirm(callback: CallbackQuery, state: FSMContext,
         chat_id=callback.message.chat.id,
         message_id=callback.message.message_id,
         image_path=Path(data['image_path']),
-        workflow_params=workflow_params
+        workflow_params=workflow_params,
+        lane=TaskLane.INTERACTIVE
     )
     
     try:
@@ -659,7 +721,11 @@ async def callback_confirm(callback: CallbackQuery, state: FSMContext,
         # Обновить task с правильным message_id для отображения прогресса
         task.message_id = callback.message.message_id
         
-        position = await task_queue.add_task(task)
+        if config.queue.supersede:
+            position, superseded = await task_queue.replace_pending(task)
+            await _notify_superseded(task_processor, superseded)
+        else:
+            position = await task_queue.add_task(task)
         
         logger.info(
             f"Task {task.id[:8]} created by user {callback.from_user.id}, "
@@ -669,17 +735,32 @@ async def callback_confirm(callback: CallbackQuery, state: FSMContext,
         # Очистить состояние
         await state.clear()
         
+        if task.duplicate_of:
+            await callback.message.edit_text(_duplicate_text(task, position), parse_mode="HTML")
+            await callback.answer("Такая задача уже в очереди")
+            return
+        
         # Обновить сообщение с позицией в очереди
         await callback.message.edit_text(
             f"✅ <b>Задача добавлена в очередь</b>\n\n"
             f"🆔 ID: <code>{task.id[:8]}</code>\n"
-            f"📍 Позиция: {position}\n\n"
+            f"📍 Позиция: {position}\n"
+            f"⏱ Начало: {format_eta(task_queue.get_eta(task.id))}\n\n"
             f"⏳ Ожидайте результат...",
             parse_mode="HTML"
         )
         
         await callback.answer("Задача добавлена!")
         
+    except AdmissionRejected as e:
+        # Состояние сохраняется — можно нажать «Запустить» ещё раз позже
+        await callback.message.edit_text(
+            _rejection_text(e),
+            parse_mode="HTML",
+            reply_markup=create_confirm_keyboard()
+        )
+        await callback.answer()
+        
     except Exception as e:
         logger.error(f"Failed to add task: {e}")
         await callback.answer(f"❌ Ошибка: {e}", show_alert=True)
@@ -703,9 +784,9 @@ async def callback_settings(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "task_cancel")
-async def callback_cancel(callback: CallbackQuery, state: FSMContext):
+async def callback_cancel(callback: CallbackQuery, state: FSMContext, file_manager: FileManager):
     """Отмена задачи"""
-    await state.clear()
+    await _discard_state(state, file_manager)
     
     logger.info(f"User {callback.from_user.id} cancelled task via callback")
     
@@ -1117,7 +1198,7 @@ async def callback_user_settings_close(callback: CallbackQuery):
 
 @router.message(ImageEditStates.setting_default_prompt, F.text)
 async def handle_default_prompt(message: Message, state: FSMContext,
-                                user_settings_manager: UserSettingsManager):
+                                user_settings_manager: UserSettingsManager, file_manager: FileManager):
     """Обработка установки промпта по умолчанию"""
     prompt = message.text.strip()
     
@@ -1135,7 +1216,7 @@ async def handle_default_prompt(message: Message, state: FSMContext,
     logger.info(f"User {message.from_user.id} set default prompt: {prompt[:50]}...")
     
     # Очистить состояние
-    await state.clear()
+    await _discard_state(state, file_manager)
     
     settings = user_settings_manager.get_settings(message.from_user.id)
     
@@ -1156,7 +1237,8 @@ async def handle_default_prompt(message: Message, state: FSMContext,
 
 @router.message(ImageEditStates.setting_default_steps, F.text)
 async def handle_default_steps(message: Message, state: FSMContext,
-                               user_settings_manager: UserSettingsManager, config: Config):
+                               user_settings_manager: UserSettingsManager, config: Config,
+                               file_manager: FileManager):
     """Обработка установки Steps по умолчанию"""
     try:
         steps = int(message.text.strip())
@@ -1170,7 +1252,7 @@ async def handle_default_steps(message: Message, state: FSMContext,
         user_settings_manager.update_settings(message.from_user.id, default_steps=steps)
         logger.info(f"User {message.from_user.id} set default steps: {steps}")
         
-        await state.clear()
+        await _discard_state(state, file_manager)
         settings = user_settings_manager.get_settings(message.from_user.id)
         
         await message.answer(
@@ -1189,7 +1271,8 @@ async def handle_default_steps(message: Message, state: FSMContext,
 
 @router.message(ImageEditStates.setting_default_cfg, F.text)
 async def handle_default_cfg(message: Message, state: FSMContext,
-                             user_settings_manager: UserSettingsManager, config: Config):
+                             user_settings_manager: UserSettingsManager, config: Config,
+                             file_manager: FileManager):
     """Обработка установки CFG по умолчанию"""
     try:
         cfg = float(message.text.strip().replace(',', '.'))
@@ -1203,7 +1286,7 @@ async def handle_default_cfg(message: Message, state: FSMContext,
         user_settings_manager.update_settings(message.from_user.id, default_cfg=cfg)
         logger.info(f"User {message.from_user.id} set default cfg: {cfg}")
         
-        await state.clear()
+        await _discard_state(state, file_manager)
         settings = user_settings_manager.get_settings(message.from_user.id)
         
         await message.answer(
@@ -1222,7 +1305,7 @@ async def handle_default_cfg(message: Message, state: FSMContext,
 
 @router.message(ImageEditStates.setting_default_seed, F.text)
 async def handle_default_seed(message: Message, state: FSMContext,
-                              user_settings_manager: UserSettingsManager):
+                              user_settings_manager: UserSettingsManager, file_manager: FileManager):
     """Обработка установки Seed по умолчанию"""
     text = message.text.strip().lower()
     
@@ -1238,7 +1321,7 @@ async def handle_default_seed(message: Message, state: FSMContext,
         user_settings_manager.update_settings(message.from_user.id, default_seed=seed)
         logger.info(f"User {message.from_user.id} set default seed: {seed}")
         
-        await state.clear()
+        await _discard_state(state, file_manager)
         settings = user_settings_manager.get_settings(message.from_user.id)
         
         seed_text = "random" if seed == 0 else str(seed)
@@ -1261,21 +1344,102 @@ async def handle_default_seed(message: Message, state: FSMContext,
 # Пакетная обработка
 # =============================================================================
 
+def _batch_file(message: Message, config: Config) -> Tuple[str, str]:
+    """
+    Проверить фото или документ для пакета и получить file_id и расширение
+
+    Args:
+        message: Сообщение с фото или документом
+        config: Конфигурация (ограничения на формат и размер)
+
+    Returns:
+        Tuple (file_id, extension)
+
+    Raises:
+        ValueError: Файл не подходит (текст ошибки для пользователя)
+    """
+    if message.photo:
+        return message.photo[-1].file_id, "jpg"
+
+    document = message.document
+    
+    # Проверить MIME тип
+    allowed_mimes = ["image/jpeg", "image/png", "image/webp"]
+    if document is None or document.mime_type not in allowed_mimes:
+        raise ValueError("❌ Неподдерживаемый формат. Отправьте JPG, PNG или WEBP.")
+    
+    # Проверить размер
+    max_size_bytes = config.image.max_size_mb * 1024 * 1024
+    if document.file_size and document.file_size > max_size_bytes:
+        raise ValueError(f"❌ Файл слишком большой (максимум {config.image.max_size_mb} МБ)")
+    
+    # Определить расширение
+    extension = document.mime_type.split("/")[-1]
+    return document.file_id, "jpg" if extension == "jpeg" else extension
+
+
+@router.message(ImageEditStates.batch_processing, F.media_group_id, F.photo | F.document)
+async def handle_batch_album(message: Message, state: FSMContext, config: Config,
+                             file_manager: FileManager, bot: Bot, album_collector: AlbumCollector):
+    """Обработка альбома в режиме пакетной обработки: один ответ и одно обновление состояния на альбом"""
+    messages = await album_collector.collect(message)
+    if messages is None:
+        return  # Сообщение добавлено в альбом, его обработает первое сообщение группы
+    
+    files = []
+    for item in messages:
+        try:
+            files.append(_batch_file(item, config))
+        except ValueError:
+            pass
+    skipped = len(messages) - len(files)
+    
+    logger.info(
+        f"User {message.from_user.id} added album to batch: {len(messages)} items "
+        f"(group {message.media_group_id})"
+    )
+    
+    paths = await file_manager.download_files(bot, files, message.from_user.id)
+    downloaded = [str(path) for path in paths if path]
+    failed = len(paths) - len(downloaded)
+    
+    if await state.get_state() != ImageEditStates.batch_processing:
+        # Пакет уже запущен или отменён, пока альбом докачивался
+        for path in downloaded:
+            file_manager.discard_input(Path(path))
+        return
+    
+    data = await state.get_data()
+    batch_images = data.get('batch_images', []) + downloaded
+    await state.update_data(batch_images=batch_images)
+    
+    text = f"✅ <b>Альбом добавлен: {len(downloaded)} из {len(messages)}</b>\n\n"
+    if skipped:
+        text += f"⚠️ Пропущено (формат или размер): {skipped}\n"
+    if failed:
+        text += f"❌ Не удалось загрузить: {failed}\n"
+    text += (
+        f"📦 Всего в пакете: {len(batch_images)}\n\n"
+        "Отправляйте ещё фото или /done для запуска обработки"
+    )
+    await message.answer(text, parse_mode="HTML")
+
+
 @router.message(ImageEditStates.batch_processing, F.photo)
-async def handle_batch_photo(message: Message, state: FSMContext,
+async def handle_batch_photo(message: Message, state: FSMContext, config: Config,
                              file_manager: FileManager, bot: Bot):
     """Обработка фото в режиме пакетной обработки"""
-    photo = message.photo[-1]
+    file_id, extension = _batch_file(message, config)
     
-    logger.info(f"User {message.from_user.id} added photo to batch, file_id: {photo.file_id[:16]}...")
+    logger.info(f"User {message.from_user.id} added photo to batch, file_id: {file_id[:16]}...")
     
     try:
         # Скачать файл
         file_path = await file_manager.download_file(
             bot=bot,
-            file_id=photo.file_id,
+            file_id=file_id,
             user_id=message.from_user.id,
-            extension="jpg"
+            extension=extension
         )
         
         # Добавить в список пакетных изображений
@@ -1304,20 +1468,10 @@ async def handle_batch_document(message: Message, state: FSMContext, config: Con
     """Обработка документа в режиме пакетной обработки"""
     document = message.document
     
-    # Проверить MIME тип
-    allowed_mimes = ["image/jpeg", "image/png", "image/webp"]
-    if document.mime_type not in allowed_mimes:
-        await message.answer(
-            "❌ Неподдерживаемый формат. Отправьте JPG, PNG или WEBP."
-        )
-        return
-    
-    # Проверить размер
-    max_size_bytes = config.image.max_size_mb * 1024 * 1024
-    if document.file_size and document.file_size > max_size_bytes:
-        await message.answer(
-            f"❌ Файл слишком большой (максимум {config.image.max_size_mb} МБ)"
-        )
+    try:
+        file_id, extension = _batch_file(message, config)
+    except ValueError as e:
+        await message.answer(str(e))
         return
     
     logger.info(
@@ -1326,15 +1480,10 @@ async def handle_batch_document(message: Message, state: FSMContext, config: Con
     )
     
     try:
-        # Определить расширение
-        extension = document.mime_type.split("/")[-1]
-        if extension == "jpeg":
-            extension = "jpg"
-        
         # Скачать файл
         file_path = await file_manager.download_file(
             bot=bot,
-            file_id=document.file_id,
+            file_id=file_id,
             user_id=message.from_user.id,
             extension=extension
         )
@@ -1361,7 +1510,8 @@ async def handle_batch_document(message: Message, state: FSMContext, config: Con
 
 @router.message(Command("done"))
 async def cmd_done(message: Message, state: FSMContext, config: Config,
-                  user_settings_manager: UserSettingsManager, task_queue: TaskQueue):
+                  user_settings_manager: UserSettingsManager, task_queue: TaskQueue,
+                  file_manager: FileManager):
     """Команда /done — завершить пакетную обработку и запустить задачи"""
     current_state = await state.get_state()
     
@@ -1384,8 +1534,17 @@ async def cmd_done(message: Message, state: FSMContext, config: Config,
         f"User {message.from_user.id} starting batch processing of {len(batch_images)} images"
     )
     
+    # Одно сводное сообщение на весь пакет
+    status_message = await message.answer(
+        f"📦 <b>Пакетная обработка</b>\n\n"
+        f"⏳ Постановка {len(batch_images)} задач в очередь...",
+        parse_mode="HTML"
+    )
+    batch = task_queue.batches.create(message.chat.id, status_message.message_id)
+    
     # Создать задачи для каждого изображения
-    tasks_created = []
+    tasks = []
+    invalid = []
     
     for i, image_path in enumerate(batch_images, 1):
         # Создать WorkflowParams
@@ -1404,68 +1563,68 @@ async def cmd_done(message: Message, state: FSMContext, config: Config,
         try:
             workflow_params.validate(config.workflow.limits)
         except ValueError as e:
-            await message.answer(f"❌ Ошибка валидации для фото {i}: {e}")
+            invalid.append(f"{i}: {e}")
+            # Фото не станет задачей — снять его ссылку
+            file_manager.discard_input(Path(image_path))
             continue
         
-        # Создать задачу
-        task = Task(
+        tasks.append(Task(
             user_id=message.from_user.id,
             chat_id=message.chat.id,
-            message_id=message.message_id,  # Временный, будет обновлён
+            message_id=status_message.message_id,
             image_path=Path(image_path),
-            workflow_params=workflow_params
-        )
-        
-        try:
-            # Отправить статусное сообщение для каждой задачи
-            status_message = await message.answer(
-                f"📦 <b>Задача {i}/{len(batch_images)}</b>\n\n"
-                f"🆔 ID: <code>{task.id[:8]}</code>\n"
-                f"📝 Промпт: {default_prompt[:50]}...\n\n"
-                f"⏳ Подготовка...",
-                parse_mode="HTML"
-            )
-            
-            # Обновить task с правильным message_id
-            task.message_id = status_message.message_id
-            
-            # Добавить в очередь
-            position = await task_queue.add_task(task)
-            
-            tasks_created.append((task.id[:8], i, position))
-            
-            # Обновить сообщение с позицией
-            await status_message.edit_text(
-                f"📦 <b>Задача {i}/{len(batch_images)}</b>\n\n"
-                f"🆔 ID: <code>{task.id[:8]}</code>\n"
-                f"📍 Позиция: {position}\n"
-                f"📝 Промпт: {default_prompt[:50]}...\n\n"
-                f"⏳ Ожидайте результат...",
-                parse_mode="HTML"
-            )
-            
-        except Exception as e:
-            logger.error(f"Failed to create batch task {i}: {e}")
-            await message.answer(f"❌ Ошибка при создании задачи {i}: {e}")
+            workflow_params=workflow_params,
+            lane=TaskLane.BULK,
+            batch_id=batch.id
+        ))
     
-    # Очистить состояние
-    await state.clear()
+    try:
+        # Все задачи — за одно обращение к очереди
+        positions, rejection = await task_queue.add_tasks(tasks)
+    except Exception as e:
+        logger.error(f"Failed to enqueue batch: {e}")
+        task_queue.batches.remove(batch.id)
+        await status_message.edit_text(f"❌ Ошибка при постановке пакета: {e}")
+        return
     
-    if tasks_created:
-        # Итоговое сообщение
-        await message.answer(
-            f"✅ <b>Пакетная обработка запущена!</b>\n\n"
-            f"📦 Создано задач: {len(tasks_created)}/{len(batch_images)}\n\n"
-            f"⏳ Все задачи в очереди. Ожидайте результаты!",
-            parse_mode="HTML"
-        )
-        
-        logger.info(
-            f"Batch processing completed for user {message.from_user.id}: "
-            f"{len(tasks_created)} tasks created"
+    admitted = len(positions)
+    
+    sections = []
+    if batch.total:
+        sections.append(batch.render(task_queue.batch_eta(batch.id)))
+    elif admitted:
+        sections.append("🔗 <b>Эти фото уже в очереди</b> — результаты придут в этот чат")
+    if invalid:
+        sections.append("⚠️ Пропущены фото с ошибкой валидации:\n" + "\n".join(invalid))
+    if rejection:
+        not_admitted = [task.workflow_params.input_image for task in tasks[admitted:]]
+        sections.append(
+            f"⚠️ <b>Очередь заполнена</b>: поставлено {admitted}/{len(tasks)}\n"
+            f"🕐 Оставшиеся {len(not_admitted)} фото сохранены — "
+            f"отправьте /done через {format_eta(rejection.retry_after)}"
         )
+    
+    if batch.total == 0:
+        # Ничего не поставлено в очередь (или все фото оказались дубликатами)
+        task_queue.batches.remove(batch.id)
+    
+    if admitted == 0 and not rejection:
+        await status_message.edit_text("❌ Не удалось создать ни одной задачи.")
+        await state.clear()
+        return
+    
+    batch.last_text = "\n\n".join(sections)
+    await status_message.edit_text(batch.last_text, parse_mode="HTML")
+    
+    if rejection:
+        await state.update_data(batch_images=not_admitted)
     else:
-        await message.answer("❌ Не удалось создать ни одной задачи.")
+        await state.clear()
+    
+    logger.info(
+        f"Batch {batch.id[:8]} of user {message.from_user.id}: "
+        f"{admitted}/{len(batch_images)} tasks enqueued"
+    )
 
 
 # =============================================================================
@@ -1498,7 +1657,8 @@ async def _show_confirmation(message: Message, data: dict, config: Config, edit:
         await message.answer(text, parse_mode="HTML", reply_markup=create_confirm_keyboard())
 
 
-async def _auto_start_task(message: Message, state: FSMContext, config: Config, task_queue: TaskQueue):
+async def _auto_start_task(message: Message, state: FSMContext, config: Config, task_queue: TaskQueue,
+                           task_processor: "TaskProcessor", file_manager: FileManager):
     """
     Автоматический запуск задачи без подтверждения
     
@@ -1507,6 +1667,8 @@ async def _auto_start_task(message: Message, state: FSMContext, config: Config,
         state: FSM контекст
         config: Конфигурация
         task_queue: Очередь задач
+        task_processor: Обработчик задач (уведомления о заменённых задачах)
+        file_manager: Менеджер файлов (фото, не ставшее задачей, освобождается)
     """
     data = await state.get_data()
     
@@ -1527,7 +1689,7 @@ async def _auto_start_task(message: Message, state: FSMContext, config: Config,
         workflow_params.validate(config.workflow.limits)
     except ValueError as e:
         await message.answer(f"❌ Ошибка валидации: {e}")
-        await state.clear()
+        await _discard_state(state, file_manager)
         return
     
     # Создать задачу
@@ -1536,8 +1698,10 @@ async def _auto_start_task(message: Message, state: FSMContext, config: Config,
         chat_id=message.chat.id,
         message_id=message.message_id,
         image_path=Path(data['image_path']),
-        workflow_params=workflow_params
+        workflow_params=workflow_params,
+        lane=TaskLane.INTERACTIVE
     )
+    admitted = False
     
     try:
         # Отправить сообщение о запуске и сохранить его message_id для прогресса
@@ -1553,7 +1717,12 @@ async def _auto_start_task(message: Message, state: FSMContext, config: Config,
         # Обновить task с правильным message_id для отображения прогресса
         task.message_id = status_message.message_id
         
-        position = await task_queue.add_task(task)
+        if config.queue.supersede:
+            position, superseded = await task_queue.replace_pending(task)
+            await _notify_superseded(task_processor, superseded)
+        else:
+            position = await task_queue.add_task(task)
+        admitted = True  # Ссылка на входное фото теперь у задачи
         
         logger.info(
             f"Task {task.id[:8]} auto-started by user {message.from_user.id}, "
@@ -1563,18 +1732,107 @@ async def _auto_start_task(message: Message, state: FSMContext, config: Config,
         # Очистить состояние
         await state.clear()
         
+        if task.duplicate_of:
+            await status_message.edit_text(_duplicate_text(task, position), parse_mode="HTML")
+            return
+        
         # Обновить сообщение с позицией в очереди
         await status_message.edit_text(
             f"⚡ <b>Задача запущена автоматически</b>\n\n"
             f"🆔 ID: <code>{task.id[:8]}</code>\n"
             f"📍 Позиция: {position}\n"
+            f"⏱ Начало: {format_eta(task_queue.get_eta(task.id))}\n"
             f"📝 Промпт: {data['positive_prompt'][:50]}...\n\n"
             f"⏳ Ожидайте результат...\n\n"
             f"💡 <i>Автозапуск можно отключить в /settings</i>",
             parse_mode="HTML"
         )
         
+    except AdmissionRejected as e:
+        await status_message.edit_text(_rejection_text(e), parse_mode="HTML")
+        await _discard_state(state, file_manager)
+        
     except Exception as e:
         logger.error(f"Failed to auto-start task: {e}")
         await message.answer(f"❌ Ошибка при запуске задачи: {e}")
-        await state.clear()
+        if admitted:
+            await state.clear()
+        else:
+            await _discard_state(state, file_manager)
+
+
+async def _discard_state(state: FSMContext, file_manager: FileManager):
+    """
+    Сбросить FSM состояние, сняв ссылки на скачанные фото, которые не стали задачами
+    
+    Входные фото хранятся со счётчиком ссылок (FileManager.acquire): без
+    этого фото из отменённого диалога или пакета остаются закреплёнными
+    и не вытесняются по квоте. Ссылки диалогов, брошенных без сброса,
+    истекают при периодической очистке (FileManager.cleanup_old_files).
+    
+    Args:
+        state: FSM контекст
+        file_manager: Менеджер файлов
+    """
+    data = await state.get_data()
+    paths = list(data.get('batch_images', []))
+    if data.get('image_path'):
+        paths.append(data['image_path'])
+    for path in paths:
+        file_manager.discard_input(Path(path))
+    await state.clear()
+
+
+def _duplicate_text(task: Task, position: int) -> str:
+    """
+    Текст для задачи, присоединённой к уже существующей такой же
+    
+    Args:
+        task: Задача-дубликат (task.duplicate_of заполнен)
+        position: Позиция исходной задачи (0 — уже выполняется)
+        
+    Returns:
+        HTML-текст сообщения
+    """
+    position_text = f"📍 Позиция: {position}" if position else "🔄 Уже обрабатывается"
+    return (
+        f"🔗 <b>Такая задача уже в очереди</b>\n\n"
+        f"🆔 ID: <code>{task.duplicate_of[:8]}</code>\n"
+        f"{position_text}\n\n"
+        f"⏳ Результат придёт и в этот чат"
+    )
+
+
+def _rejection_text(rejection: AdmissionRejected) -> str:
+    """
+    Текст отказа в постановке задачи
+    
+    Args:
+        rejection: Исключение с причиной и временем повтора
+        
+    Returns:
+        HTML-текст сообщения
+    """
+    if rejection.reason == AdmissionRejected.USER_QUOTA:
+        reason_text = "У вас уже слишком много задач в очереди."
+    else:
+        reason_text = "Очередь сейчас заполнена."
+    return (
+        f"⚠️ <b>Задача не принята</b>\n\n"
+        f"{reason_text}\n"
+        f"🕐 Попробуйте снова через {format_eta(rejection.retry_after)}"
+    )
+
+
+async def _notify_superseded(task_processor: "TaskProcessor", superseded: List[Task]):
+    """
+    Сообщить, что ожидающие одиночные задачи пользователя заменены новой
+    
+    Args:
+        task_processor: Обработчик задач (уведомляет и присоединённые дубликаты)
+        superseded: Задачи, отменённые TaskQueue.replace_pending
+    """
+    for task in superseded:
+        await task_processor.report_cancelled(
+            task, f"🔁 <b>Задача заменена новой</b>\n\n🆔 ID: <code>{task.id[:8]}</code>"
+        )
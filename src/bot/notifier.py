@@ -0,0 +1,124 @@
+"""Отправка обновлений статуса задач в Telegram без блокировки обработки"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from loguru import logger
+
+
+class ProgressNotifier:
+    """
+    Коалесцирующий отправитель правок статусных сообщений
+
+    update() не ждёт Telegram: текст кладётся в почтовый ящик сообщения
+    (хранится только последнее значение), а фоновый воркер чата
+    отправляет правки не чаще раза в min_interval секунд. Правки с тем же
+    текстом, что уже показан, пропускаются. На TelegramRetryAfter воркер
+    чата выжидает указанное время и отправляет актуальный текст.
+    """
+
+    SENT_CACHE_SIZE = 1000
+
+    def __init__(self, bot: Bot, min_interval: float = 1.5):
+        """
+        Args:
+            bot: Telegram bot instance
+            min_interval: Минимальный интервал между правками в одном чате (из config.queue.progress_interval_seconds)
+        """
+        self.bot = bot
+        self.min_interval = min_interval
+
+        # chat_id -> message_id -> (текст, parse_mode); только последнее значение
+        self._pending: Dict[int, Dict[int, Tuple[str, Optional[str]]]] = {}
+        # Последний показанный текст сообщения (LRU)
+        self._sent: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+        # Момент (loop.time()), раньше которого в чат нельзя отправлять (после retry_after)
+        self._next_at: Dict[int, float] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    def update(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str] = None):
+        """
+        Запланировать правку сообщения (возвращается сразу)
+
+        Args:
+            chat_id: ID чата
+            message_id: ID сообщения
+            text: Новый текст
+            parse_mode: Режим разметки (None — по умолчанию бота)
+        """
+        mailbox = self._pending.get(chat_id)
+        if self._sent.get((chat_id, message_id)) == text and not (mailbox and message_id in mailbox):
+            return
+
+        self._pending.setdefault(chat_id, {})[message_id] = (text, parse_mode)
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run(chat_id))
+
+    async def _run(self, chat_id: int):
+        """Воркер чата: отправляет накопленные правки с соблюдением интервала"""
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending.get(chat_id):
+                delay = self._next_at.pop(chat_id, 0.0) - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                mailbox = self._pending.get(chat_id)
+                if not mailbox:
+                    break
+                message_id = next(iter(mailbox))
+                text, parse_mode = mailbox.pop(message_id)
+                if not mailbox:
+                    del self._pending[chat_id]
+
+                if self._sent.get((chat_id, message_id)) == text:
+                    continue
+
+                await self._edit(chat_id, message_id, text, parse_mode)
+
+                # Воркер живёт весь интервал, поэтому следующая правка не уйдёт раньше
+                await asyncio.sleep(self.min_interval)
+        finally:
+            self._workers.pop(chat_id, None)
+
+    async def _edit(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str]):
+        """Одна правка сообщения с обработкой ошибок Telegram"""
+        kwargs = {"parse_mode": parse_mode} if parse_mode else {}
+        try:
+            await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
+            self._remember(chat_id, message_id, text)
+
+        except TelegramRetryAfter as e:
+            logger.warning(f"Telegram flood control for chat {chat_id}: retry after {e.retry_after}s")
+            self._next_at[chat_id] = asyncio.get_running_loop().time() + e.retry_after
+            # Вернуть текст в ящик, если за это время не пришёл более новый
+            self._pending.setdefault(chat_id, {}).setdefault(message_id, (text, parse_mode))
+
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                self._remember(chat_id, message_id, text)
+            else:
+                logger.debug(f"Failed to edit message {message_id} in chat {chat_id}: {e}")
+
+        except Exception as e:
+            logger.debug(f"Failed to edit message {message_id} in chat {chat_id}: {e}")
+
+    def _remember(self, chat_id: int, message_id: int, text: str):
+        """Запомнить показанный текст сообщения"""
+        key = (chat_id, message_id)
+        self._sent[key] = text
+        self._sent.move_to_end(key)
+        while len(self._sent) > self.SENT_CACHE_SIZE:
+            self._sent.popitem(last=False)
+
+    async def close(self):
+        """Остановить воркеры (неотправленные правки отбрасываются)"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._pending.clear()
+        logger.info("Progress notifier stopped")
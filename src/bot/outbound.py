@@ -0,0 +1,254 @@
+"""Глобальный планировщик исходящих запросов к Telegram Bot API"""
+
+import asyncio
+import bisect
+import itertools
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageText,
+    SendDocument,
+    SendMediaGroup,
+    SendPhoto,
+)
+from aiogram.methods.base import Response, TelegramMethod, TelegramType
+from loguru import logger
+
+from src.models.config import TelegramConfig
+
+
+# Приоритеты (меньше = важнее): результаты, затем сообщения, затем правки прогресса
+PRIORITY_RESULT = 0
+PRIORITY_MESSAGE = 1
+PRIORITY_EDIT = 2
+
+RESULT_METHODS = (SendPhoto, SendDocument, SendMediaGroup)
+EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageMedia)
+
+
+class OutboundWait:
+    """
+    Время, которое запросы провели в очереди планировщика (лимиты и паузы после 429)
+
+    Передаётся через outbound_wait: TaskProcessor исключает это время из
+    дедлайна доставки, иначе результат под нагрузкой flood control
+    считался бы недоставленным, хотя Telegram просто просил подождать.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._since: Optional[float] = None
+
+    def begin(self, now: float):
+        """Запрос встал в очередь планировщика"""
+        self._since = now
+
+    def end(self, now: float):
+        """Запрос получил разрешение (или отменён)"""
+        if self._since is not None:
+            self.seconds += now - self._since
+            self._since = None
+
+    def total(self, now: float) -> float:
+        """Время ожидания, включая текущее"""
+        if self._since is None:
+            return self.seconds
+        return self.seconds + now - self._since
+
+
+# Учёт ожидания запросов текущего контекста (None — не учитывается)
+outbound_wait: ContextVar[Optional[OutboundWait]] = ContextVar("outbound_wait", default=None)
+
+
+class TokenBucket:
+    """Маркерная корзина: rate маркеров в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Скорость пополнения (маркеров в секунду)
+            capacity: Максимальный запас маркеров (размер всплеска)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at: Optional[float] = None
+
+    def _refill(self, now: float):
+        if self.updated_at is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен маркер (0 — доступен сейчас)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        """Забрать маркер (вызывать только если wait_time() == 0)"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        """Корзина полностью пополнена (её можно забыть)"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Единая точка выдачи исходящих запросов Bot API
+
+    Подключается как request middleware сессии бота, поэтому охватывает
+    все отправки, правки и загрузки фото — из хендлеров, процессора и
+    уведомлений. Запросы, адресованные чату, проходят через глобальную
+    корзину (~30 сообщений/с) и корзину чата (~1/с в личке, 20/мин в
+    группах). Доставка результатов обслуживается раньше сообщений, а те —
+    раньше правок прогресса. На TelegramRetryAfter чат ставится на паузу
+    на указанное время, и запрос повторяется.
+    """
+
+    def __init__(self, config: Optional[TelegramConfig] = None):
+        """
+        Args:
+            config: Лимиты исходящих запросов (из config.telegram)
+        """
+        self.config = config or TelegramConfig()
+        self._global = TokenBucket(self.config.global_rate, self.config.global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._paused_until: Dict[int, float] = {}
+
+        # Ожидающие запросы: (priority, seq, chat_id, future), отсортированы
+        self._waiting: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def priority(method: TelegramMethod) -> int:
+        """Приоритет запроса по типу метода"""
+        if isinstance(method, RESULT_METHODS):
+            return PRIORITY_RESULT
+        if isinstance(method, EDIT_METHODS):
+            return PRIORITY_EDIT
+        return PRIORITY_MESSAGE
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                rate = self.config.group_rate_per_minute / 60.0
+            else:
+                rate = self.config.chat_rate
+            bucket = TokenBucket(rate, self.config.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int):
+            # Служебные запросы (getUpdates, getFile, answerCallbackQuery...) и @username не ограничиваем
+            return await make_request(bot, method)
+
+        priority = self.priority(method)
+        for attempt in range(self.config.max_retries + 1):
+            await self._acquire(priority, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.config.max_retries:
+                    raise
+                self._pause(chat_id, e.retry_after)
+                logger.warning(
+                    f"Telegram flood control on {type(method).__name__} for chat {chat_id}: "
+                    f"retry after {e.retry_after}s (attempt {attempt + 1})"
+                )
+
+    def _pause(self, chat_id: int, retry_after: float):
+        """Поставить чат на паузу после 429"""
+        until = asyncio.get_running_loop().time() + retry_after
+        self._paused_until[chat_id] = max(self._paused_until.get(chat_id, 0.0), until)
+
+    async def _acquire(self, priority: int, chat_id: int):
+        """Дождаться разрешения на запрос"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        bisect.insort(self._waiting, (priority, next(self._seq), chat_id, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        wait = outbound_wait.get()
+        if wait is not None:
+            wait.begin(loop.time())
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Вызывающий отменён — убрать из очереди, если разрешение ещё не выдано
+            self._waiting = [w for w in self._waiting if w[3] is not future]
+            raise
+        finally:
+            if wait is not None:
+                wait.end(loop.time())
+
+    def _chat_wait(self, chat_id: int, now: float) -> float:
+        """Сколько ещё ждать чату (пауза после 429 и корзина чата)"""
+        paused = self._paused_until.get(chat_id, 0.0) - now
+        return max(paused, self._chat_bucket(chat_id).wait_time(now))
+
+    async def _dispatch(self):
+        """Выдаёт разрешения ожидающим запросам в порядке приоритета"""
+        loop = asyncio.get_running_loop()
+        while self._waiting:
+            now = loop.time()
+            self._gc(now)
+
+            global_wait = self._global.wait_time(now)
+            sleep_for: Optional[float] = global_wait if global_wait > 0 else None
+
+            if global_wait == 0:
+                # Самый приоритетный запрос, чей чат сейчас не ограничен
+                for index, (_, _, chat_id, future) in enumerate(self._waiting):
+                    if future.done():
+                        continue
+                    chat_wait = self._chat_wait(chat_id, now)
+                    if chat_wait > 0:
+                        sleep_for = chat_wait if sleep_for is None else min(sleep_for, chat_wait)
+                        continue
+                    del self._waiting[index]
+                    self._global.take(now)
+                    self._chat_bucket(chat_id).take(now)
+                    future.set_result(None)
+                    sleep_for = 0.0
+                    break
+
+            self._waiting = [w for w in self._waiting if not w[3].done()]
+            if sleep_for == 0.0:
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    def _gc(self, now: float):
+        """Удалить корзины простаивающих чатов и истёкшие паузы"""
+        if len(self._chats) > 1000:
+            waiting_chats = {w[2] for w in self._waiting}
+            for chat_id in [c for c, b in self._chats.items() if c not in waiting_chats and b.full(now)]:
+                del self._chats[chat_id]
+        for key in [k for k, until in self._paused_until.items() if until <= now]:
+            del self._paused_until[key]
@@ -0,0 +1,127 @@
+"""Приём обновлений Telegram через webhook (альтернатива long polling)"""
+
+import asyncio
+import hmac
+import secrets
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from loguru import logger
+
+from src.models.config import WebhookConfig
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Встроенный aiohttp сервер для webhook
+
+    Запрос от Telegram проверяется по secret token, обновление кладётся в
+    ограниченную очередь, и сервер сразу отвечает 200 — обработка идёт в
+    пуле из workers задач. Если очередь переполнена, отвечаем 503, и
+    Telegram повторит доставку позже.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, config: Optional[WebhookConfig] = None):
+        """
+        Args:
+            dispatcher: Dispatcher с роутерами и зависимостями
+            bot: Telegram bot instance
+            config: Настройки webhook (из config.telegram.webhook)
+        """
+        self.dp = dispatcher
+        self.bot = bot
+        self.config = config or WebhookConfig()
+        # Пустой secret в конфиге — генерируем на каждый запуск (webhook всё равно переустанавливается)
+        self.secret_token = self.config.secret_token or secrets.token_urlsafe(32)
+
+        self.updates: asyncio.Queue = asyncio.Queue(maxsize=self.config.queue_size)
+        self.app = web.Application()
+        self.app.router.add_post(self.config.path, self.handle)
+
+        self._workers: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Обработчик POST запроса от Telegram"""
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret_token):
+            logger.warning(f"Webhook request with invalid secret token from {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+
+        try:
+            self.updates.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning(f"Webhook queue is full ({self.config.queue_size}), update {update.update_id} deferred")
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def _worker(self, index: int):
+        """Обработка обновлений из очереди"""
+        while True:
+            update = await self.updates.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception(f"Webhook worker {index} failed on update {update.update_id}: {e}")
+            finally:
+                self.updates.task_done()
+
+    def start_workers(self):
+        """Запустить пул обработчиков (без HTTP сервера — например, для тестов)"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.config.workers)]
+
+    async def start(self):
+        """Запустить сервер, пул обработчиков и зарегистрировать webhook в Telegram"""
+        self.start_workers()
+
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.config.host, self.config.port).start()
+        logger.info(f"Webhook server listening on {self.config.host}:{self.config.port}{self.config.path}")
+
+        if self.config.url:
+            await self.bot.set_webhook(
+                url=self.config.url.rstrip("/") + self.config.path,
+                secret_token=self.secret_token,
+                allowed_updates=self.dp.resolve_used_update_types(),
+                max_connections=self.config.max_connections
+            )
+            logger.info(f"Webhook registered: {self.config.url}")
+        else:
+            logger.warning("telegram.webhook.url is not set, webhook is not registered in Telegram")
+
+    async def stop(self, drain_timeout: float = 10):
+        """
+        Остановить приём, дождаться обработки принятых обновлений и остановить пул
+
+        Args:
+            drain_timeout: Сколько ждать обработки уже принятых обновлений (сек)
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self._workers:
+            try:
+                await asyncio.wait_for(self.updates.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Webhook stopped with {self.updates.qsize()} unprocessed updates")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Webhook server stopped")
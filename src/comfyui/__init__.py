@@ -5,9 +5,11 @@ ComfyUI package - Клиент и workflow менеджер для работы
 from src.comfyui.client import ComfyUIClient
 from src.comfyui.workflow import WorkflowManager
 from src.comfyui.websocket import track_progress
+from src.comfyui.artifacts import ComfyUIArtifacts
 
 __all__ = [
     "ComfyUIClient",
     "WorkflowManager",
     "track_progress",
+    "ComfyUIArtifacts",
 ]
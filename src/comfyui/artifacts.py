@@ -0,0 +1,153 @@
+"""Учёт и удаление файлов, которые бот создаёт на стороне ComfyUI"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+# (тип директории ComfyUI: "input" / "output", подпапка, имя файла)
+Artifact = Tuple[str, str, str]
+
+
+class ComfyUIArtifacts:
+    """
+    Реестр загруженных входных фото и результатов в директориях ComfyUI
+
+    ComfyUI не умеет удалять файлы через API, поэтому:
+    - если ComfyUI запущен на этой машине (известен comfyui.dir), файлы
+      задачи удаляются сразу после её завершения;
+    - иначе они копятся в очереди на удаление, которую периодически
+      получает внешний cleanup_hook (команда оболочки; относительные пути
+      вида "input/telegram_bot/<task>.png" передаются в stdin построчно).
+    """
+
+    def __init__(self, comfyui_dir: Optional[Path] = None, cleanup_hook: str = ""):
+        """
+        Args:
+            comfyui_dir: Директория локального ComfyUI (из config.comfyui.dir, None — ComfyUI удалённый)
+            cleanup_hook: Команда удаления файлов на удалённом ComfyUI (из config.comfyui.cleanup_hook)
+        """
+        self.comfyui_dir = comfyui_dir
+        self.cleanup_hook = cleanup_hook
+        self._by_task: Dict[str, List[Artifact]] = {}
+        self._pending: List[Artifact] = []
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_local(self) -> bool:
+        """Файлы ComfyUI доступны на этой машине"""
+        return self.comfyui_dir is not None
+
+    def record(self, task_id: str, kind: str, filename: str, subfolder: str = ""):
+        """
+        Запомнить файл, созданный для задачи
+
+        Args:
+            task_id: ID задачи
+            kind: "input" (загруженное фото) или "output" (результат)
+            filename: Имя файла в ComfyUI
+            subfolder: Подпапка
+        """
+        self._by_task.setdefault(task_id, []).append((kind, subfolder, filename))
+
+    async def release(self, task_id: str):
+        """
+        Файлы задачи больше не нужны: удалить (локально) или поставить в очередь на удаление
+
+        Args:
+            task_id: ID задачи
+        """
+        artifacts = self._by_task.pop(task_id, [])
+        if not artifacts:
+            return
+
+        if self.is_local:
+            await asyncio.to_thread(self._unlink_local, artifacts)
+        elif self.cleanup_hook:
+            self._pending.extend(artifacts)
+
+    def _unlink_local(self, artifacts: List[Artifact]):
+        """Удалить файлы из директорий локального ComfyUI (выполняется в потоке)"""
+        for artifact in artifacts:
+            path = self.comfyui_dir / self.relative_path(artifact)
+            try:
+                os.unlink(path)
+                logger.debug(f"Removed ComfyUI file: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to remove ComfyUI file {path}: {e}")
+
+    @staticmethod
+    def relative_path(artifact: Artifact) -> Path:
+        """Путь файла относительно директории ComfyUI"""
+        kind, subfolder, filename = artifact
+        return Path(kind) / subfolder / filename
+
+    async def run_cleanup_hook(self) -> int:
+        """
+        Передать накопленные файлы внешней команде удаления
+
+        Returns:
+            Количество переданных файлов (0 если нечего удалять или команда завершилась ошибкой)
+        """
+        if not self._pending or not self.cleanup_hook:
+            return 0
+
+        artifacts, self._pending = self._pending, []
+        listing = "\n".join(str(self.relative_path(artifact)) for artifact in artifacts) + "\n"
+
+        process = await asyncio.create_subprocess_shell(
+            self.cleanup_hook,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate(listing.encode())
+
+        if process.returncode != 0:
+            # Вернуть в очередь — попробуем в следующий раз
+            self._pending = artifacts + self._pending
+            logger.warning(f"ComfyUI cleanup hook failed ({process.returncode}): {stderr.decode().strip()}")
+            return 0
+
+        logger.info(f"ComfyUI cleanup hook removed {len(artifacts)} files")
+        return len(artifacts)
+
+    def start_cleanup_task(self, interval_minutes: float = 60):
+        """
+        Периодический запуск cleanup_hook (для удалённого ComfyUI)
+
+        Args:
+            interval_minutes: Интервал запуска (из config.comfyui.cleanup_interval_minutes)
+        """
+        if self.is_local or not self.cleanup_hook:
+            return
+
+        async def cleanup_loop():
+            while True:
+                await asyncio.sleep(interval_minutes * 60)
+                try:
+                    await self.run_cleanup_hook()
+                except Exception as e:
+                    logger.error(f"ComfyUI cleanup hook error: {e}")
+
+        self._cleanup_task = asyncio.create_task(cleanup_loop())
+        logger.info(f"ComfyUI cleanup hook scheduled every {interval_minutes} min")
+
+    async def stop(self):
+        """Остановить периодическую очистку и отдать хуку оставшиеся файлы"""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+        try:
+            await self.run_cleanup_hook()
+        except Exception as e:
+            logger.error(f"ComfyUI cleanup hook error: {e}")
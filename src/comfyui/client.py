@@ -103,13 +103,18 @@ class ComfyUIClient:
         logger.error(f"❌ ComfyUI failed to become ready after {max_attempts} attempts")
         return False
     
-    async def upload_image(self, image_path: Path, subfolder: str = "") -> Dict:
+    async def upload_image(self, image_path: Path, subfolder: str = "",
+                           image_data: Optional[bytes] = None,
+                           filename: Optional[str] = None, overwrite: bool = False) -> Dict:
         """
         Загрузка изображения на ComfyUI сервер
         
         Args:
-            image_path: Путь к изображению
+            image_path: Путь к изображению (при image_data — только имя файла)
             subfolder: Подпапка для сохранения (опционально)
+            image_data: Содержимое изображения, уже находящееся в памяти (опционально)
+            filename: Имя файла в ComfyUI (по умолчанию — имя image_path)
+            overwrite: Перезаписать файл с тем же именем вместо создания "name (1).png"
             
         Returns:
             {"name": "uploaded_filename.png", "subfolder": "", "type": "input"}
@@ -117,7 +122,7 @@ class ComfyUIClient:
         Raises:
             aiohttp.ClientError: Ошибка при загрузке
         """
-        if not image_path.exists():
+        if image_data is None and not image_path.exists():
             raise FileNotFoundError(f"Image not found: {image_path}")
         
         logger.info(f"Uploading image: {image_path.name}")
@@ -125,17 +130,22 @@ class ComfyUIClient:
         # Multipart form data
         data = aiohttp.FormData()
         
-        # Открываем файл с контекстным менеджером для предотвращения утечки дескрипторов
-        with open(image_path, 'rb') as image_file:
-            image_content = image_file.read()
+        if image_data is not None:
+            image_content = image_data
+        else:
+            # Открываем файл с контекстным менеджером для предотвращения утечки дескрипторов
+            with open(image_path, 'rb') as image_file:
+                image_content = image_file.read()
         
         data.add_field('image',
                       image_content,
-                      filename=image_path.name,
+                      filename=filename or image_path.name,
                       content_type='image/jpeg')
         
         if subfolder:
             data.add_field('subfolder', subfolder)
+        if overwrite:
+            data.add_field('overwrite', 'true')
         
         try:
             async with self.session.post(
@@ -199,6 +209,48 @@ class ComfyUIClient:
             logger.error(f"Failed to queue prompt: {e}")
             raise
     
+    async def cancel_prompt(self, prompt_id: str) -> None:
+        """
+        Снять задачу с выполнения: убрать из очереди ComfyUI или прервать, если уже выполняется
+        
+        Args:
+            prompt_id: ID задачи
+            
+        Raises:
+            aiohttp.ClientError: Ошибка запроса к ComfyUI
+        """
+        try:
+            async with self.session.post(
+                f"{self.base_url}/queue",
+                json={"delete": [prompt_id]},
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                response.raise_for_status()
+            
+            async with self.session.get(
+                f"{self.base_url}/queue",
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                response.raise_for_status()
+                queue = await response.json()
+            
+            # Элемент queue_running: [номер, prompt_id, workflow, extra_data, outputs]
+            running = [item[1] for item in queue.get("queue_running", []) if len(item) > 1]
+            if prompt_id in running:
+                # /interrupt без prompt_id прерывает текущую задачу — она и есть наша
+                async with self.session.post(
+                    f"{self.base_url}/interrupt",
+                    json={"prompt_id": prompt_id},
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as response:
+                    response.raise_for_status()
+                logger.info(f"Interrupted running prompt: {prompt_id}")
+            else:
+                logger.info(f"Removed prompt from ComfyUI queue: {prompt_id}")
+        except aiohttp.ClientError as e:
+            logger.error(f"Failed to cancel prompt {prompt_id}: {e}")
+            raise
+    
     async def get_history(self, prompt_id: str) -> Dict:
         """
         Получение истории выполнения задачи
@@ -97,6 +97,7 @@ class WorkflowManager:
         - Node 77 (TextEncodeQwenImageEdit): negative prompt
         - Node 117 (PrimitiveInt): seed
         - Node 115 (INTConstant): steps
+        - Node 93 (ImageScaleToTotalPixels): megapixels (если задано)
         - Node 121 (ClownsharKSampler_Beta): cfg, sampler, scheduler, eta, denoise
         
         Args:
@@ -118,6 +119,8 @@ class WorkflowManager:
         self._set_prompts(workflow, params.positive_prompt, params.negative_prompt)
         self._set_seed(workflow, params.seed)
         self._set_steps(workflow, params.steps)
+        if params.megapixels is not None:
+            self._set_megapixels(workflow, params.megapixels)
         self._set_sampling_params(workflow, params)
         
         # Формируем extra_pnginfo с UI workflow (если есть)
@@ -220,6 +223,21 @@ class WorkflowManager:
                 workflow["121"]["inputs"]["steps"] = steps
                 logger.debug(f"Set steps (Node 121): {steps}")
     
+    def _set_megapixels(self, workflow: Dict, megapixels: float) -> None:
+        """
+        Установка целевого разрешения (Node 93 - ImageScaleToTotalPixels)
+        
+        Args:
+            workflow: Workflow dict для модификации
+            megapixels: Целевое количество мегапикселей
+        """
+        if "93" not in workflow:
+            logger.warning("Node 93 (ImageScaleToTotalPixels) not found")
+            return
+        
+        workflow["93"]["inputs"]["megapixels"] = megapixels
+        logger.debug(f"Set megapixels (Node 93): {megapixels}")
+    
     def _set_sampling_params(self, workflow: Dict, params: WorkflowParams) -> None:
         """
         Установка параметров сэмплинга (Node 121 - ClownsharKSampler_Beta)
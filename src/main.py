@@ -11,6 +11,8 @@ from loguru import logger
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommand
 
@@ -21,9 +23,17 @@ from src.bot.filters import WhitelistFilter, RateLimitFilter
 from src.comfyui.client import ComfyUIClient
 from src.comfyui.launcher import ComfyUILauncher
 from src.comfyui.workflow import WorkflowManager
+from src.comfyui.artifacts import ComfyUIArtifacts
 from src.queue.task_queue import TaskQueue
 from src.queue.processor import TaskProcessor
+from src.queue.task_store import TaskStore
+from src.queue.degradation import DegradationPolicy
+from src.bot.notifier import ProgressNotifier
+from src.bot.outbound import OutboundScheduler
+from src.bot.webhook import WebhookServer
+from src.bot.album import AlbumCollector
 from src.storage.file_manager import FileManager
+from src.storage.file_id_cache import FileIdCache
 from src.storage.user_settings import UserSettingsManager
 
 
@@ -39,6 +49,11 @@ class Application:
         self.comfyui_launcher = None
         self.workflow_manager = None
         self.task_queue = None
+        self.task_store = None
+        self.restored_tasks = []
+        self.notifier = None
+        self.webhook_server = None
+        self.comfyui_artifacts = None
         self.task_processor = None
         self.file_manager = None
         self.user_settings_manager = None
@@ -58,8 +73,16 @@ class Application:
         
         # 3. Инициализация Telegram бота
         logger.info("Initializing Telegram bot...")
+        api = PRODUCTION
+        if self.config.telegram.api_server:
+            api = TelegramAPIServer.from_base(self.config.telegram.api_server, is_local=self.config.telegram.api_local)
+            logger.info(f"Using Bot API server: {self.config.telegram.api_server} (local: {self.config.telegram.api_local})")
+        session = AiohttpSession(api=api, limit=self.config.telegram.connection_limit)
+        # Все исходящие запросы проходят через общий планировщик лимитов Telegram
+        session.middleware(OutboundScheduler(self.config.telegram))
         self.bot = Bot(
             token=self.config.telegram_bot_token,
+            session=session,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
         
@@ -149,25 +172,98 @@ class Application:
         self.workflow_manager = WorkflowManager(workflow_path, ui_workflow_path)
         logger.info(f"Workflow loaded: {workflow_path}")
         
-        # 8. Task queue
-        self.task_queue = TaskQueue(max_size=self.config.queue.max_size)
-        logger.info(f"Task queue initialized (max_size: {self.config.queue.max_size})")
+        # 8. File manager (нужен очереди для чтения входных фото из памяти)
+        self.file_manager = FileManager(
+            self.config.data_dir,
+            in_memory_inputs=self.config.storage.in_memory_inputs,
+            spool_max_mb=self.config.storage.spool_max_mb,
+            # Восстановленной после рестарта задаче нужна копия входного фото на диске
+            retain_inputs=self.config.storage.retain_inputs or self.config.queue.persistent,
+            max_concurrent_downloads=self.config.storage.max_concurrent_downloads,
+            local_api=bool(self.config.telegram.api_server) and self.config.telegram.api_local,
+            quotas_mb=self.config.storage.quota_mb.model_dump(),
+            keep_results=self.config.storage.keep_results
+        )
+        await self.file_manager.build_index()
+        logger.info(f"File manager initialized (in_memory_inputs: {self.config.storage.in_memory_inputs})")
+        
+        # 9. Task queue
+        if self.config.queue.persistent:
+            self.task_store = TaskStore(self.config.data_dir / "tasks.db")
+            purged = self.task_store.purge_finished(self.config.storage.cleanup_after_hours)
+            if purged:
+                logger.info(f"Purged {purged} finished tasks from store")
+        
+        self.task_queue = TaskQueue(
+            max_size=self.config.queue.max_size,
+            scheduling=self.config.queue.scheduling,
+            bulk_min_share=self.config.queue.bulk_min_share,
+            store=self.task_store,
+            history_size=self.config.queue.history_size,
+            max_pending_per_user=self.config.queue.max_pending_per_user,
+            dedupe_window_seconds=self.config.queue.dedupe_window_seconds,
+            batch_status_interval=self.config.queue.batch_status_interval_seconds,
+            input_opener=self.file_manager.open_input
+        )
+        # Файлы задачи удаляются, как только она завершена (периодическая очистка — для остатков)
+        self.task_queue.add_release_hook(self.file_manager.release_task)
+        logger.info(
+            f"Task queue initialized (max_size: {self.config.queue.max_size}, "
+            f"scheduling: {self.config.queue.scheduling}, persistent: {self.config.queue.persistent})"
+        )
         
-        # 9. File manager
-        self.file_manager = FileManager(self.config.data_dir)
-        logger.info("File manager initialized")
+        # 9.1. Восстановление задач после рестарта
+        # Входные фото хранятся по содержимому: ссылки восстановленных задач учитываются до удаления отброшенных
+        self.restored_tasks = await self.task_queue.restore(
+            max_attempts=self.config.queue.max_attempts,
+            on_restore=lambda task: self.file_manager.acquire(task.image_path)
+        )
+        # Квоты — только после того, как входы восстановленных задач закреплены
+        await self.file_manager.enforce_quotas()
         
-        # 9.1. User settings manager
-        self.user_settings_manager = UserSettingsManager(self.config.data_dir)
+        # 9.2. User settings manager
+        self.user_settings_manager = UserSettingsManager(
+            self.config.data_dir,
+            flush_delay=self.config.storage.settings_flush_seconds
+        )
         logger.info("User settings manager initialized")
         
         # 10. Task processor
+        degradation = None
+        if self.config.queue.degradation.enabled:
+            degradation = DegradationPolicy(
+                self.config.queue.degradation,
+                self.config.workflow.limits,
+                base_megapixels=self.config.image.scale_megapixels
+            )
+            logger.info(f"Degradation policy enabled ({len(self.config.queue.degradation.levels)} levels)")
+        
+        self.notifier = ProgressNotifier(self.bot, self.config.queue.progress_interval_seconds)
+        
+        # Файлы бота в директориях ComfyUI: локальный ComfyUI чистится сразу, удалённый — через cleanup_hook
+        comfyui_config = self.config.comfyui
+        comfyui_is_local = comfyui_config.host in ("127.0.0.1", "localhost") and comfyui_config.dir is not None
+        self.comfyui_artifacts = ComfyUIArtifacts(
+            comfyui_dir=comfyui_config.dir if comfyui_is_local else None,
+            cleanup_hook=comfyui_config.cleanup_hook
+        )
+        
         self.task_processor = TaskProcessor(
             task_queue=self.task_queue,
             comfyui_client=self.comfyui_client,
             workflow_manager=self.workflow_manager,
             bot=self.bot,
-            timeout=self.config.queue.timeout_seconds
+            timeout=self.config.queue.timeout_seconds,
+            deadlines=self.config.queue.deadlines,
+            degradation=degradation,
+            notifier=self.notifier,
+            file_id_cache=FileIdCache(self.config.storage.file_id_cache_size),
+            file_manager=self.file_manager,
+            batch_delivery=self.config.queue.batch_delivery,
+            batch_flush_seconds=self.config.queue.batch_flush_seconds,
+            local_api=bool(self.config.telegram.api_server) and self.config.telegram.api_local,
+            artifacts=self.comfyui_artifacts,
+            upload_subfolder=self.config.comfyui.upload_subfolder
         )
         logger.info("Task processor initialized")
         
@@ -176,6 +272,8 @@ class Application:
         self.dp["comfyui_client"] = self.comfyui_client
         self.dp["config"] = self.config
         self.dp["file_manager"] = self.file_manager
+        self.dp["task_processor"] = self.task_processor
+        self.dp["album_collector"] = AlbumCollector(self.config.image.album_window_seconds)
         self.dp["user_settings_manager"] = self.user_settings_manager
         
         logger.success("All components initialized successfully")
@@ -184,6 +282,9 @@ class Application:
         """Запуск приложения"""
         logger.info("Starting application...")
         
+        # Уведомление пользователей о восстановленных задачах
+        await self._notify_restored_tasks()
+        
         # Запуск processor в фоне
         self.processor_task = asyncio.create_task(self.task_processor.start())
         logger.info("Task processor started")
@@ -193,15 +294,31 @@ class Application:
             self.file_manager.start_cleanup_task(
                 interval_hours=1,
                 max_age_hours=self.config.storage.cleanup_after_hours,
-                keep_results=self.config.storage.keep_results
+                keep_results=self.config.storage.keep_results,
+                # Завершённые задачи не копятся в хранилище между рестартами
+                on_cleanup=lambda: self.task_queue.purge_finished(self.config.storage.cleanup_after_hours),
+                # Ссылки брошенных диалогов на старые входные фото истекают
+                live_inputs=self.task_queue.live_inputs
             )
         )
         logger.info("File cleanup task started")
         
-        # Запуск polling
+        self.comfyui_artifacts.start_cleanup_task(self.config.comfyui.cleanup_interval_minutes)
+        
+        # Запуск приёма обновлений
         logger.success("🚀 Bot started successfully!")
         logger.info("Press Ctrl+C to stop")
         
+        if self.config.telegram.mode == "webhook":
+            self.webhook_server = WebhookServer(self.dp, self.bot, self.config.telegram.webhook)
+            await self.webhook_server.start()
+            # Обновления приходят в webhook, ждём сигнала остановки
+            await self.shutdown_event.wait()
+            return
+        
+        # Webhook, оставшийся после работы в режиме webhook, блокирует getUpdates (Conflict)
+        await self.bot.delete_webhook()
+        
         try:
             await self.dp.start_polling(
                 self.bot,
@@ -210,12 +327,44 @@ class Application:
         except asyncio.CancelledError:
             logger.info("Polling cancelled")
             
+    async def _notify_restored_tasks(self):
+        """Сообщить пользователям, что их задачи пережили рестарт бота"""
+        for task in self.restored_tasks:
+            position = self.task_queue.get_position(task.id)
+            await self.task_processor.notify_user(
+                task,
+                f"♻️ <b>Бот был перезапущен</b>\n\n"
+                f"🆔 ID: <code>{task.id[:8]}</code>\n"
+                f"📍 Позиция: {position}\n\n"
+                f"⏳ Задача восстановлена, ожидайте результат..."
+            )
+        
+        # Задачи пакетов не правят общее сообщение пакета — оно обновляется один раз
+        for batch_id in dict.fromkeys(task.batch_id for task in self.restored_tasks if task.batch_id):
+            batch = self.task_queue.batches.get(batch_id)
+            batch.last_text = batch.render(self.task_queue.batch_eta(batch_id))
+            self.notifier.update(
+                batch.chat_id, batch.message_id,
+                f"♻️ <b>Бот был перезапущен</b>, пакет восстановлен\n\n{batch.last_text}",
+                parse_mode="HTML"
+            )
+        
+        if self.restored_tasks:
+            logger.info(f"Notified users about {len(self.restored_tasks)} restored tasks")
+        self.restored_tasks = []
+    
     async def shutdown(self):
         """Graceful shutdown"""
         logger.info("Shutting down application...")
         
-        # 1. Остановить polling
-        await self.dp.stop_polling()
+        # 1. Остановить приём обновлений
+        if self.webhook_server:
+            await self.webhook_server.stop()
+        else:
+            try:
+                await self.dp.stop_polling()
+            except RuntimeError:
+                pass  # Polling не был запущен
         logger.info("Polling stopped")
         
         # 2. Остановить processor (ждёт текущую задачу до 60 сек)
@@ -230,6 +379,14 @@ class Application:
                 pass
         logger.info("Task processor stopped")
         
+        # 3.1. Остановить отправку правок статусов
+        if self.notifier:
+            await self.notifier.close()
+        
+        # 3.2. Отдать cleanup_hook оставшиеся файлы ComfyUI
+        if self.comfyui_artifacts:
+            await self.comfyui_artifacts.stop()
+        
         # 4. Отменить cleanup task
         if self.cleanup_task and not self.cleanup_task.done():
             self.cleanup_task.cancel()
@@ -239,6 +396,15 @@ class Application:
                 pass
         logger.info("Cleanup task stopped")
         
+        # 4.1. Дописать изменения задач и закрыть хранилище
+        if self.task_store:
+            await self.task_queue.flush_store()
+            self.task_store.close()
+        
+        # 4.2. Записать отложенные изменения настроек пользователей
+        if self.user_settings_manager:
+            await self.user_settings_manager.close()
+        
         # 5. Остановить ComfyUI (если запускали)
         if self.comfyui_launcher:
             logger.info("Stopping ComfyUI...")
@@ -12,7 +12,7 @@ from src.models.config import (
     StorageConfig,
     LoggingConfig
 )
-from src.models.task import Task, TaskStatus, WorkflowParams
+from src.models.task import Task, TaskStatus, TaskLane, WorkflowParams
 
 __all__ = [
     # Config models
@@ -27,5 +27,6 @@ __all__ = [
     # Task models
     "Task",
     "TaskStatus",
+    "TaskLane",
     "WorkflowParams",
 ]
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 
 class ComfyUIConfig(BaseModel):
@@ -12,6 +12,9 @@ class ComfyUIConfig(BaseModel):
     auto_start: bool = True  # Автозапуск ComfyUI если не запущен
     args: str = ""  # Дополнительные аргументы запуска
     startup_timeout: int = 300  # Таймаут запуска в секундах
+    upload_subfolder: str = "telegram_bot"  # Подпапка input/ для фото бота (файлы перезаписываются по ID задачи)
+    cleanup_hook: str = ""  # Команда удаления файлов на удалённом ComfyUI (пути в stdin построчно)
+    cleanup_interval_minutes: float = 60  # Как часто запускать cleanup_hook
 
 
 class WorkflowDefaults(BaseModel):
@@ -49,18 +52,97 @@ class ImageConfig(BaseModel):
     max_size_mb: int
     allowed_formats: List[str]
     scale_megapixels: float
+    album_window_seconds: float = 0.6  # Сколько ждать остальные фото альбома (media group) после последнего
+
+
+class DeadlinesConfig(BaseModel):
+    """Дедлайны фаз обработки задачи (в секундах)"""
+    upload_seconds: float = 30  # Загрузка входного изображения в ComfyUI
+    queueing_seconds: float = 15  # Постановка workflow в очередь ComfyUI
+    execution_base_seconds: float = 30  # Фиксированная часть дедлайна генерации
+    execution_slack: float = 3.0  # Множитель к прогнозу времени генерации (steps × мегапиксели)
+    download_seconds: float = 30  # Скачивание результата
+    delivery_seconds: float = 60  # Отправка результата в Telegram
+
+
+class DegradationLevel(BaseModel):
+    """Уровень деградации: срабатывает по глубине очереди или прогнозу ожидания"""
+    queue_depth: int = 0  # Порог количества ожидающих задач (0 — не учитывается)
+    wait_seconds: float = 0  # Порог прогноза ожидания в секундах (0 — не учитывается)
+    steps_factor: float = 1.0  # Множитель steps (не ниже workflow.limits.min_steps)
+    max_megapixels: Optional[float] = None  # Потолок разрешения (узел 93), None — без изменений
+
+
+class DegradationConfig(BaseModel):
+    """Режим деградации качества при перегрузке"""
+    enabled: bool = False
+    levels: List[DegradationLevel] = []  # По возрастанию жёсткости; применяется последний сработавший
 
 
 class QueueConfig(BaseModel):
     """Конфигурация очереди"""
     max_size: int
     timeout_seconds: int
+    scheduling: Literal["fifo", "fair"] = "fifo"  # fifo — общий FIFO, fair — round-robin между пользователями
+    bulk_min_share: float = 0.2  # Гарантированная доля выдач для пакетной полосы (0 — без гарантии)
+    persistent: bool = False  # Хранить задачи в SQLite (data_dir/tasks.db) и восстанавливать после рестарта
+    max_attempts: int = 2  # Сколько раз запускать задачу, прерванную рестартом
+    history_size: int = 1000  # Сколько завершённых задач хранить в памяти для статистики
+    supersede: bool = False  # Новая одиночная задача отменяет ожидающие одиночные задачи пользователя
+    max_pending_per_user: int = 0  # Квота ожидающих задач на пользователя (0 — без ограничения)
+    dedupe_window_seconds: int = 0  # Окно, в котором одинаковая задача присоединяется к существующей (0 — выключено)
+    batch_status_interval_seconds: float = 5.0  # Минимальный интервал обновления сводного сообщения /batch
+    progress_interval_seconds: float = 1.5  # Минимальный интервал правок статусных сообщений в одном чате
+    batch_delivery: Literal["photo", "album", "zip"] = "album"  # Результаты /batch: photo — по одному, album — sendMediaGroup по 10, zip — один архив в конце
+    batch_flush_seconds: float = 30.0  # album: отправить неполный альбом, если первый результат ждёт дольше
+    deadlines: DeadlinesConfig = DeadlinesConfig()  # timeout_seconds — верхняя граница дедлайна генерации
+    degradation: DegradationConfig = DegradationConfig()  # Быстрый режим при длинной очереди
+
+
+class StorageQuotaConfig(BaseModel):
+    """Квоты областей хранилища в МБ (0 — без ограничения)"""
+    input: float = 0
+    output: float = 0
+    temp: float = 0
 
 
 class StorageConfig(BaseModel):
     """Конфигурация хранилища"""
     cleanup_after_hours: int
     keep_results: bool
+    file_id_cache_size: int = 1000  # Сколько file_id отправленных результатов помнить для повторной отправки
+    in_memory_inputs: bool = False  # Скачивать входные фото в память и загружать в ComfyUI без записи на диск
+    spool_max_mb: float = 8  # Порог, после которого буфер входного фото сбрасывается во временный файл
+    retain_inputs: bool = True  # Сохранять копию входного фото в data/input (при in_memory_inputs — в фоне; при queue.persistent — всегда)
+    max_concurrent_downloads: int = 4  # Одновременных скачиваний из Telegram при приёме альбома
+    quota_mb: StorageQuotaConfig = StorageQuotaConfig()  # При превышении удаляются давно не использованные файлы
+    settings_flush_seconds: float = 1.0  # Изменения настроек пользователей пишутся в базу пачкой с этой задержкой
+
+
+class WebhookConfig(BaseModel):
+    """Приём обновлений через webhook"""
+    url: str = ""  # Публичный HTTPS адрес бота (без path), по нему Telegram шлёт обновления
+    path: str = "/webhook"
+    host: str = "0.0.0.0"
+    port: int = 8080
+    secret_token: str = ""  # X-Telegram-Bot-Api-Secret-Token (пусто — генерируется при запуске)
+    workers: int = 8  # Сколько обновлений обрабатывается параллельно
+    queue_size: int = 1000  # Сколько принятых обновлений может ждать обработки
+    max_connections: int = 40  # Одновременных соединений от Telegram
+
+
+class TelegramConfig(BaseModel):
+    """Лимиты исходящих запросов к Telegram Bot API и способ получения обновлений"""
+    mode: Literal["polling", "webhook"] = "polling"  # polling — getUpdates, webhook — встроенный HTTP сервер (см. webhook)
+    webhook: WebhookConfig = WebhookConfig()
+    global_rate: float = 30  # Сообщений в секунду на весь бот
+    chat_rate: float = 1.0  # Сообщений в секунду в один личный чат
+    group_rate_per_minute: float = 20  # Сообщений в минуту в одну группу
+    chat_burst: float = 3  # Допустимый всплеск в один чат
+    max_retries: int = 3  # Повторы запроса после TelegramRetryAfter
+    connection_limit: int = 100  # Размер пула соединений aiohttp сессии бота
+    api_server: str = ""  # Адрес своего telegram-bot-api сервера (пусто — api.telegram.org)
+    api_local: bool = False  # Сервер запущен с --local на этой машине: файлы по локальным путям, без лимитов размера
 
 
 class LoggingConfig(BaseModel):
@@ -76,6 +158,8 @@ class Config(BaseModel):
     telegram_bot_token: str
     admin_user_ids: List[int] = []
     
+    telegram: TelegramConfig = TelegramConfig()
+    
     # ComfyUI
     comfyui: ComfyUIConfig = ComfyUIConfig()
     
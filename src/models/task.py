@@ -1,5 +1,5 @@
-from dataclasses import dataclass, field
-from typing import Optional
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 from datetime import datetime
 from enum import Enum
@@ -11,6 +11,12 @@ class TaskStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class TaskLane(str, Enum):
+    """Полоса очереди: интерактивные задачи обслуживаются раньше пакетных"""
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
 
 @dataclass
 class WorkflowParams:
@@ -30,6 +36,7 @@ class WorkflowParams:
     strength: float = 0.5
     eta: float = 0.5
     denoise: float = 1.0
+    megapixels: Optional[float] = None  # Целевое разрешение (узел 93), None — как в шаблоне
     
     def validate(self, limits) -> None:
         """Валидация параметров против лимитов из конфига"""
@@ -51,6 +58,8 @@ class Task:
     # Данные задачи
     image_path: Optional[Path] = None
     workflow_params: Optional[WorkflowParams] = None
+    lane: TaskLane = TaskLane.INTERACTIVE
+    batch_id: Optional[str] = None  # Пакет /batch, к которому относится задача
     
     # Метаданные
     created_at: datetime = field(default_factory=datetime.now)
@@ -61,3 +70,65 @@ class Task:
     status: TaskStatus = TaskStatus.PENDING
     error: Optional[str] = None
     result_path: Optional[Path] = None
+    attempts: int = 0  # Количество запусков обработки (для повтора после рестарта)
+    
+    # Оценка времени (заполняется очередью)
+    input_megapixels: Optional[float] = None
+    estimated_seconds: float = 0.0
+    last_position: Optional[int] = None  # Последняя позиция, показанная пользователю
+    
+    # Дедупликация
+    fingerprint: Optional[str] = None  # Отпечаток входа и параметров
+    followers: List[Tuple[int, int]] = field(default_factory=list)  # (chat_id, message_id) повторных отправок
+    duplicate_of: Optional[str] = None  # ID задачи, к которой присоединена эта (не ставится в очередь)
+    
+    degraded: bool = False  # Параметры понижены режимом деградации ("быстрый режим")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразовать в JSON-совместимый словарь"""
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "chat_id": self.chat_id,
+            "message_id": self.message_id,
+            "image_path": str(self.image_path) if self.image_path else None,
+            "workflow_params": asdict(self.workflow_params) if self.workflow_params else None,
+            "lane": self.lane.value,
+            "batch_id": self.batch_id,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "status": self.status.value,
+            "error": self.error,
+            "result_path": str(self.result_path) if self.result_path else None,
+            "attempts": self.attempts,
+            "input_megapixels": self.input_megapixels,
+            "fingerprint": self.fingerprint,
+            "followers": [list(follower) for follower in self.followers],
+            "degraded": self.degraded,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Task':
+        """Создать из словаря (см. to_dict)"""
+        return cls(
+            id=data["id"],
+            user_id=data["user_id"],
+            chat_id=data["chat_id"],
+            message_id=data["message_id"],
+            image_path=Path(data["image_path"]) if data.get("image_path") else None,
+            workflow_params=WorkflowParams(**data["workflow_params"]) if data.get("workflow_params") else None,
+            lane=TaskLane(data.get("lane", TaskLane.INTERACTIVE.value)),
+            batch_id=data.get("batch_id"),
+            created_at=datetime.fromisoformat(data["created_at"]),
+            started_at=datetime.fromisoformat(data["started_at"]) if data.get("started_at") else None,
+            completed_at=datetime.fromisoformat(data["completed_at"]) if data.get("completed_at") else None,
+            status=TaskStatus(data["status"]),
+            error=data.get("error"),
+            result_path=Path(data["result_path"]) if data.get("result_path") else None,
+            attempts=data.get("attempts", 0),
+            input_megapixels=data.get("input_megapixels"),
+            fingerprint=data.get("fingerprint"),
+            followers=[tuple(follower) for follower in data.get("followers", [])],
+            degraded=data.get("degraded", False),
+        )
@@ -4,8 +4,12 @@ Queue package - Очередь задач и процессор для обра
 
 from src.queue.task_queue import TaskQueue
 from src.queue.processor import TaskProcessor
+from src.queue.task_store import TaskStore
+from src.queue.admission import AdmissionRejected
 
 __all__ = [
     "TaskQueue",
     "TaskProcessor",
+    "TaskStore",
+    "AdmissionRejected",
 ]
@@ -0,0 +1,74 @@
+"""Контроль допуска задач в очередь"""
+
+from typing import TYPE_CHECKING
+
+from src.models.task import Task
+
+if TYPE_CHECKING:
+    from src.queue.task_queue import TaskQueue
+
+
+class AdmissionRejected(Exception):
+    """Задача не принята в очередь"""
+
+    QUEUE_FULL = "queue_full"
+    USER_QUOTA = "user_quota"
+
+    def __init__(self, reason: str, retry_after: float):
+        """
+        Args:
+            reason: Причина отказа (QUEUE_FULL или USER_QUOTA)
+            retry_after: Через сколько секунд имеет смысл повторить
+        """
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Task rejected: {reason}, retry after {retry_after:.0f}s")
+
+
+class AdmissionController:
+    """
+    Немедленный допуск или отказ вместо ожидания места в очереди
+
+    Проверяется общий лимит очереди и лимит ожидающих задач на пользователя.
+    Время повтора считается по ETA: место в общей очереди освободится,
+    когда закончится текущая задача, место в квоте пользователя — когда
+    начнётся обработка его первой ожидающей задачи.
+    """
+
+    MIN_RETRY_AFTER = 5.0
+
+    def __init__(self, max_size: int = 100, max_pending_per_user: int = 0):
+        """
+        Args:
+            max_size: Максимальный размер очереди (<= 0 — без ограничения)
+            max_pending_per_user: Максимум ожидающих задач одного пользователя (<= 0 — без ограничения)
+        """
+        self.max_size = max_size
+        self.max_pending_per_user = max_pending_per_user
+
+    def check(self, task_queue: "TaskQueue", task: Task) -> None:
+        """
+        Проверить, можно ли поставить задачу в очередь (вызывается под блокировкой очереди)
+
+        Args:
+            task_queue: Очередь задач
+            task: Новая задача
+
+        Raises:
+            AdmissionRejected: Очередь или квота пользователя заполнены
+        """
+        if self.max_size > 0 and task_queue.queue.qsize() >= self.max_size:
+            retry_after = task_queue.current_remaining()
+            raise AdmissionRejected(
+                AdmissionRejected.QUEUE_FULL,
+                max(retry_after, self.MIN_RETRY_AFTER)
+            )
+
+        if self.max_pending_per_user > 0:
+            user_tasks = task_queue.find_user_tasks(task.user_id)
+            if len(user_tasks) >= self.max_pending_per_user:
+                retry_after = task_queue.get_eta(user_tasks[0].id) or 0.0
+                raise AdmissionRejected(
+                    AdmissionRejected.USER_QUOTA,
+                    max(retry_after, self.MIN_RETRY_AFTER)
+                )
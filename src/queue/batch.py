@@ -0,0 +1,213 @@
+"""Сводный статус пакетной обработки (/batch)"""
+
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.models.task import TaskStatus
+from src.queue.eta import format_eta
+
+
+@dataclass
+class Batch:
+    """Пакет задач с одним статусным сообщением"""
+    chat_id: int
+    message_id: int
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    created_at: datetime = field(default_factory=datetime.now)
+    last_update: Optional[datetime] = None
+    last_text: Optional[str] = None
+    # Результаты, ожидающие отправки альбомом или архивом: (путь, SHA-256 содержимого, быстрый режим)
+    results: List[Tuple[Path, str, bool]] = field(default_factory=list)
+    results_since: Optional[datetime] = None
+    delivered: int = 0
+
+    def add_result(self, result_path: Path, content_hash: str, degraded: bool = False):
+        """Отложить результат задачи до групповой отправки (degraded — получен в быстром режиме)"""
+        if not self.results:
+            self.results_since = datetime.now()
+        self.results.append((result_path, content_hash, degraded))
+
+    def take_results(self) -> List[Tuple[Path, str, bool]]:
+        """Забрать накопленные результаты для отправки"""
+        results, self.results = self.results, []
+        self.results_since = None
+        return results
+
+    @property
+    def finished(self) -> bool:
+        """Все задачи пакета завершены"""
+        return self.total > 0 and self.done + self.failed + self.cancelled >= self.total
+
+    def render(self, eta_seconds: Optional[float] = None) -> str:
+        """
+        Текст статусного сообщения
+
+        Args:
+            eta_seconds: Оценка времени до завершения пакета
+
+        Returns:
+            HTML-текст
+        """
+        completed = self.done + self.failed + self.cancelled
+        percent = int(completed / self.total * 100) if self.total else 0
+        progress_bar = "█" * (percent // 10) + "░" * (10 - percent // 10)
+
+        lines = [
+            "✅ <b>Пакет обработан</b>" if self.finished else "📦 <b>Пакетная обработка</b>",
+            "",
+            f"[{progress_bar}] {completed}/{self.total}",
+        ]
+        if self.failed:
+            lines.append(f"❌ Ошибок: {self.failed}")
+        if self.cancelled:
+            lines.append(f"🚫 Отменено: {self.cancelled}")
+        if not self.finished:
+            lines.append(f"⏱ Завершение: {format_eta(eta_seconds)}")
+        return "\n".join(lines)
+
+
+class BatchTracker:
+    """
+    Реестр активных пакетов
+
+    Прогресс пакета отображается одним сообщением, которое обновляется
+    не чаще раза в min_interval секунд (финальное состояние — всегда),
+    вместо отдельных сообщений и правок для каждой задачи.
+    """
+
+    def __init__(self, min_interval: float = 5.0):
+        """
+        Args:
+            min_interval: Минимальный интервал между правками сообщения пакета в секундах
+        """
+        self.min_interval = min_interval
+        self._batches: Dict[str, Batch] = {}
+
+    def create(self, chat_id: int, message_id: int) -> Batch:
+        """
+        Зарегистрировать новый пакет
+
+        Args:
+            chat_id: ID чата
+            message_id: ID статусного сообщения пакета
+
+        Returns:
+            Пакет (total растёт по мере постановки задач)
+        """
+        batch = Batch(chat_id=chat_id, message_id=message_id)
+        self._batches[batch.id] = batch
+        return batch
+
+    def restore(self, batch_id: str, chat_id: int, message_id: int) -> Batch:
+        """
+        Восстановить пакет после рестарта по его задачам
+
+        Реестр пакетов не сохраняется, поэтому пакет пересоздаётся с тем же
+        id и статусным сообщением; total считает только восстановленные задачи.
+
+        Args:
+            batch_id: ID пакета (Task.batch_id)
+            chat_id: ID чата
+            message_id: ID статусного сообщения пакета
+
+        Returns:
+            Пакет (новый или уже восстановленный по другой задаче)
+        """
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            batch = Batch(chat_id=chat_id, message_id=message_id, id=batch_id)
+            self._batches[batch_id] = batch
+        return batch
+
+    def get(self, batch_id: Optional[str]) -> Optional[Batch]:
+        """Активный пакет по id"""
+        if batch_id is None:
+            return None
+        return self._batches.get(batch_id)
+
+    def find_by_message(self, chat_id: int, message_id: int) -> Optional[Batch]:
+        """
+        Активный пакет по его статусному сообщению
+
+        Дубликаты задач пакета присоединяются к исходной задаче с
+        (chat_id, message_id) этого сообщения, поэтому по нему пакет
+        находится и для followers.
+
+        Args:
+            chat_id: ID чата
+            message_id: ID сообщения
+
+        Returns:
+            Пакет или None если это не сообщение активного пакета
+        """
+        for batch in self._batches.values():
+            if batch.chat_id == chat_id and batch.message_id == message_id:
+                return batch
+        return None
+
+    def holds_result(self, result_path: Path) -> bool:
+        """Ждёт ли результат отправки в каком-либо активном пакете"""
+        return any(
+            path == result_path
+            for batch in self._batches.values()
+            for path, _, _ in batch.results
+        )
+
+    def with_results(self) -> List[Batch]:
+        """Активные пакеты с неотправленными результатами"""
+        return [batch for batch in self._batches.values() if batch.results]
+
+    def remove(self, batch_id: str):
+        """Удалить пакет из реестра"""
+        self._batches.pop(batch_id, None)
+
+    @staticmethod
+    def record(batch: Batch, status: TaskStatus):
+        """
+        Учесть итог одного элемента пакета
+
+        Args:
+            batch: Пакет
+            status: COMPLETED, CANCELLED или FAILED (любой другой статус считается ошибкой)
+        """
+        if status == TaskStatus.COMPLETED:
+            batch.done += 1
+        elif status == TaskStatus.CANCELLED:
+            batch.cancelled += 1
+        else:
+            batch.failed += 1
+
+    def should_flush(self, batch: Batch, max_items: Optional[int], window: Optional[float]) -> bool:
+        """
+        Пора ли отправить накопленные результаты пакета
+
+        Args:
+            batch: Пакет
+            max_items: Отправлять, как только накопилось столько результатов (None — только в конце)
+            window: Отправлять, если первый результат ждёт дольше (сек, None — только в конце)
+
+        Returns:
+            True если есть что отправить и пакет завершён, набран max_items или истекло окно
+        """
+        if not batch.results:
+            return False
+        if batch.finished:
+            return True
+        if max_items is not None and len(batch.results) >= max_items:
+            return True
+        if window is None:
+            return False
+        return (datetime.now() - batch.results_since).total_seconds() >= window
+
+    def should_update(self, batch: Batch) -> bool:
+        """Пора ли обновить сообщение пакета (с учётом троттлинга)"""
+        if batch.finished or batch.last_update is None:
+            return True
+        return (datetime.now() - batch.last_update).total_seconds() >= self.min_interval
@@ -0,0 +1,105 @@
+"""Дедупликация одинаковых задач (двойные нажатия, повторная отправка фото)"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Dict, Optional
+from loguru import logger
+
+from src.models.task import Task, TaskStatus
+
+
+def compute_fingerprint(task: Task, opener: Callable[..., BinaryIO] = open) -> str:
+    """
+    Отпечаток задачи: пользователь, содержимое входного файла, промпт и параметры
+
+    Seed = 0 означает случайный seed, поэтому две такие задачи считаются
+    одинаковыми — пользователь повторно отправил тот же запрос, а не просил
+    другую вариацию. Путь к файлу не учитывается: одно и то же фото,
+    отправленное дважды, сохраняется под разными именами.
+
+    Args:
+        task: Задача
+        opener: Функция открытия входного файла (FileManager.open_input для фото в памяти)
+
+    Returns:
+        Hex-строка SHA-256
+    """
+    content = hashlib.sha256()
+    if task.image_path:
+        try:
+            with opener(task.image_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    content.update(chunk)
+        except OSError as e:
+            logger.debug(f"Failed to hash input of task {task.id[:8]}: {e}")
+            content.update(str(task.image_path).encode())
+
+    params = task.workflow_params
+    payload = {
+        "user_id": task.user_id,
+        "content": content.hexdigest(),
+        "positive_prompt": params.positive_prompt if params else "",
+        "negative_prompt": params.negative_prompt if params else "",
+        "steps": params.steps if params else None,
+        "cfg": params.cfg if params else None,
+        "sampler": params.sampler if params else None,
+        "scheduler": params.scheduler if params else None,
+        "seed": params.seed if params else 0,
+        "strength": params.strength if params else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class DedupeIndex:
+    """
+    Индекс ожидающих и выполняющихся задач по отпечатку
+
+    Повторная задача в пределах окна присоединяется к уже существующей,
+    вместо того чтобы запускать ещё одну генерацию на GPU.
+    """
+
+    def __init__(self, window_seconds: int = 0):
+        """
+        Args:
+            window_seconds: Окно дедупликации в секундах (0 — выключено)
+        """
+        self.window_seconds = window_seconds
+        self._by_fingerprint: Dict[str, Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        """Включена ли дедупликация"""
+        return self.window_seconds > 0
+
+    def find(self, fingerprint: Optional[str]) -> Optional[Task]:
+        """
+        Найти активную задачу с таким же отпечатком
+
+        Args:
+            fingerprint: Отпечаток новой задачи
+
+        Returns:
+            Ожидающая или выполняющаяся задача, созданная в пределах окна, или None
+        """
+        if not fingerprint:
+            return None
+        task = self._by_fingerprint.get(fingerprint)
+        if task is None:
+            return None
+
+        expired = datetime.now() - task.created_at > timedelta(seconds=self.window_seconds)
+        if expired or task.status not in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+            del self._by_fingerprint[fingerprint]
+            return None
+        return task
+
+    def register(self, task: Task):
+        """Запомнить задачу (если у неё есть отпечаток)"""
+        if task.fingerprint:
+            self._by_fingerprint[task.fingerprint] = task
+
+    def discard(self, task: Task):
+        """Забыть задачу после завершения или отмены"""
+        if task.fingerprint and self._by_fingerprint.get(task.fingerprint) is task:
+            del self._by_fingerprint[task.fingerprint]
@@ -0,0 +1,90 @@
+"""Режим деградации качества при перегрузке очереди"""
+
+from typing import Optional
+from loguru import logger
+
+from src.models.config import DegradationConfig, DegradationLevel, WorkflowLimits
+from src.models.task import Task
+
+
+class DegradationPolicy:
+    """
+    Снижение steps и разрешения задач, пока очередь перегружена
+
+    Уровень выбирается по глубине очереди и прогнозу ожидания в момент,
+    когда задача берётся в обработку: из сработавших уровней берётся
+    последний (самый жёсткий). Параметры только уменьшаются и не выходят
+    за WorkflowLimits.
+    """
+
+    def __init__(self, config: DegradationConfig, limits: WorkflowLimits, base_megapixels: float = 1.0):
+        """
+        Args:
+            config: Настройки деградации (из config.queue.degradation)
+            limits: Лимиты параметров (из config.workflow.limits)
+            base_megapixels: Целевое разрешение без деградации (из config.image.scale_megapixels)
+        """
+        self.config = config
+        self.limits = limits
+        self.base_megapixels = base_megapixels
+
+    def select_level(self, queue_depth: int, predicted_wait: float) -> Optional[DegradationLevel]:
+        """
+        Уровень деградации для текущей нагрузки
+
+        Args:
+            queue_depth: Количество ожидающих задач
+            predicted_wait: Прогноз ожидания новой задачи в секундах
+
+        Returns:
+            Сработавший уровень или None если деградация не нужна
+        """
+        if not self.config.enabled:
+            return None
+
+        selected = None
+        for level in self.config.levels:
+            by_depth = level.queue_depth > 0 and queue_depth >= level.queue_depth
+            by_wait = level.wait_seconds > 0 and predicted_wait >= level.wait_seconds
+            if by_depth or by_wait:
+                selected = level
+        return selected
+
+    def apply(self, task: Task, queue_depth: int, predicted_wait: float) -> bool:
+        """
+        Понизить параметры задачи, если очередь перегружена
+
+        Args:
+            task: Задача, которая берётся в обработку
+            queue_depth: Количество ожидающих задач
+            predicted_wait: Прогноз ожидания новой задачи в секундах
+
+        Returns:
+            True если параметры задачи были понижены
+        """
+        level = self.select_level(queue_depth, predicted_wait)
+        params = task.workflow_params
+        if level is None or params is None:
+            return False
+
+        steps = max(self.limits.min_steps, int(round(params.steps * level.steps_factor)))
+        steps = min(steps, params.steps)
+
+        megapixels = params.megapixels
+        if level.max_megapixels is not None:
+            current = params.megapixels if params.megapixels is not None else self.base_megapixels
+            if level.max_megapixels < current:
+                megapixels = level.max_megapixels
+
+        if steps == params.steps and megapixels == params.megapixels:
+            return False
+
+        logger.info(
+            f"Task {task.id[:8]} degraded (depth {queue_depth}, wait {predicted_wait:.0f}s): "
+            f"steps {params.steps} -> {steps}, megapixels {params.megapixels or self.base_megapixels} -> "
+            f"{megapixels or self.base_megapixels}"
+        )
+        params.steps = steps
+        params.megapixels = megapixels
+        task.degraded = True
+        return True
@@ -0,0 +1,130 @@
+"""Оценка времени обработки задач (ETA)"""
+
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+from loguru import logger
+from PIL import Image
+
+from src.models.task import Task
+
+
+def get_input_megapixels(task: Task, opener: Callable[..., BinaryIO] = open) -> float:
+    """
+    Мегапиксели входного изображения задачи
+
+    Читает только заголовок файла и кэширует результат в task.input_megapixels.
+
+    Args:
+        task: Задача
+        opener: Функция открытия входного файла (FileManager.open_input для фото в памяти)
+
+    Returns:
+        Размер изображения в мегапикселях (1.0 если определить не удалось)
+    """
+    if task.input_megapixels is not None:
+        return task.input_megapixels
+
+    megapixels = 1.0
+    if task.image_path:
+        try:
+            with opener(task.image_path, "rb") as f, Image.open(f) as image:
+                width, height = image.size
+            megapixels = (width * height) / 1_000_000
+        except Exception as e:
+            logger.debug(f"Failed to read image size for task {task.id[:8]}: {e}")
+
+    task.input_megapixels = megapixels
+    return megapixels
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """
+    Человекочитаемое время ожидания
+
+    Args:
+        seconds: Оценка в секундах
+
+    Returns:
+        Строка вида "~40 сек" или "~3 мин"
+    """
+    if seconds is None:
+        return "неизвестно"
+    if seconds <= 0:
+        return "сразу"
+    if seconds < 60:
+        return f"~{max(int(round(seconds / 10.0)) * 10, 10)} сек"
+    return f"~{int(round(seconds / 60.0))} мин"
+
+
+class ServiceTimeEstimator:
+    """
+    Экспоненциально взвешенная модель времени обработки
+
+    Время обработки усредняется (EWMA) отдельно для каждой комбинации
+    steps / мегапиксели (с шагом 0.5) / sampler. Для ещё не встречавшихся
+    комбинаций используется общая EWMA скорость "секунд на шаг·мегапиксель".
+    """
+
+    def __init__(self, alpha: float = 0.3, default_seconds_per_unit: float = 4.0,
+                 opener: Callable[..., BinaryIO] = open):
+        """
+        Args:
+            alpha: Вес нового наблюдения (0..1)
+            default_seconds_per_unit: Начальная оценка секунд на шаг·мегапиксель
+            opener: Функция открытия входного файла задачи
+        """
+        self.alpha = alpha
+        self.opener = opener
+        self._by_key: Dict[Tuple[int, float, str], float] = {}
+        self._seconds_per_unit = default_seconds_per_unit
+
+    def _work_units(self, task: Task) -> Tuple[Tuple[int, float, str], float]:
+        """Ключ модели и объём работы (шаги × мегапиксели)"""
+        params = task.workflow_params
+        steps = params.steps if params else 8
+        sampler = params.sampler if params else ""
+        megapixels = get_input_megapixels(task, self.opener)
+        bucket = max(round(megapixels * 2) / 2, 0.5)
+        return (steps, bucket, sampler), steps * bucket
+
+    def estimate(self, task: Task) -> float:
+        """
+        Оценка времени обработки задачи
+
+        Args:
+            task: Задача
+
+        Returns:
+            Ожидаемое время обработки в секундах
+        """
+        key, units = self._work_units(task)
+        if key in self._by_key:
+            return self._by_key[key]
+        return self._seconds_per_unit * units
+
+    def is_observed(self, task: Task) -> bool:
+        """
+        Есть ли фактические замеры для комбинации параметров задачи
+
+        Args:
+            task: Задача
+
+        Returns:
+            True если оценка основана на наблюдениях, а не на начальном приближении
+        """
+        key, _ = self._work_units(task)
+        return key in self._by_key
+
+    def observe(self, task: Task, seconds: float):
+        """
+        Учесть фактическое время генерации
+
+        Args:
+            task: Задача, генерация которой завершилась
+            seconds: Фактическое время фазы execution в ComfyUI (без загрузки, ожидания и доставки)
+        """
+        if seconds <= 0:
+            return
+        key, units = self._work_units(task)
+        previous = self._by_key.get(key)
+        self._by_key[key] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+        self._seconds_per_unit += self.alpha * (seconds / units - self._seconds_per_unit)
@@ -1,15 +1,49 @@
 import asyncio
-from typing import Optional
+import zipfile
+from typing import Dict, List, Optional, Tuple, Union
+from datetime import datetime
 from pathlib import Path
 from loguru import logger
 from aiogram import Bot
-from aiogram.types import FSInputFile
+from aiogram.types import FSInputFile, InputMediaPhoto
+from aiogram.exceptions import TelegramBadRequest
 
 from src.queue.task_queue import TaskQueue
+from src.queue.eta import format_eta
 from src.comfyui.client import ComfyUIClient
 from src.comfyui.workflow import WorkflowManager
 from src.comfyui.websocket import track_progress
 from src.models.task import Task
+from src.models.config import DeadlinesConfig
+from src.queue.degradation import DegradationPolicy
+from src.bot.notifier import ProgressNotifier
+from src.bot.outbound import OutboundWait, outbound_wait
+from src.storage.file_id_cache import FileIdCache
+from src.storage.file_manager import FileManager
+from src.queue.batch import Batch
+from src.comfyui.artifacts import ComfyUIArtifacts
+
+
+# Максимум фото в одном sendMediaGroup
+MEDIA_GROUP_SIZE = 10
+# Максимальный размер части архива (лимит Bot API на отправку документа — 50 МБ)
+ARCHIVE_PART_BYTES = 45 * 1024 * 1024
+# Пометка результатов, полученных с пониженными параметрами (DegradationPolicy)
+DEGRADED_NOTE = "⚡ Быстрый режим: очередь перегружена, качество снижено"
+
+
+class PhaseTimeoutError(Exception):
+    """Фаза обработки задачи не уложилась в свой дедлайн"""
+    
+    def __init__(self, phase: str, seconds: float):
+        """
+        Args:
+            phase: Название фазы (upload, queueing, execution, download, delivery)
+            seconds: Дедлайн фазы в секундах
+        """
+        self.phase = phase
+        self.seconds = seconds
+        super().__init__(f"Phase '{phase}' timed out after {seconds:.0f}s")
 
 
 class TaskProcessor:
@@ -21,7 +55,17 @@ class TaskProcessor:
         comfyui_client: ComfyUIClient,
         workflow_manager: WorkflowManager, 
         bot: Bot,
-        timeout: int = 300
+        timeout: int = 300,
+        deadlines: Optional[DeadlinesConfig] = None,
+        degradation: Optional[DegradationPolicy] = None,
+        notifier: Optional[ProgressNotifier] = None,
+        file_id_cache: Optional[FileIdCache] = None,
+        file_manager: Optional[FileManager] = None,
+        batch_delivery: str = "photo",
+        batch_flush_seconds: float = 30.0,
+        local_api: bool = False,
+        artifacts: Optional[ComfyUIArtifacts] = None,
+        upload_subfolder: str = ""
     ):
         """
         Инициализация процессора
@@ -31,15 +75,37 @@ class TaskProcessor:
             comfyui_client: Клиент ComfyUI API
             workflow_manager: Менеджер workflow
             bot: Telegram bot instance
-            timeout: Таймаут обработки задачи в секундах (из config.queue.timeout_seconds)
+            timeout: Верхняя граница дедлайна генерации в секундах (из config.queue.timeout_seconds)
+            deadlines: Дедлайны фаз обработки (из config.queue.deadlines)
+            degradation: Политика деградации при перегрузке (None — всегда полное качество)
+            notifier: Отправитель правок статусных сообщений (None — создаётся с настройками по умолчанию)
+            file_id_cache: Кэш file_id отправленных результатов (None — создаётся с настройками по умолчанию)
+            file_manager: Менеджер файлов (входные фото в памяти загружаются из его буферов)
+            batch_delivery: Доставка результатов /batch: photo, album или zip (из config.queue.batch_delivery)
+            batch_flush_seconds: Окно накопления альбома результатов (из config.queue.batch_flush_seconds)
+            local_api: Бот работает через локальный Bot API сервер — файлы отправляются по file:// пути
+            artifacts: Реестр файлов бота в директориях ComfyUI (None — файлы не удаляются)
+            upload_subfolder: Подпапка input/ ComfyUI для входных фото бота (из config.comfyui.upload_subfolder)
         """
         self.task_queue = task_queue
         self.comfyui = comfyui_client
         self.workflow_manager = workflow_manager
         self.bot = bot
         self.timeout = timeout
+        self.deadlines = deadlines or DeadlinesConfig()
+        self.degradation = degradation
+        self.notifier = notifier or ProgressNotifier(bot)
+        self.file_id_cache = file_id_cache or FileIdCache()
+        self.file_manager = file_manager
+        self.batch_delivery = batch_delivery
+        self.batch_flush_seconds = batch_flush_seconds
+        self.local_api = local_api
+        self.artifacts = artifacts or ComfyUIArtifacts()
+        self.upload_subfolder = upload_subfolder
         self.is_running = False
         self._shutdown_event = asyncio.Event()
+        # Таймеры окна накопления альбома по id пакета
+        self._flush_timers: Dict[str, asyncio.Task] = {}
         
     async def start(self):
         """Запуск обработчика (бесконечный цикл)"""
@@ -50,29 +116,29 @@ class TaskProcessor:
             try:
                 # Получаем задачу (блокирующая операция)
                 # Используем wait_for для поддержки graceful shutdown
-                task = await asyncio.wait_for(
-                    self.task_queue.get_task(),
-                    timeout=1.0  # Проверяем is_running каждую секунду
-                )
+                try:
+                    task = await asyncio.wait_for(
+                        self.task_queue.get_task(),
+                        timeout=1.0  # Проверяем is_running каждую секунду
+                    )
+                except asyncio.TimeoutError:
+                    # Нет задач в очереди
+                    continue
                 
                 logger.info(f"Processing task {task.id[:8]}")
                 
-                # Обработка с таймаутом
-                await asyncio.wait_for(
-                    self.process_task(task),
-                    timeout=self.timeout
-                )
+                # Очередь сдвинулась — обновить позиции ожидающих
+                await self.refresh_positions()
                 
-            except asyncio.TimeoutError:
-                # Либо нет задач в очереди, либо задача зависла
-                if self.task_queue.current_task:
-                    logger.error(f"Task {self.task_queue.current_task.id[:8]} timed out after {self.timeout}s")
-                    await self.task_queue.task_done(
-                        self.task_queue.current_task,
-                        success=False,
-                        error=f"Processing timeout ({self.timeout}s)"
-                    )
-                continue
+                # При перегрузке — быстрый режим
+                if self.degradation and self.degradation.apply(
+                    task, self.task_queue.queue.qsize(), self.task_queue.predicted_wait()
+                ):
+                    self.task_queue.stats.record_degraded()
+                
+                # Каждая фаза обработки ограничена своим дедлайном
+                await self.process_task(task)
+                await self.report_batch_progress(task)
                 
             except asyncio.CancelledError:
                 logger.info("Task processor cancelled")
@@ -104,29 +170,151 @@ class TaskProcessor:
                     break
                 await asyncio.sleep(1)
         
+        # Задачи этих результатов уже COMPLETED: после рестарта их никто не отправит
+        for batch in self.task_queue.batches.with_results():
+            logger.info(f"Delivering {len(batch.results)} pending results of batch {batch.id[:8]} before shutdown")
+            try:
+                await self.deliver_batch_results(batch)
+            except Exception as e:
+                logger.exception(f"Failed to deliver results of batch {batch.id[:8]}: {e}")
+        for timer in list(self._flush_timers.values()):
+            timer.cancel()
+        
         logger.info("Task processor stopped gracefully")
         
+    def execution_deadline(self, task: Task) -> float:
+        """
+        Дедлайн генерации по прогнозу времени (steps × мегапиксели)
+        
+        Пока для параметров задачи нет ни одного замера (первая задача после
+        рестарта, она же платит за загрузку модели в ComfyUI), действует
+        полный self.timeout — прогноз по начальному приближению не сужает его.
+        
+        Args:
+            task: Задача
+            
+        Returns:
+            Дедлайн в секундах, не больше self.timeout
+        """
+        estimator = self.task_queue.estimator
+        if not estimator.is_observed(task):
+            return self.timeout
+        predicted = estimator.estimate(task)
+        deadline = self.deadlines.execution_base_seconds + self.deadlines.execution_slack * predicted
+        return min(deadline, self.timeout)
+    
+    async def _run_phase(self, phase: str, seconds: float, awaitable):
+        """
+        Выполнить фазу обработки с дедлайном
+        
+        Args:
+            phase: Название фазы (для ошибки и логов)
+            seconds: Дедлайн в секундах
+            awaitable: Корутина фазы
+            
+        Returns:
+            Результат корутины
+            
+        Raises:
+            PhaseTimeoutError: Фаза не уложилась в дедлайн
+        """
+        try:
+            return await asyncio.wait_for(awaitable, timeout=seconds)
+        except asyncio.TimeoutError:
+            raise PhaseTimeoutError(phase, seconds) from None
+    
+    async def _run_delivery(self, awaitable):
+        """
+        Выполнить отправку в Telegram с дедлайном доставки
+        
+        Ожидание в OutboundScheduler (лимиты чата и паузы после 429) в
+        дедлайн не входит: под flood control готовый результат ждёт своей
+        очереди, а не считается недоставленным.
+        
+        Args:
+            awaitable: Корутина отправки
+            
+        Returns:
+            Результат корутины
+            
+        Raises:
+            PhaseTimeoutError: Отправка не уложилась в дедлайн доставки
+        """
+        loop = asyncio.get_running_loop()
+        wait = OutboundWait()
+        token = outbound_wait.set(wait)
+        try:
+            # Задача копирует контекст при создании — запросы отправки видят wait
+            sending = asyncio.ensure_future(awaitable)
+        finally:
+            outbound_wait.reset(token)
+        
+        deadline = loop.time() + self.deadlines.delivery_seconds
+        try:
+            while True:
+                remaining = deadline + wait.total(loop.time()) - loop.time()
+                if remaining <= 0:
+                    raise PhaseTimeoutError("delivery", self.deadlines.delivery_seconds)
+                done, _ = await asyncio.wait({sending}, timeout=remaining)
+                if done:
+                    return sending.result()
+        finally:
+            if not sending.done():
+                sending.cancel()
+    
     async def process_task(self, task: Task):
         """
         Обработка одной задачи
         
+        Загрузка, постановка в ComfyUI, генерация, скачивание и доставка
+        ограничены отдельными дедлайнами, поэтому зависшая загрузка
+        обнаруживается за секунды, а долгая генерация на 50 шагов не
+        обрывается общим таймаутом.
+        
         Args:
             task: Задача для обработки
         """
+        prompt_id = None
+        result_path = None
+        # Результат закреплён до доставки; снимается в finally и при ошибке доставки
+        result_pinned = False
         try:
             # 1. Уведомление пользователя о начале
             await self.notify_user(task, "🔄 Обработка началась...")
             
             # 2. Загрузка изображения в ComfyUI
             logger.debug(f"Uploading image: {task.image_path}")
-            upload_result = await self.comfyui.upload_image(task.image_path)
+            image_data = None
+            if self.file_manager is not None:
+                image_data = self.file_manager.read_input(task.image_path)
+            # Имя по ID задачи с перезаписью: повторная попытка не плодит копий в input/ ComfyUI
+            upload_result = await self._run_phase(
+                "upload", self.deadlines.upload_seconds,
+                self.comfyui.upload_image(
+                    task.image_path,
+                    subfolder=self.upload_subfolder,
+                    image_data=image_data,
+                    filename=f"{task.id}{Path(task.image_path).suffix}",
+                    overwrite=True
+                )
+            )
+            self.artifacts.record(task.id, "input", upload_result["name"], upload_result.get("subfolder", ""))
+            if self.file_manager is not None:
+                # Буфер больше не нужен: изображение уже на сервере ComfyUI
+                self.file_manager.release_input(task.image_path)
             
             # 3. Создание workflow с параметрами
-            task.workflow_params.input_image = upload_result["name"]
+            uploaded_subfolder = upload_result.get("subfolder", "")
+            task.workflow_params.input_image = (
+                f"{uploaded_subfolder}/{upload_result['name']}" if uploaded_subfolder else upload_result["name"]
+            )
             workflow, extra_pnginfo = self.workflow_manager.create_workflow(task.workflow_params)
             
             # 4. Постановка в очередь ComfyUI (с extra_pnginfo для custom нод)
-            prompt_id = await self.comfyui.queue_prompt(workflow, extra_pnginfo)
+            prompt_id = await self._run_phase(
+                "queueing", self.deadlines.queueing_seconds,
+                self.comfyui.queue_prompt(workflow, extra_pnginfo)
+            )
             logger.info(f"Task {task.id[:8]} queued in ComfyUI: {prompt_id}")
             
             # 5. Отслеживание прогресса через WebSocket
@@ -142,14 +330,22 @@ class TaskProcessor:
             
             ws_url = f"ws://{self.comfyui.host}:{self.comfyui.port}/ws"
             base_url = f"http://{self.comfyui.host}:{self.comfyui.port}"
-            result = await track_progress(
-                ws_url=ws_url,
-                client_id=self.comfyui.client_id,
-                prompt_id=prompt_id,
-                callback=progress_callback,
-                timeout=self.timeout,
-                base_url=base_url
+            execution_deadline = self.execution_deadline(task)
+            logger.debug(f"Task {task.id[:8]} execution deadline: {execution_deadline:.0f}s")
+            execution_started = asyncio.get_running_loop().time()
+            result = await self._run_phase(
+                "execution", execution_deadline,
+                track_progress(
+                    ws_url=ws_url,
+                    client_id=self.comfyui.client_id,
+                    prompt_id=prompt_id,
+                    callback=progress_callback,
+                    timeout=execution_deadline,
+                    base_url=base_url
+                )
             )
+            # Дедлайн генерации выводится из прогноза — прогноз учится только на самой генерации
+            self.task_queue.estimator.observe(task, asyncio.get_running_loop().time() - execution_started)
             
             # 6. Извлечение результата
             # Node 102 = Image Saver Simple
@@ -161,19 +357,34 @@ class TaskProcessor:
                 raise ValueError("No images in output")
             
             result_image = output_images[0]
+            for image in output_images:
+                self.artifacts.record(
+                    task.id, image.get("type", "output"), image["filename"], image.get("subfolder", "")
+                )
             
             # 7. Скачивание результата
             logger.debug(f"Downloading result: {result_image['filename']}")
-            image_data = await self.comfyui.get_image(
-                result_image["filename"],
-                result_image.get("subfolder", ""),
-                result_image.get("type", "output")
+            image_data = await self._run_phase(
+                "download", self.deadlines.download_seconds,
+                self.comfyui.get_image(
+                    result_image["filename"],
+                    result_image.get("subfolder", ""),
+                    result_image.get("type", "output")
+                )
             )
             
             # 8. Сохранение локально
-            result_path = Path(f"data/output/{task.id}_{result_image['filename']}")
-            result_path.parent.mkdir(parents=True, exist_ok=True)
-            result_path.write_bytes(image_data)
+            extension = Path(result_image["filename"]).suffix.lstrip(".") or "png"
+            if self.file_manager is not None:
+                result_path = self.file_manager.get_output_path(task.id, extension)
+            else:
+                result_path = Path(f"data/output/{task.id}_{result_image['filename']}")
+                result_path.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(result_path.write_bytes, image_data)
+            if self.file_manager is not None:
+                # Не вытеснять по квоте, пока результат не доставлен
+                self.file_manager.track(result_path, size=len(image_data), pinned=True)
+                result_pinned = True
             
             # 9. Отправка пользователю
             caption = (
@@ -183,41 +394,387 @@ class TaskProcessor:
                 f"🎲 Seed: {task.workflow_params.seed}\n"
                 f"⚙️ CFG: {task.workflow_params.cfg}"
             )
+            if task.degraded:
+                caption += f"\n\n{DEGRADED_NOTE}"
             
-            await self.bot.send_photo(
-                chat_id=task.chat_id,
-                photo=FSInputFile(result_path),
-                caption=caption
-            )
+            # Результат получает каждый чат, ожидающий эту задачу (включая дубликаты)
+            content_hash = FileIdCache.content_hash(image_data)
+            chats = {}
+            deferred = False
+            for chat_id, message_id in [(task.chat_id, task.message_id)] + list(task.followers):
+                batch = self.task_queue.batches.find_by_message(chat_id, message_id)
+                if batch is not None and self.batch_delivery != "photo":
+                    # Результат пакета уйдёт альбомом или архивом (см. report_batch_progress)
+                    batch.add_result(result_path, content_hash, task.degraded)
+                    self._schedule_batch_flush(batch)
+                    deferred = True
+                else:
+                    chats[chat_id] = None
+            for chat_id in chats:
+                await self._run_delivery(
+                    self.send_result(chat_id, result_path, content_hash, caption)
+                )
+            if deferred:
+                # Закрепление снимет доставка пакета (deliver_batch_results)
+                result_pinned = False
             
             # 10. Завершение задачи
             await self.task_queue.task_done(task, success=True, result_path=result_path)
             
+        except PhaseTimeoutError as e:
+            logger.error(f"Task {task.id[:8]} failed: {e}")
+            if e.phase == "execution" and prompt_id:
+                # Брошенная генерация заняла бы ComfyUI, и следующие задачи ждали бы за ней
+                await self._cancel_prompt(prompt_id)
+            if e.phase == "delivery":
+                # Генерация уже выполнена: результат остаётся на диске (без закрепления,
+                # до очистки по возрасту), чтобы его можно было отправить повторно
+                logger.warning(f"Result of task {task.id[:8]} kept for redelivery: {result_path}")
+                await self.task_queue.task_done(task, success=False, error=str(e))
+            else:
+                await self.task_queue.task_done(task, success=False, result_path=result_path, error=str(e))
+            
+            await self.notify_user(
+                task,
+                f"❌ Превышено время этапа «{e.phase}» ({e.seconds:.0f} сек)\n\nПопробуйте еще раз."
+            )
+            
         except Exception as e:
             # Обработка ошибки
             logger.exception(f"Task {task.id[:8]} failed: {e}")
-            await self.task_queue.task_done(task, success=False, error=str(e))
+            await self.task_queue.task_done(task, success=False, result_path=result_path, error=str(e))
             
             # Уведомление пользователя
             await self.notify_user(
                 task, 
                 f"❌ Ошибка при обработке:\n{str(e)}\n\nПопробуйте еще раз."
             )
+        
+        finally:
+            if result_pinned:
+                # Недоставленный результат не должен оставаться закреплённым навсегда
+                self.file_manager.unpin(result_path)
+            # Файлы задачи в ComfyUI больше не нужны (результат уже скачан)
+            try:
+                await self.artifacts.release(task.id)
+            except Exception as e:
+                logger.warning(f"Failed to release ComfyUI files of task {task.id[:8]}: {e}")
             
+    async def _cancel_prompt(self, prompt_id: str):
+        """Снять генерацию с ComfyUI после таймаута (ошибка только логируется)"""
+        try:
+            await self._run_phase("cancel", self.deadlines.queueing_seconds, self.comfyui.cancel_prompt(prompt_id))
+        except Exception as e:
+            logger.warning(f"Failed to cancel ComfyUI prompt {prompt_id}: {e}")
+    
+    async def send_result(self, chat_id: int, result_path: Path, content_hash: str, caption: str):
+        """
+        Отправка результата: по file_id, если это изображение уже загружалось
+        
+        Args:
+            chat_id: ID чата
+            result_path: Путь к файлу результата
+            content_hash: SHA-256 содержимого результата
+            caption: Подпись
+        """
+        file_id = self.file_id_cache.get(content_hash)
+        if file_id:
+            try:
+                await self.bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption)
+                return
+            except TelegramBadRequest as e:
+                # file_id больше не действителен — загрузить заново
+                logger.debug(f"Cached file_id rejected, re-uploading: {e}")
+                self.file_id_cache.discard(content_hash)
+        
+        message = await self.bot.send_photo(
+            chat_id=chat_id,
+            photo=self.input_file(result_path),
+            caption=caption
+        )
+        if message and message.photo:
+            self.file_id_cache.put(content_hash, message.photo[-1].file_id)
+    
+    def input_file(self, path: Path) -> Union[FSInputFile, str]:
+        """
+        Файл для отправки: локальному Bot API серверу — путь file:// (без загрузки), иначе FSInputFile
+        
+        Args:
+            path: Путь к файлу
+            
+        Returns:
+            Значение для параметров photo / media / document
+        """
+        if self.local_api:
+            return path.resolve().as_uri()
+        return FSInputFile(path)
+    
+    async def deliver_batch_results(self, batch: Batch):
+        """
+        Отправить накопленные результаты пакета альбомами по 10 фото или архивом
+        
+        Args:
+            batch: Пакет с накопленными результатами
+        """
+        results = batch.take_results()
+        try:
+            if self.batch_delivery == "zip":
+                await self._send_batch_archive(batch, results)
+            else:
+                for start in range(0, len(results), MEDIA_GROUP_SIZE):
+                    await self._send_media_group(batch, results[start:start + MEDIA_GROUP_SIZE])
+        finally:
+            if self.file_manager is not None:
+                for result_path, _, _ in results:
+                    # Тот же результат может ещё ждать в другом пакете (дубликат)
+                    if not self.task_queue.batches.holds_result(result_path):
+                        self.file_manager.unpin(result_path)
+    
+    @staticmethod
+    def _degraded_caption(results: List[Tuple[Path, str, bool]]) -> str:
+        """Пометка быстрого режима для подписи альбома или архива (пусто, если таких результатов нет)"""
+        degraded = sum(1 for _, _, is_degraded in results if is_degraded)
+        if not degraded:
+            return ""
+        if degraded == len(results):
+            return f"\n\n{DEGRADED_NOTE}"
+        return f"\n\n{DEGRADED_NOTE} ({degraded} из {len(results)})"
+    
+    async def _send_media_group(self, batch: Batch, results: List[Tuple[Path, str, bool]]):
+        """Отправить до 10 результатов одним sendMediaGroup (уже загруженные — по file_id)"""
+        first = batch.delivered + 1
+        batch.delivered += len(results)
+        caption = f"✅ Результаты {first}–{batch.delivered} из {batch.total}" + self._degraded_caption(results)
+        
+        if len(results) == 1:
+            # sendMediaGroup требует минимум 2 элемента
+            result_path, content_hash, _ = results[0]
+            caption = f"✅ Результат {first} из {batch.total}" + self._degraded_caption(results)
+            await self._run_delivery(
+                self.send_result(batch.chat_id, result_path, content_hash, caption)
+            )
+            return
+        
+        def build_media(use_cache: bool) -> List[InputMediaPhoto]:
+            media = []
+            for index, (result_path, content_hash, _) in enumerate(results):
+                file_id = self.file_id_cache.get(content_hash) if use_cache else None
+                media.append(InputMediaPhoto(
+                    media=file_id or self.input_file(result_path),
+                    caption=caption if index == 0 else None
+                ))
+            return media
+        
+        try:
+            messages = await self._run_delivery(
+                self.bot.send_media_group(chat_id=batch.chat_id, media=build_media(use_cache=True))
+            )
+        except TelegramBadRequest as e:
+            # Один из file_id больше не действителен — загрузить альбом заново
+            logger.debug(f"Media group with cached file_ids rejected, re-uploading: {e}")
+            for _, content_hash, _ in results:
+                self.file_id_cache.discard(content_hash)
+            messages = await self._run_delivery(
+                self.bot.send_media_group(chat_id=batch.chat_id, media=build_media(use_cache=False))
+            )
+        
+        for message, (_, content_hash, _) in zip(messages or [], results):
+            if message.photo:
+                self.file_id_cache.put(content_hash, message.photo[-1].file_id)
+    
+    async def _send_batch_archive(self, batch: Batch, results: List[Tuple[Path, str, bool]]):
+        """Упаковать результаты пакета в zip (частями до 45 МБ) и отправить документом"""
+        parts: List[List[Tuple[Path, str, bool]]] = [[]]
+        part_size = 0
+        for result in results:
+            size = result[0].stat().st_size
+            if parts[-1] and part_size + size > ARCHIVE_PART_BYTES:
+                parts.append([])
+                part_size = 0
+            parts[-1].append(result)
+            part_size += size
+        
+        for number, part in enumerate(parts, start=1):
+            # Дубликаты в пакете дают тот же файл — в архив он кладётся один раз
+            paths = list(dict.fromkeys(result_path for result_path, _, _ in part))
+            suffix = f"_{number}" if len(parts) > 1 else ""
+            archive_path = paths[0].parent / f"batch_{batch.id[:8]}{suffix}.zip"
+            # Изображения уже сжаты — без повторного сжатия, в отдельном потоке
+            await asyncio.to_thread(self._write_archive, archive_path, paths)
+            try:
+                caption = f"✅ Пакет обработан: {len(part)} из {batch.total}"
+                if len(parts) > 1:
+                    caption += f" (часть {number}/{len(parts)})"
+                caption += self._degraded_caption(part)
+                await self._run_delivery(
+                    self.bot.send_document(chat_id=batch.chat_id, document=self.input_file(archive_path), caption=caption)
+                )
+            finally:
+                archive_path.unlink(missing_ok=True)
+        batch.delivered += len(results)
+    
+    @staticmethod
+    def _write_archive(archive_path: Path, paths: List[Path]):
+        """Записать zip архив из файлов результатов"""
+        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for path in paths:
+                archive.write(path, arcname=path.name)
+    
+    async def refresh_positions(self):
+        """
+        Обновить статусные сообщения задач, чья позиция в очереди изменилась
+        
+        Первые позиции обновляются при каждом сдвиге, дальние — на каждой
+        десятой позиции, чтобы не тратить лимиты Telegram.
+        """
+        for task, position, eta in self.task_queue.snapshot():
+            if task.last_position == position:
+                continue
+            if position > 10 and position % 10 != 0:
+                continue
+            
+            task.last_position = position
+            await self.notify_user(
+                task,
+                f"⏳ <b>Задача в очереди</b>\n\n"
+                f"🆔 ID: <code>{task.id[:8]}</code>\n"
+                f"📍 Позиция: {position}\n"
+                f"⏱ Начало: {format_eta(eta)}"
+            )
+    
+    async def report_batch_progress(self, task: Task):
+        """
+        Учесть завершение или отмену задачи пакета и обновить сводное сообщение
+        
+        Сообщение правится не чаще BatchTracker.min_interval и только если
+        текст изменился; финальное состояние отправляется всегда.
+        
+        Args:
+            task: Завершённая или отменённая задача
+        """
+        batches = self.task_queue.batches
+        # Пакет задачи и пакеты, в которых эта задача — дубликат присланного фото
+        affected = []
+        own = batches.get(task.batch_id)
+        if own is not None:
+            affected.append(own)
+        for chat_id, message_id in task.followers:
+            batch = batches.find_by_message(chat_id, message_id)
+            if batch is not None:
+                affected.append(batch)
+        
+        for batch in affected:
+            batches.record(batch, task.status)
+        for batch in {batch.id: batch for batch in affected}.values():
+            await self._update_batch(batch)
+    
+    async def report_cancelled(self, task: Task, text: str):
+        """
+        Сообщить об отмене ожидающей задачи всем, кто ждёт её результат
+        
+        Присоединённые к задаче дубликаты (followers) отменяются вместе с
+        ней: их чаты получают уведомление, а пакеты, в которых они ждали
+        результат, учитывают их как отменённые и могут завершиться.
+        
+        Args:
+            task: Отменённая задача (TaskQueue.cancel_task / replace_pending)
+            text: Текст статусного сообщения самой задачи
+        """
+        batches = self.task_queue.batches
+        follower_text = (
+            f"🚫 <b>Задача отменена</b>\n\n"
+            f"🆔 ID: <code>{task.id[:8]}</code>\n\n"
+            f"Такая же задача, к которой был присоединён этот запрос, отменена. "
+            f"Отправьте фото ещё раз."
+        )
+        targets = [(task.chat_id, task.message_id, text)]
+        targets += [(chat_id, message_id, follower_text) for chat_id, message_id in task.followers]
+        for chat_id, message_id, message_text in targets:
+            # Сообщения пакетов обновляет report_batch_progress
+            if batches.find_by_message(chat_id, message_id) is None:
+                self.notifier.update(chat_id, message_id, message_text, parse_mode="HTML")
+        
+        await self.report_batch_progress(task)
+    
+    def _schedule_batch_flush(self, batch: Batch):
+        """Запустить таймер окна накопления альбома (один на пакет)"""
+        if self.batch_delivery == "zip" or batch.id in self._flush_timers:
+            return
+        self._flush_timers[batch.id] = asyncio.create_task(self._flush_after_window(batch))
+    
+    async def _flush_after_window(self, batch: Batch):
+        """
+        Отправить накопленные результаты пакета по истечении batch_flush_seconds
+        
+        Окно отсчитывается от первого неотправленного результата и не зависит
+        от того, когда завершится следующая задача пакета (она может долго
+        ждать в очереди или быть отменена).
+        
+        Args:
+            batch: Пакет с накопленными результатами
+        """
+        try:
+            while batch.results:
+                waited = (datetime.now() - batch.results_since).total_seconds()
+                if waited < self.batch_flush_seconds:
+                    await asyncio.sleep(self.batch_flush_seconds - waited)
+                    continue
+                await self.deliver_batch_results(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Failed to deliver results of batch {batch.id[:8]}: {e}")
+        finally:
+            self._flush_timers.pop(batch.id, None)
+    
+    async def _update_batch(self, batch: Batch):
+        """Отправить накопленные результаты (если пора) и обновить сообщение пакета"""
+        batches = self.task_queue.batches
+        if self.batch_delivery == "zip":
+            flush = batches.should_flush(batch, max_items=None, window=None)
+        else:
+            flush = batches.should_flush(batch, max_items=MEDIA_GROUP_SIZE, window=self.batch_flush_seconds)
+        if flush:
+            try:
+                await self.deliver_batch_results(batch)
+            except Exception as e:
+                logger.exception(f"Failed to deliver results of batch {batch.id[:8]}: {e}")
+        
+        if not batches.should_update(batch):
+            return
+        
+        text = batch.render(self.task_queue.batch_eta(batch.id))
+        if text != batch.last_text:
+            self.notifier.update(batch.chat_id, batch.message_id, text, parse_mode="HTML")
+            batch.last_text = text
+        batch.last_update = datetime.now()
+        
+        if batch.finished:
+            batches.remove(batch.id)
+            logger.info(
+                f"Batch {batch.id[:8]} finished: {batch.done} done, {batch.failed} failed, "
+                f"{batch.cancelled} cancelled"
+            )
+    
     async def notify_user(self, task: Task, text: str):
         """
         Отправка уведомления пользователю
         
+        Обновляется статусное сообщение задачи и сообщения всех
+        присоединённых к ней дубликатов. Сообщения активных пакетов (и самой
+        задачи пакета, и присоединённых к ней фото из пакета) не правятся —
+        их обновляет report_batch_progress.
+        
+        Правки только ставятся в ProgressNotifier и не ждут Telegram,
+        поэтому прогресс из WebSocket цикла не тормозит его чтение.
+        
         Args:
             task: Задача
             text: Текст сообщения
         """
-        try:
-            await self.bot.edit_message_text(
-                chat_id=task.chat_id,
-                message_id=task.message_id,
-                text=text
-            )
-        except Exception as e:
-            # Игнорируем ошибки обновления сообщения (например, сообщение не изменилось)
-            logger.debug(f"Failed to notify user: {e}")
+        batches = self.task_queue.batches
+        targets = [(task.chat_id, task.message_id)] + list(task.followers)
+        for chat_id, message_id in targets:
+            if batches.find_by_message(chat_id, message_id) is not None:
+                continue
+            self.notifier.update(chat_id, message_id, text)
@@ -0,0 +1,336 @@
+"""Планировщики порядка выдачи задач из очереди"""
+
+import bisect
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from src.models.task import Task, TaskLane
+
+
+class _SortedKeys:
+    """
+    Отсортированный список ключей, из которого извлекается только минимум
+
+    Извлечённые ключи не сдвигают список, а отсекаются смещением головы
+    (сжатие — когда голова занимает больше половины), поэтому извлечение —
+    амортизированное O(1). Вставка — бинарный поиск плюс сдвиг хвоста
+    списка за ключом: O(1) для ключа в конце (FIFO — ключи только растут),
+    иначе O(n) на memmove.
+    """
+
+    COMPACT_MIN = 1024
+
+    def __init__(self):
+        self._items: List[Tuple[int, ...]] = []
+        self._head = 0
+
+    def insert(self, key: Tuple[int, ...]) -> None:
+        """Вставить ключ с сохранением порядка"""
+        if not self or self._items[-1] < key:
+            self._items.append(key)
+        else:
+            bisect.insort(self._items, key, lo=self._head)
+
+    def popleft(self) -> Tuple[int, ...]:
+        """Извлечь наименьший ключ"""
+        key = self._items[self._head]
+        self._head += 1
+        if self._head >= self.COMPACT_MIN and self._head * 2 >= len(self._items):
+            del self._items[:self._head]
+            self._head = 0
+        return key
+
+    def rank(self, key: Tuple[int, ...]) -> int:
+        """Сколько ключей меньше key (O(log n))"""
+        return bisect.bisect_left(self._items, key, lo=self._head) - self._head
+
+    def __len__(self) -> int:
+        return len(self._items) - self._head
+
+    def __iter__(self) -> Iterator[Tuple[int, ...]]:
+        return islice(self._items, self._head, None)
+
+
+class FifoScheduler:
+    """
+    Глобальный FIFO — задачи выдаются строго в порядке поступления
+
+    Ожидающие задачи хранятся в отсортированном списке ключей, поэтому
+    позиция задачи по id вычисляется бинарным поиском за O(log n), а
+    извлечение следующей — за амортизированное O(1). Отменённые задачи не
+    удаляются из списка, а помечаются надгробием и пропускаются при
+    извлечении; ключ надгробия вставляется в свой отсортированный список
+    (для FIFO и при отмене последних задач — в конец, иначе со сдвигом хвоста).
+    """
+
+    def __init__(self):
+        self._keys = _SortedKeys()
+        self._tasks: Dict[Tuple[int, ...], Task] = {}
+        self._key_by_id: Dict[str, Tuple[int, ...]] = {}
+        self._seq = 0
+        
+        # Надгробия отменённых задач (ключи отсортированы для подсчёта позиций)
+        self._tombstones: Set[str] = set()
+        self._dead_keys = _SortedKeys()
+
+    def _make_key(self, task: Task) -> Tuple[int, ...]:
+        """Ключ сортировки новой задачи (меньше = раньше)"""
+        return (self._seq,)
+
+    def _on_pop(self, key: Tuple[int, ...], task: Task) -> None:
+        """Хук после извлечения задачи"""
+
+    def push(self, task: Task) -> None:
+        """Добавить задачу"""
+        self._seq += 1
+        key = self._make_key(task)
+        self._keys.insert(key)
+        self._tasks[key] = task
+        self._key_by_id[task.id] = key
+
+    def pop(self) -> Optional[Task]:
+        """Извлечь следующую задачу, пропуская отменённые (None если пусто)"""
+        while self._keys:
+            key = self._keys.popleft()
+            task = self._tasks.pop(key)
+            del self._key_by_id[task.id]
+            self._on_pop(key, task)
+            
+            if task.id in self._tombstones:
+                self._tombstones.remove(task.id)
+                self._dead_keys.popleft()
+                continue
+            return task
+        return None
+
+    def get(self, task_id: str) -> Optional[Task]:
+        """Ожидающая задача по id (None если не найдена или отменена)"""
+        key = self._key_by_id.get(task_id)
+        if key is None or task_id in self._tombstones:
+            return None
+        return self._tasks[key]
+
+    def remove(self, task_id: str) -> Optional[Task]:
+        """
+        Отменить ожидающую задачу (надгробие вместо удаления из списка ключей)
+
+        Args:
+            task_id: ID задачи
+
+        Returns:
+            Отменённая задача или None если задача не ожидает
+        """
+        task = self.get(task_id)
+        if task is None:
+            return None
+        self._tombstones.add(task_id)
+        self._dead_keys.insert(self._key_by_id[task_id])
+        return task
+
+    def qsize(self) -> int:
+        """Количество ожидающих задач"""
+        return len(self._keys) - len(self._tombstones)
+
+    def position(self, task_id: str) -> Optional[int]:
+        """
+        Позиция задачи в очереди
+
+        Args:
+            task_id: ID задачи
+
+        Returns:
+            Позиция (1-indexed) или None если задача не ожидает
+        """
+        key = self._key_by_id.get(task_id)
+        if key is None or task_id in self._tombstones:
+            return None
+        return self._keys.rank(key) - self._dead_keys.rank(key) + 1
+
+    def tasks(self) -> List[Task]:
+        """Ожидающие задачи в порядке выдачи"""
+        tasks = (self._tasks[key] for key in self._keys)
+        return [task for task in tasks if task.id not in self._tombstones]
+
+
+class FairScheduler(FifoScheduler):
+    """
+    Справедливая очередь между пользователями (start-time fair queueing)
+
+    Каждой задаче присваивается виртуальный тег начала:
+    max(виртуальное время, тег окончания предыдущей задачи пользователя).
+    Выдача идёт по возрастанию тега, при равенстве — по порядку поступления.
+    При единичной стоимости задач это round-robin по user_id: пакет
+    из 50 фото одного пользователя не отодвигает остальных на 50 позиций.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._virtual_time = 0
+        self._last_finish: Dict[int, int] = {}
+        self._pending: Dict[int, int] = {}
+
+    def _make_key(self, task: Task) -> Tuple[int, ...]:
+        start = max(self._virtual_time, self._last_finish.get(task.user_id, 0))
+        self._last_finish[task.user_id] = start + 1
+        self._pending[task.user_id] = self._pending.get(task.user_id, 0) + 1
+        return (start, self._seq)
+
+    def _on_pop(self, key: Tuple[int, ...], task: Task) -> None:
+        self._virtual_time = key[0]
+
+        # Пользователь без ожидающих задач больше не нужен в таблицах
+        self._pending[task.user_id] -= 1
+        if self._pending[task.user_id] <= 0:
+            del self._pending[task.user_id]
+            self._last_finish.pop(task.user_id, None)
+
+
+class LaneScheduler:
+    """
+    Две полосы очереди: интерактивная и пакетная
+
+    Интерактивная полоса обслуживается первой. Пакетная — когда интерактивная
+    пуста, а также гарантированно получает долю bulk_min_share выдач, пока
+    в обеих полосах есть задачи: после каждых interactive_burst интерактивных
+    задач выдаётся одна пакетная, поэтому пакеты не голодают полностью.
+    Внутри каждой полосы порядок определяется политикой (fifo / fair).
+    """
+
+    def __init__(self, policy: str = "fifo", bulk_min_share: float = 0.2):
+        """
+        Args:
+            policy: Политика внутри полосы: "fifo" или "fair"
+            bulk_min_share: Гарантированная доля пакетных задач (0 — строгий приоритет интерактивных)
+        """
+        self.interactive = create_scheduler(policy)
+        self.bulk = create_scheduler(policy)
+        
+        # Сколько интерактивных задач подряд можно выдать, пока ждёт пакетная
+        self.interactive_burst: Optional[int] = None
+        if bulk_min_share > 0:
+            share = min(bulk_min_share, 1.0)
+            self.interactive_burst = round((1 - share) / share)
+        self._streak = 0
+
+    def _lane(self, lane: TaskLane) -> FifoScheduler:
+        return self.bulk if lane == TaskLane.BULK else self.interactive
+
+    def _bulk_turn(self, streak: int, interactive_size: int, bulk_size: int) -> bool:
+        """Должна ли следующая выдача прийти из пакетной полосы"""
+        if not bulk_size:
+            return False
+        if not interactive_size:
+            return True
+        return self.interactive_burst is not None and streak >= self.interactive_burst
+
+    def push(self, task: Task) -> None:
+        """Добавить задачу в её полосу"""
+        self._lane(task.lane).push(task)
+
+    def get(self, task_id: str) -> Optional[Task]:
+        """Ожидающая задача по id"""
+        return self.interactive.get(task_id) or self.bulk.get(task_id)
+
+    def remove(self, task_id: str) -> Optional[Task]:
+        """Отменить ожидающую задачу в любой полосе"""
+        return self.interactive.remove(task_id) or self.bulk.remove(task_id)
+
+    def pop(self) -> Optional[Task]:
+        """Извлечь следующую задачу с учётом гарантии для пакетной полосы"""
+        if self._bulk_turn(self._streak, self.interactive.qsize(), self.bulk.qsize()):
+            self._streak = 0
+            return self.bulk.pop()
+        
+        if self.bulk.qsize():
+            self._streak += 1
+        return self.interactive.pop()
+
+    def qsize(self) -> int:
+        """Количество ожидающих задач в обеих полосах"""
+        return self.interactive.qsize() + self.bulk.qsize()
+
+    def lane_sizes(self) -> Dict[str, int]:
+        """Количество ожидающих задач по полосам"""
+        return {
+            TaskLane.INTERACTIVE.value: self.interactive.qsize(),
+            TaskLane.BULK.value: self.bulk.qsize(),
+        }
+
+    def position(self, task_id: str) -> Optional[int]:
+        """
+        Позиция задачи с учётом чередования полос
+
+        Args:
+            task_id: ID задачи
+
+        Returns:
+            Позиция (1-indexed) или None если задача не ожидает
+        """
+        burst = self.interactive_burst
+        
+        rank = self.interactive.position(task_id)
+        if rank is not None:
+            # Сколько пакетных задач будет выдано раньше этой
+            bulk_size = self.bulk.qsize()
+            if burst is None:
+                bulk_ahead = 0
+            elif burst == 0:
+                bulk_ahead = bulk_size
+            else:
+                bulk_ahead = min(bulk_size, (self._streak + rank - 1) // burst)
+            return rank + bulk_ahead
+        
+        rank = self.bulk.position(task_id)
+        if rank is not None:
+            # Сколько интерактивных задач будет выдано раньше этой
+            interactive_size = self.interactive.qsize()
+            if burst is None:
+                interactive_ahead = interactive_size
+            else:
+                interactive_ahead = min(interactive_size, max(0, burst - self._streak) + (rank - 1) * burst)
+            return rank + interactive_ahead
+        
+        return None
+
+    def tasks(self) -> List[Task]:
+        """Ожидающие задачи в порядке выдачи"""
+        interactive = self.interactive.tasks()
+        bulk = self.bulk.tasks()
+        ordered: List[Task] = []
+        streak = self._streak
+        i = b = 0
+        while i < len(interactive) or b < len(bulk):
+            if self._bulk_turn(streak, len(interactive) - i, len(bulk) - b):
+                ordered.append(bulk[b])
+                b += 1
+                streak = 0
+            else:
+                if b < len(bulk):
+                    streak += 1
+                ordered.append(interactive[i])
+                i += 1
+        return ordered
+
+
+SCHEDULERS = {
+    "fifo": FifoScheduler,
+    "fair": FairScheduler,
+}
+
+
+def create_scheduler(policy: str = "fifo") -> FifoScheduler:
+    """
+    Создать планировщик по имени политики
+
+    Args:
+        policy: "fifo" или "fair" (из config.queue.scheduling)
+
+    Returns:
+        Экземпляр планировщика
+
+    Raises:
+        ValueError: Неизвестная политика
+    """
+    if policy not in SCHEDULERS:
+        raise ValueError(f"Unknown queue scheduling policy: {policy} (expected one of {list(SCHEDULERS)})")
+    return SCHEDULERS[policy]()
@@ -0,0 +1,125 @@
+"""Статистика выполненных задач"""
+
+from collections import deque
+from datetime import datetime, date, timedelta
+from typing import Deque, Dict, List, Optional
+
+from src.models.task import Task, TaskStatus
+
+
+class CompletedRecord:
+    """Компактная запись о завершённой задаче"""
+
+    __slots__ = ("task_id", "user_id", "completed_at", "success", "duration")
+
+    def __init__(self, task_id: str, user_id: int, completed_at: datetime,
+                 success: bool, duration: float):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.completed_at = completed_at
+        self.success = success
+        self.duration = duration
+
+
+class QueueStats:
+    """
+    Статистика очереди с ограниченной памятью
+
+    История — кольцевой буфер фиксированного размера, счётчики, посуточные
+    агрегаты и скользящее часовое окно обновляются инкрементально при каждом
+    завершении, поэтому /status работает за O(1) независимо от времени работы бота.
+    """
+
+    def __init__(self, history_size: int = 1000, days_kept: int = 7):
+        """
+        Args:
+            history_size: Сколько последних завершённых задач хранить
+            days_kept: Сколько суток хранить агрегаты
+        """
+        self.history: Deque[CompletedRecord] = deque(maxlen=history_size)
+        self.days_kept = days_kept
+
+        self.total_completed = 0
+        self.total_successful = 0
+        
+        # Отказы в постановке по причинам (см. AdmissionRejected)
+        self.rejected: Dict[str, int] = {}
+        self.total_rejected = 0
+        
+        # Задачи, выполненные в режиме деградации
+        self.total_degraded = 0
+
+        # Агрегаты: [всего, успешно]
+        self._daily: Dict[date, List[int]] = {}
+        
+        # Время завершения задач за последние 60 минут (скользящее окно для /status)
+        self._last_hour: Deque[datetime] = deque()
+
+    def record(self, task: Task):
+        """
+        Учесть завершённую задачу
+
+        Args:
+            task: Задача со статусом COMPLETED или FAILED
+        """
+        completed_at = task.completed_at or datetime.now()
+        success = task.status == TaskStatus.COMPLETED
+        duration = (completed_at - task.started_at).total_seconds() if task.started_at else 0.0
+
+        self.history.append(CompletedRecord(task.id, task.user_id, completed_at, success, duration))
+
+        self.total_completed += 1
+        self.total_successful += int(success)
+        
+        self._last_hour.append(completed_at)
+        self._expire_last_hour()
+
+        day = completed_at.date()
+        if day not in self._daily:
+            self._daily[day] = [0, 0]
+            self._trim()
+        self._daily[day][0] += 1
+        self._daily[day][1] += int(success)
+
+    def record_rejection(self, reason: str):
+        """
+        Учесть отказ в постановке задачи в очередь
+        
+        Args:
+            reason: Причина отказа
+        """
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        self.total_rejected += 1
+
+    def record_degraded(self):
+        """Учесть задачу, выполненную в режиме деградации"""
+        self.total_degraded += 1
+
+    def _trim(self):
+        """Удалить устаревшие агрегаты (вызывается при открытии нового бакета)"""
+        now = datetime.now()
+        oldest_day = now.date() - timedelta(days=self.days_kept)
+        for day in [d for d in self._daily if d < oldest_day]:
+            del self._daily[day]
+
+    def completed_on(self, day: Optional[date] = None) -> int:
+        """Количество завершённых задач за сутки (по умолчанию — сегодня)"""
+        bucket = self._daily.get(day or datetime.now().date())
+        return bucket[0] if bucket else 0
+
+    def _expire_last_hour(self):
+        """Убрать из скользящего окна завершения старше часа (амортизированно O(1))"""
+        cutoff = datetime.now() - timedelta(hours=1)
+        while self._last_hour and self._last_hour[0] < cutoff:
+            self._last_hour.popleft()
+
+    def completed_last_hour(self) -> int:
+        """Количество завершённых задач за последние 60 минут"""
+        self._expire_last_hour()
+        return len(self._last_hour)
+
+    def success_rate(self) -> float:
+        """Процент успешных задач за всё время"""
+        if not self.total_completed:
+            return 0.0
+        return round(self.total_successful / self.total_completed * 100, 1)
@@ -1,41 +1,225 @@
 import asyncio
-from typing import Optional, List, Dict
-from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Optional, List, Dict, Set, Tuple
+from datetime import datetime
 from pathlib import Path
 from loguru import logger
-from src.models.task import Task, TaskStatus
+from src.models.task import Task, TaskStatus, TaskLane
+from src.queue.scheduler import LaneScheduler
+from src.queue.task_store import TaskStore, TaskRow
+from src.queue.eta import ServiceTimeEstimator, get_input_megapixels
+from src.queue.stats import QueueStats
+from src.queue.admission import AdmissionController, AdmissionRejected
+from src.queue.dedupe import DedupeIndex, compute_fingerprint
+from src.queue.batch import BatchTracker
 
 
 class TaskQueue:
-    """FIFO очередь задач с async support"""
+    """Очередь задач с async support и настраиваемым порядком выдачи"""
     
-    def __init__(self, max_size: int = 100):
+    def __init__(self, max_size: int = 100, scheduling: str = "fifo",
+                 bulk_min_share: float = 0.2, store: Optional[TaskStore] = None,
+                 history_size: int = 1000, max_pending_per_user: int = 0,
+                 dedupe_window_seconds: int = 0, batch_status_interval: float = 5.0,
+                 input_opener: Optional[Callable[..., BinaryIO]] = None):
         """
         Инициализация очереди
         
         Args:
-            max_size: Максимальный размер очереди (из config.queue.max_size)
+            max_size: Максимальный размер очереди (из config.queue.max_size, <= 0 — без ограничения)
+            scheduling: Политика выдачи задач: "fifo" или "fair" (из config.queue.scheduling)
+            bulk_min_share: Гарантированная доля пакетных задач (из config.queue.bulk_min_share)
+            store: Персистентное хранилище задач (None — только в памяти)
+            history_size: Размер истории завершённых задач (из config.queue.history_size)
+            max_pending_per_user: Квота ожидающих задач на пользователя (из config.queue.max_pending_per_user, <= 0 — без ограничения)
+            dedupe_window_seconds: Окно дедупликации одинаковых задач (из config.queue.dedupe_window_seconds, 0 — выключено)
+            batch_status_interval: Минимальный интервал обновления статуса пакета (из config.queue.batch_status_interval_seconds)
+            input_opener: Функция открытия входных файлов задач (None — open; FileManager.open_input для фото в памяти)
         """
-        self.queue: asyncio.Queue[Task] = asyncio.Queue(maxsize=max_size)
+        self.queue = LaneScheduler(scheduling, bulk_min_share)
+        self.max_size = max_size
+        self.admission = AdmissionController(max_size, max_pending_per_user)
+        self.dedupe = DedupeIndex(dedupe_window_seconds)
+        self.batches = BatchTracker(batch_status_interval)
+        self.store = store
+        # Снимки изменённых задач, ожидающие записи в хранилище (пишутся в потоке)
+        self._unsaved: Dict[str, TaskRow] = {}
+        self._store_writer: Optional[asyncio.Task] = None
+        self.input_opener = input_opener or open
+        self.estimator = ServiceTimeEstimator(opener=self.input_opener)
+        self._backlog_seconds = 0.0  # Сумма оценок времени ожидающих задач
+        self._pending_by_user: Dict[int, Dict[str, Task]] = {}
         self.current_task: Optional[Task] = None
-        self.completed_tasks: List[Task] = []
+        self.stats = QueueStats(history_size=history_size)
+        self.completed_tasks = self.stats.history  # Кольцевой буфер CompletedRecord
         self._lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(self._lock)
+        self._release_hooks: List[Callable[[Task], None]] = []
+    
+    def add_release_hook(self, hook: Callable[[Task], None]):
+        """
+        Зарегистрировать обработчик окончания жизни задачи
+        
+        Вызывается, когда задача больше не будет обрабатываться: завершена,
+        отменена, присоединена к дубликату или отброшена при восстановлении.
+        
+        Args:
+            hook: Функция, принимающая задачу (например, FileManager.release_task)
+        """
+        self._release_hooks.append(hook)
+    
+    def _release(self, task: Task):
+        """Вызвать обработчики окончания жизни задачи"""
+        for hook in self._release_hooks:
+            try:
+                hook(task)
+            except Exception as e:
+                logger.error(f"Release hook failed for task {task.id[:8]}: {e}")
+    
+    async def _prepare(self, tasks: List[Task]):
+        """
+        Прочитать входные файлы задач до взятия блокировки (в потоке)
+        
+        Мегапиксели (для оценки времени в _push) и отпечаток дедупликации
+        кэшируются в задаче, поэтому под блокировкой файлы не открываются.
+        
+        Args:
+            tasks: Задачи для постановки или восстановления
+        """
+        def read_inputs():
+            for task in tasks:
+                get_input_megapixels(task, self.input_opener)
+                if self.dedupe.enabled and task.fingerprint is None:
+                    task.fingerprint = compute_fingerprint(task, self.input_opener)
+        
+        if any(task.input_megapixels is None or (self.dedupe.enabled and task.fingerprint is None) for task in tasks):
+            await asyncio.to_thread(read_inputs)
+    
+    def _push(self, task: Task):
+        """Поставить задачу в планировщик с оценкой времени обработки (мегапиксели — из _prepare)"""
+        task.estimated_seconds = self.estimator.estimate(task)
+        self._backlog_seconds += task.estimated_seconds
+        self._pending_by_user.setdefault(task.user_id, {})[task.id] = task
+        self.queue.push(task)
+    
+    def _forget(self, task: Task):
+        """Убрать задачу из учёта ожидающих (после выдачи или отмены)"""
+        self._backlog_seconds = max(self._backlog_seconds - task.estimated_seconds, 0.0)
+        user_tasks = self._pending_by_user.get(task.user_id)
+        if user_tasks is not None:
+            user_tasks.pop(task.id, None)
+            if not user_tasks:
+                del self._pending_by_user[task.user_id]
         
     async def add_task(self, task: Task) -> int:
         """
         Добавление задачи в очередь
         
+        Если такая же задача уже ожидает или выполняется (в пределах окна
+        дедупликации), новая задача не ставится: её сообщение добавляется
+        в followers существующей, а в task.duplicate_of записывается её ID.
+        
         Args:
             task: Задача для добавления
             
         Returns:
-            Позиция в очереди (1-indexed)
+            Позиция в очереди (1-indexed; для дубликата — позиция исходной задачи, 0 если она уже выполняется)
             
         Raises:
-            asyncio.QueueFull: Если очередь переполнена
+            AdmissionRejected: Очередь или квота пользователя заполнены
+            
+        Не ожидает освобождения места: при перегрузке отказ возвращается сразу.
         """
-        await self.queue.put(task)
-        position = self.queue.qsize()
+        await self._prepare([task])
+        
+        async with self._lock:
+            position = self._admit(task)
+            self._not_empty.notify()
+        if task.duplicate_of:
+            # Результат придёт от исходной задачи, входной файл дубликата не нужен
+            self._release(task)
+        return position
+    
+    async def add_tasks(self, tasks: List[Task]) -> Tuple[List[int], Optional[AdmissionRejected]]:
+        """
+        Пакетное добавление задач за одно взятие блокировки
+        
+        Задачи принимаются по порядку до первого отказа допуска; остальные
+        не ставятся.
+        
+        Args:
+            tasks: Задачи для добавления
+            
+        Returns:
+            Tuple (positions, rejection):
+                - positions: Позиции принятых задач (первые len(positions) задач списка)
+                - rejection: Отказ, остановивший постановку, или None если приняты все
+        """
+        await self._prepare(tasks)
+        
+        positions = []
+        rejection = None
+        async with self._lock:
+            for task in tasks:
+                try:
+                    positions.append(self._admit(task))
+                except AdmissionRejected as e:
+                    rejection = e
+                    break
+            if positions:
+                self._not_empty.notify(len(positions))
+        
+        for task in tasks[:len(positions)]:
+            if task.duplicate_of:
+                self._release(task)
+        
+        logger.info(f"Bulk enqueue: {len(positions)}/{len(tasks)} tasks added")
+        return positions, rejection
+    
+    def _admit(self, task: Task) -> int:
+        """
+        Дедупликация, контроль допуска и постановка задачи (под блокировкой)
+        
+        Args:
+            task: Задача для добавления
+            
+        Returns:
+            Позиция в очереди (см. add_task)
+            
+        Raises:
+            AdmissionRejected: Очередь или квота пользователя заполнены
+        """
+        original = self.dedupe.find(task.fingerprint)
+        if original is not None:
+            batch = self.batches.get(task.batch_id)
+            if batch is not None:
+                # Фото пакета учитывается в его k/N; результат придёт в пакет (см. BatchTracker.find_by_message)
+                batch.total += 1
+            original.followers.append((task.chat_id, task.message_id))
+            task.duplicate_of = original.id
+            self._persist(original)
+            logger.info(f"Task {task.id[:8]} is a duplicate of {original.id[:8]}, attached")
+            return self.queue.position(original.id) or 0
+        
+        try:
+            self.admission.check(self, task)
+        except AdmissionRejected as e:
+            self.stats.record_rejection(e.reason)
+            logger.warning(
+                f"Task {task.id[:8]} of user {task.user_id} rejected: {e.reason}, "
+                f"retry after {e.retry_after:.0f}s"
+            )
+            raise
+        
+        self._push(task)
+        self.dedupe.register(task)
+        position = self.queue.position(task.id)
+        task.last_position = position
+        self._persist(task)
+        
+        batch = self.batches.get(task.batch_id)
+        if batch is not None:
+            batch.total += 1
+        
         logger.info(f"Task {task.id[:8]} added to queue, position: {position}")
         return position
         
@@ -46,13 +230,329 @@ class TaskQueue:
         Returns:
             Следующая задача из очереди
         """
-        task = await self.queue.get()
-        async with self._lock:
+        async with self._not_empty:
+            await self._not_empty.wait_for(lambda: self.queue.qsize() > 0)
+            task = self.queue.pop()
+            self._forget(task)
             task.status = TaskStatus.PROCESSING
             task.started_at = datetime.now()
+            task.attempts += 1
             self.current_task = task
+            self._persist(task)
         logger.info(f"Task {task.id[:8]} started processing")
         return task
+    
+    async def cancel_task(self, task_id: str, user_id: Optional[int] = None) -> Optional[Task]:
+        """
+        Отмена ожидающей задачи по id (задача помечается надгробием
+        и будет пропущена при выдаче, очередь не перестраивается)
+        
+        Args:
+            task_id: Полный ID задачи
+            user_id: Если указан — отменяются только задачи этого пользователя
+            
+        Returns:
+            Отменённая задача или None если задача не ожидает в очереди
+        """
+        async with self._lock:
+            task = self.queue.get(task_id)
+            if task is None or (user_id is not None and task.user_id != user_id):
+                return None
+            self._cancel(task)
+        
+        self._release(task)
+        logger.info(f"Task {task.id[:8]} cancelled")
+        return task
+    
+    def _cancel(self, task: Task):
+        """Снять ожидающую задачу с очереди (под блокировкой)"""
+        self.queue.remove(task.id)
+        self._forget(task)
+        self.dedupe.discard(task)
+        task.status = TaskStatus.CANCELLED
+        task.completed_at = datetime.now()
+        self._persist(task)
+    
+    async def replace_pending(self, task: Task) -> Tuple[int, List[Task]]:
+        """
+        Поставить задачу, отменив ожидающие интерактивные задачи её пользователя
+        
+        Отмена и постановка выполняются за одно взятие блокировки: если
+        новой задаче отказано в допуске, прежние задачи остаются в очереди.
+        
+        Args:
+            task: Новая задача
+            
+        Returns:
+            Tuple (position, superseded):
+                - position: Позиция новой задачи (см. add_task)
+                - superseded: Отменённые задачи пользователя
+                
+        Raises:
+            AdmissionRejected: Очередь или квота пользователя заполнены (ничего не отменено)
+        """
+        await self._prepare([task])
+        
+        async with self._lock:
+            superseded = [
+                pending for pending in self.find_user_tasks(task.user_id)
+                if pending.lane == TaskLane.INTERACTIVE
+            ]
+            # Отменённые задачи освобождают место и в очереди, и в квоте
+            # пользователя: допуск откажет, только если отменять было нечего
+            for pending in superseded:
+                self._cancel(pending)
+            position = self._admit(task)
+            self._not_empty.notify()
+        
+        for pending in superseded:
+            self._release(pending)
+        if task.duplicate_of:
+            self._release(task)
+        
+        if superseded:
+            logger.info(f"Superseded {len(superseded)} pending tasks of user {task.user_id}")
+        return position, superseded
+    
+    def find_user_tasks(self, user_id: int) -> List[Task]:
+        """
+        Ожидающие задачи пользователя
+        
+        Args:
+            user_id: ID пользователя
+            
+        Returns:
+            Задачи в порядке постановки
+        """
+        return list(self._pending_by_user.get(user_id, {}).values())
+    
+    def find_user_task(self, user_id: int, short_id: Optional[str] = None) -> Optional[Task]:
+        """
+        Поиск ожидающей задачи пользователя
+        
+        Args:
+            user_id: ID пользователя
+            short_id: Префикс ID задачи (как показывается в сообщениях); None — последняя задача
+            
+        Returns:
+            Найденная задача или None
+        """
+        tasks = self.find_user_tasks(user_id)
+        if short_id is None:
+            return tasks[-1] if tasks else None
+        for task in tasks:
+            if task.id.startswith(short_id):
+                return task
+        return None
+    
+    async def restore(self, max_attempts: int = 2,
+                      on_restore: Optional[Callable[[Task], None]] = None) -> List[Task]:
+        """
+        Восстановление незавершённых задач из хранилища после рестарта
+        
+        PENDING задачи возвращаются в очередь как есть. Задачи, прерванные
+        во время обработки (PROCESSING), запускаются повторно, пока число
+        попыток не превысит max_attempts, иначе помечаются FAILED.
+        Пакеты /batch пересоздаются по восстановленным задачам, чтобы их
+        результаты и статус по-прежнему шли в общее сообщение пакета.
+        
+        Args:
+            max_attempts: Максимальное количество запусков одной задачи
+            on_restore: Вызывается для каждой возвращённой задачи до освобождения
+                отброшенных (например, FileManager.acquire для счётчиков ссылок)
+            
+        Returns:
+            Список задач, возвращённых в очередь
+        """
+        if not self.store:
+            return []
+        
+        tasks = await asyncio.to_thread(self.store.load_unfinished)
+        await self._prepare(tasks)
+        
+        restored = []
+        dropped = []
+        async with self._lock:
+            for task in tasks:
+                if task.status == TaskStatus.PROCESSING:
+                    if task.attempts >= max_attempts:
+                        task.status = TaskStatus.FAILED
+                        task.completed_at = datetime.now()
+                        task.error = f"Interrupted by restart after {task.attempts} attempts"
+                        self._persist(task)
+                        logger.warning(f"Task {task.id[:8]} dropped: {task.error}")
+                        dropped.append(task)
+                        continue
+                    task.status = TaskStatus.PENDING
+                    task.started_at = None
+                    self._persist(task)
+                    logger.info(f"Task {task.id[:8]} was interrupted, retrying (attempt {task.attempts + 1})")
+                
+                self._push(task)
+                self.dedupe.register(task)
+                restored.append(task)
+                if task.batch_id:
+                    self.batches.restore(task.batch_id, task.chat_id, task.message_id).total += 1
+                if on_restore:
+                    on_restore(task)
+            
+            # Фото пакета, присоединённые к задаче как дубликаты
+            for task in restored:
+                for chat_id, message_id in task.followers:
+                    batch = self.batches.find_by_message(chat_id, message_id)
+                    if batch is not None:
+                        batch.total += 1
+            
+            if restored:
+                self._not_empty.notify(len(restored))
+        
+        for task in dropped:
+            self._release(task)
+        
+        if restored:
+            logger.info(f"Restored {len(restored)} tasks from store")
+        return restored
+    
+    def _persist(self, task: Task):
+        """
+        Запланировать сохранение состояния задачи в хранилище (если настроено)
+        
+        Снимок делается сразу, а запись в SQLite — в фоне пачкой из потока,
+        поэтому вызов под блокировкой очереди не ждёт диска.
+        """
+        if not self.store:
+            return
+        try:
+            self._unsaved[task.id] = self.store.serialize(task)
+        except Exception as e:
+            logger.error(f"Failed to persist task {task.id[:8]}: {e}")
+            return
+        if self._store_writer is None or self._store_writer.done():
+            self._store_writer = asyncio.create_task(self._write_store())
+    
+    async def _write_store(self):
+        """Записывать накопленные снимки задач, пока они есть (один писатель — порядок сохраняется)"""
+        while self._unsaved:
+            rows = list(self._unsaved.values())
+            self._unsaved.clear()
+            try:
+                await asyncio.to_thread(self.store.save_rows, rows)
+            except Exception as e:
+                logger.error(f"Failed to persist {len(rows)} tasks: {e}")
+    
+    async def flush_store(self):
+        """Дождаться записи всех изменений задач в хранилище (перед закрытием)"""
+        while self._store_writer is not None and not self._store_writer.done():
+            await self._store_writer
+    
+    async def purge_finished(self, max_age_hours: int = 24) -> int:
+        """
+        Удалить из хранилища старые завершённые задачи (в потоке)
+        
+        Args:
+            max_age_hours: Максимальный возраст завершённой задачи в часах
+            
+        Returns:
+            Количество удалённых записей
+        """
+        if not self.store:
+            return 0
+        purged = await asyncio.to_thread(self.store.purge_finished, max_age_hours)
+        if purged:
+            logger.info(f"Purged {purged} finished tasks from store")
+        return purged
+    
+    def live_inputs(self) -> Set[str]:
+        """
+        Входные файлы ожидающих и выполняемой задач
+        
+        Ссылки на остальные входы держат только FSM состояния диалогов
+        (см. FileManager.cleanup_old_files).
+        
+        Returns:
+            Множество путей (str)
+        """
+        paths = {
+            str(task.image_path)
+            for user_tasks in self._pending_by_user.values()
+            for task in user_tasks.values()
+            if task.image_path
+        }
+        if self.current_task is not None and self.current_task.image_path:
+            paths.add(str(self.current_task.image_path))
+        return paths
+    
+    def get_position(self, task_id: str) -> Optional[int]:
+        """
+        Текущая позиция ожидающей задачи
+        
+        Args:
+            task_id: ID задачи
+            
+        Returns:
+            Позиция в очереди (1-indexed) или None если задача не ожидает
+        """
+        return self.queue.position(task_id)
+    
+    def current_remaining(self) -> float:
+        """Оценка оставшегося времени текущей задачи"""
+        task = self.current_task
+        if not task or not task.started_at:
+            return 0.0
+        elapsed = (datetime.now() - task.started_at).total_seconds()
+        return max(task.estimated_seconds - elapsed, 0.0)
+    
+    def predicted_wait(self) -> float:
+        """Прогноз ожидания новой задачи: остаток текущей плюс все ожидающие"""
+        return self.current_remaining() + self._backlog_seconds
+    
+    def get_eta(self, task_id: str) -> Optional[float]:
+        """
+        Оценка времени до начала обработки задачи
+        
+        Args:
+            task_id: ID задачи
+            
+        Returns:
+            Секунды до начала обработки или None если задача не ожидает
+        """
+        position = self.queue.position(task_id)
+        if position is None:
+            return None
+        ahead = self.queue.tasks()[:position - 1]
+        return self.current_remaining() + sum(t.estimated_seconds for t in ahead)
+    
+    def batch_eta(self, batch_id: str) -> Optional[float]:
+        """
+        Оценка времени до завершения всех ожидающих задач пакета
+        
+        Args:
+            batch_id: ID пакета
+            
+        Returns:
+            Секунды до завершения последней задачи пакета или None если задач пакета в очереди нет
+        """
+        finish = None
+        for task, _, wait in self.snapshot():
+            if task.batch_id == batch_id:
+                finish = wait + task.estimated_seconds
+        if finish is None and self.current_task and self.current_task.batch_id == batch_id:
+            finish = self.current_remaining()
+        return finish
+    
+    def snapshot(self) -> List[Tuple[Task, int, float]]:
+        """
+        Позиции и ETA всех ожидающих задач за один проход
+        
+        Returns:
+            Список (задача, позиция, секунды до начала обработки) в порядке выдачи
+        """
+        result = []
+        wait = self.current_remaining()
+        for position, task in enumerate(self.queue.tasks(), 1):
+            result.append((task, position, wait))
+            wait += task.estimated_seconds
+        return result
         
     async def task_done(self, task: Task, success: bool = True, 
                        result_path: Optional[Path] = None, error: Optional[str] = None):
@@ -62,7 +562,7 @@ class TaskQueue:
         Args:
             task: Завершенная задача
             success: Успешно ли завершена
-            result_path: Путь к результату (если успешно)
+            result_path: Путь к результату (при неудаче — если он уже был сохранён)
             error: Сообщение об ошибке (если неудачно)
         """
         async with self._lock:
@@ -70,10 +570,12 @@ class TaskQueue:
             task.status = TaskStatus.COMPLETED if success else TaskStatus.FAILED
             task.result_path = result_path
             task.error = error
-            
-            self.completed_tasks.append(task)
+            self._persist(task)
+            self.stats.record(task)
+            self.dedupe.discard(task)
             self.current_task = None
-            self.queue.task_done()
+        
+        self._release(task)
             
         if success:
             logger.success(f"Task {task.id[:8]} completed successfully")
@@ -82,43 +584,20 @@ class TaskQueue:
             
     def get_status(self) -> Dict:
         """
-        Получение статуса очереди
+        Получение статуса очереди (O(1))
         
         Returns:
             Dict с информацией о состоянии очереди
         """
         return {
             "queue_size": self.queue.qsize(),
+            "lane_sizes": self.queue.lane_sizes(),
+            "estimated_wait": self.predicted_wait(),
             "current_task_id": self.current_task.id[:8] if self.current_task else None,
-            "completed_today": len([
-                t for t in self.completed_tasks 
-                if t.completed_at and t.completed_at.date() == datetime.now().date()
-            ]),
-            "total_completed": len(self.completed_tasks),
-            "success_rate": self._calculate_success_rate()
+            "completed_today": self.stats.completed_on(),
+            "completed_last_hour": self.stats.completed_last_hour(),
+            "total_completed": self.stats.total_completed,
+            "success_rate": self.stats.success_rate(),
+            "rejected_total": self.stats.total_rejected,
+            "degraded_total": self.stats.total_degraded
         }
-        
-    def _calculate_success_rate(self) -> float:
-        """Рассчитать процент успешных задач"""
-        if not self.completed_tasks:
-            return 0.0
-        successful = sum(1 for t in self.completed_tasks if t.status == TaskStatus.COMPLETED)
-        return (successful / len(self.completed_tasks)) * 100
-        
-    async def clear_old_completed(self, max_age_hours: int = 24):
-        """
-        Очистка старых завершенных задач из памяти
-        
-        Args:
-            max_age_hours: Максимальный возраст задачи в часах
-        """
-        async with self._lock:
-            cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-            before_count = len(self.completed_tasks)
-            self.completed_tasks = [
-                t for t in self.completed_tasks 
-                if t.completed_at and t.completed_at > cutoff_time
-            ]
-            removed = before_count - len(self.completed_tasks)
-            if removed > 0:
-                logger.info(f"Cleared {removed} old completed tasks from memory")
@@ -0,0 +1,152 @@
+"""Персистентное хранилище задач очереди (SQLite)"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from loguru import logger
+
+from src.models.task import Task, TaskStatus
+
+
+# Строка таблицы tasks: (id, status, created_at, completed_at, payload)
+TaskRow = Tuple[str, str, str, Optional[str], str]
+
+
+class TaskStore:
+    """
+    Хранилище задач в SQLite (WAL)
+
+    Изменения задач записываются пачками upsert в одной транзакции.
+    WAL с synchronous=NORMAL не делает fsync на каждый коммит. Запись
+    выполняется из потока (см. TaskQueue._write_store), поэтому
+    соединение разделяется потоками под блокировкой.
+    """
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: Путь к файлу базы (из config.data_dir)
+        """
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                completed_at TEXT,
+                payload TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)")
+
+        logger.info(f"TaskStore initialized: {db_path}")
+
+    @staticmethod
+    def serialize(task: Task) -> TaskRow:
+        """
+        Снимок задачи для записи (делается в event loop, пока задачу никто не меняет)
+
+        Args:
+            task: Задача
+
+        Returns:
+            Строка таблицы tasks
+        """
+        return (
+            task.id,
+            task.status.value,
+            task.created_at.isoformat(),
+            task.completed_at.isoformat() if task.completed_at else None,
+            json.dumps(task.to_dict(), ensure_ascii=False),
+        )
+
+    def save(self, task: Task):
+        """
+        Сохранить задачу (вставка или обновление статуса)
+
+        Args:
+            task: Задача
+        """
+        self.save_rows([self.serialize(task)])
+
+    def save_rows(self, rows: List[TaskRow]):
+        """
+        Сохранить снимки задач одной транзакцией (можно вызывать из потока)
+
+        Args:
+            rows: Строки из serialize, в порядке изменений
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO tasks (id, status, created_at, completed_at, payload)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        status = excluded.status,
+                        completed_at = excluded.completed_at,
+                        payload = excluded.payload
+                    """,
+                    rows
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def load_unfinished(self) -> List[Task]:
+        """
+        Загрузить незавершённые задачи (PENDING и PROCESSING)
+
+        Returns:
+            Задачи в порядке создания
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM tasks WHERE status IN (?, ?) ORDER BY created_at",
+                (TaskStatus.PENDING.value, TaskStatus.PROCESSING.value)
+            ).fetchall()
+
+        tasks = []
+        for (payload,) in rows:
+            try:
+                tasks.append(Task.from_dict(json.loads(payload)))
+            except Exception as e:
+                logger.error(f"Failed to restore task from store: {e}")
+        return tasks
+
+    def purge_finished(self, max_age_hours: int = 24) -> int:
+        """
+        Удалить старые завершённые задачи
+
+        Args:
+            max_age_hours: Максимальный возраст завершённой задачи в часах
+
+        Returns:
+            Количество удалённых записей
+        """
+        cutoff = (datetime.now() - timedelta(hours=max_age_hours)).isoformat()
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?, ?) AND completed_at < ?",
+                (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value, cutoff)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        """Закрыть соединение с базой"""
+        with self._lock:
+            self._conn.close()
+        logger.info("TaskStore closed")
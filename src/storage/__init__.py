@@ -1,5 +1,7 @@
 """Storage модуль"""
 
 from src.storage.file_manager import FileManager
+from src.storage.file_id_cache import FileIdCache
+from src.storage.storage_index import StorageIndex
 
-__all__ = ["FileManager"]
+__all__ = ["FileManager", "FileIdCache", "StorageIndex"]
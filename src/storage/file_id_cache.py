@@ -0,0 +1,68 @@
+"""Кэш Telegram file_id для повторной отправки результатов"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+
+class FileIdCache:
+    """
+    LRU кэш: SHA-256 содержимого файла -> file_id в Telegram
+
+    После первой загрузки фото Telegram возвращает file_id; повторные
+    отправки того же изображения (дубликаты, несколько ожидающих чатов)
+    ссылаются на него вместо повторной загрузки байтов.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        """
+        Args:
+            max_size: Максимальное количество записей (из config.storage.file_id_cache_size)
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        """SHA-256 содержимого файла"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, content_hash: str) -> Optional[str]:
+        """
+        Найти file_id по хэшу содержимого
+
+        Args:
+            content_hash: SHA-256 файла
+
+        Returns:
+            file_id или None
+        """
+        file_id = self._entries.get(content_hash)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(content_hash)
+        self.hits += 1
+        return file_id
+
+    def put(self, content_hash: str, file_id: str):
+        """
+        Запомнить file_id (самые давно использованные записи вытесняются)
+
+        Args:
+            content_hash: SHA-256 файла
+            file_id: file_id, возвращённый Telegram
+        """
+        self._entries[content_hash] = file_id
+        self._entries.move_to_end(content_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, content_hash: str):
+        """Удалить запись (например, если Telegram отверг file_id)"""
+        self._entries.pop(content_hash, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
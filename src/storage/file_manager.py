@@ -1,32 +1,103 @@
 """Управление файлами бота"""
 
 import asyncio
+import hashlib
+import io
+import os
+import shutil
+import threading
+import uuid
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional
+from tempfile import SpooledTemporaryFile
+from typing import Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
 from loguru import logger
 from aiogram import Bot
 
+from src.models.task import Task
+from src.storage.storage_index import StorageIndex
+
+
+# Сколько записей директории обрабатывается в потоке за один проход очистки
+CLEANUP_CHUNK_SIZE = 500
+
+
+class _HashingWriter:
+    """Обёртка файла, считающая SHA-256 записываемых данных (хэш во время скачивания)"""
+    
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self._hash = hashlib.sha256()
+    
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        return self.file.write(data)
+    
+    def flush(self):
+        self.file.flush()
+    
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
 
 class FileManager:
     """Управление файлами бота"""
     
-    def __init__(self, data_dir: Path):
+    def __init__(self, data_dir: Path, in_memory_inputs: bool = False,
+                 spool_max_mb: float = 8, retain_inputs: bool = True,
+                 max_concurrent_downloads: int = 4, local_api: bool = False,
+                 quotas_mb: Optional[Dict[str, float]] = None, keep_results: bool = True):
         """
         Args:
             data_dir: Базовая директория для данных (из config.data_dir)
+            in_memory_inputs: Держать входные фото в памяти (из config.storage.in_memory_inputs)
+            spool_max_mb: Размер буфера в памяти, сверх которого он сбрасывается во временный файл
+            retain_inputs: Сохранять копию входного фото в data/input (в фоне, если in_memory_inputs)
+            max_concurrent_downloads: Одновременных скачиваний в download_files (из config.storage.max_concurrent_downloads)
+            local_api: Бот работает через локальный Bot API сервер (из config.telegram.api_local)
+            quotas_mb: Квоты областей {"input": МБ, "output": МБ, "temp": МБ} (из config.storage.quota_mb, 0 — без ограничения)
+            keep_results: Сохранять результаты после доставки (из config.storage.keep_results)
         """
         self.data_dir = data_dir
         self.input_dir = data_dir / "input"
         self.output_dir = data_dir / "output"
         self.temp_dir = data_dir / "temp"
         
+        self.in_memory_inputs = in_memory_inputs
+        self.spool_max_bytes = int(spool_max_mb * 1024 * 1024)
+        self.retain_inputs = retain_inputs
+        
+        # Входные фото в памяти: путь -> (буфер, время загрузки)
+        self._buffers: Dict[str, Tuple[SpooledTemporaryFile, datetime]] = {}
+        # Буферы читаются и из event loop, и из потоков (compute_fingerprint), а
+        # одно фото может разделяться задачами: seek + read выполняются атомарно
+        self._buffer_lock = threading.Lock()
+        self._background_writes: Set[asyncio.Task] = set()
+        self._download_semaphore = asyncio.Semaphore(max(max_concurrent_downloads, 1))
+        self.local_api = local_api
+        
         self._cleanup_task: Optional[asyncio.Task] = None
         
         # Создать директории если не существуют
         for dir_path in [self.input_dir, self.output_dir, self.temp_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
         
+        # Индекс файлов по областям: статистика за O(1) и LRU вытеснение по квотам
+        self._areas = {"input": self.input_dir, "output": self.output_dir, "temp": self.temp_dir}
+        self._area_dirs = {directory.resolve(): area for area, directory in self._areas.items()}
+        quotas_mb = quotas_mb or {}
+        self.index = StorageIndex({area: int(quotas_mb.get(area, 0) * 1024 * 1024) for area in self._areas})
+        self._evicting: Set[str] = set()
+        
+        self.keep_results = keep_results
+        # Результаты завершённых задач, которые удаляются сразу после доставки (unpin)
+        self._release_on_unpin: Set[str] = set()
+        
+        # Входные файлы хранятся по хэшу содержимого; счётчик ссылок живых задач
+        self._refs: Dict[str, int] = {}
+        # Взятие ссылки и проверка перед вытеснением (в потоке) не должны пересекаться
+        self._refs_lock = threading.Lock()
+        
         logger.info(f"FileManager initialized with data_dir: {data_dir}")
     
     async def download_file(self, bot: Bot, file_id: str, 
@@ -42,19 +113,387 @@ class FileManager:
             
         Returns:
             Путь к скачанному файлу
+            
+        Файл хранится по SHA-256 содержимого (input/ab/cd/<sha256>.<ext>),
+        хэш считается во время скачивания. Одно и то же фото, отправленное
+        повторно или переславшееся между пользователями, хранится один раз;
+        каждый вызов добавляет ссылку, которую снимает release_task.
+        
+        При in_memory_inputs файл остаётся в буфере (SpooledTemporaryFile),
+        а возвращаемый путь служит ключом для read_input / open_input; на диск
+        копия пишется в фоне, только если включён retain_inputs.
         """
         file = await bot.get_file(file_id)
         
-        # Уникальное имя файла
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{user_id}_{timestamp}_{file_id[:8]}.{extension}"
-        file_path = self.input_dir / filename
+        if self.local_api and not self.in_memory_inputs:
+            # Локальный Bot API сервер отдаёт путь к файлу на этой же машине
+            local_path = Path(bot.session.api.wrap_local_file.to_local(file.file_path))
+            file_path = self.content_path(await asyncio.to_thread(self._hash_file, local_path), extension)
+            # Ссылка берётся до проверки существования: вытеснение пропускает используемые файлы
+            self.acquire(file_path)
+            try:
+                if file_path.exists():
+                    # Продлить срок хранения (см. ниже)
+                    await asyncio.to_thread(os.utime, file_path)
+                else:
+                    await asyncio.to_thread(self._link_local_file, local_path, file_path)
+                    logger.debug(f"Linked local file: {local_path} -> {file_path}")
+            except BaseException:
+                self.discard_input(file_path)
+                raise
+            self.track(file_path, pinned=True)
+            return file_path
+        
+        # Скачать, считая хэш на лету
+        writer = _HashingWriter(SpooledTemporaryFile(max_size=self.spool_max_bytes, dir=self.temp_dir))
+        await bot.download_file(file.file_path, writer, seek=False)
+        buffer = writer.file
+        file_path = self.content_path(writer.hexdigest(), extension)
+        
+        if not self.in_memory_inputs:
+            # Закреплён до release_task; ссылка берётся до проверки существования,
+            # чтобы вытеснение по квоте не удалило уже сохранённое то же фото
+            self.acquire(file_path)
+            try:
+                if file_path.exists():
+                    # Продлить срок хранения: возраст для очистки отсчитывается от последнего использования
+                    await asyncio.to_thread(os.utime, file_path)
+                    logger.debug(f"Input already stored: {file_path.name} (user {user_id})")
+                else:
+                    await asyncio.to_thread(self._store_buffer, buffer, file_path)
+                    logger.debug(f"Downloaded file: {file_path}")
+            except BaseException:
+                self.discard_input(file_path)
+                raise
+            finally:
+                buffer.close()
+            self.track(file_path, pinned=True)
+            return file_path
+        
+        if str(file_path) in self._buffers:
+            buffer.close()  # То же фото уже в памяти
+        else:
+            self._buffers[str(file_path)] = (buffer, datetime.now())
+            logger.debug(f"Downloaded file into memory: {file_path.name} ({buffer.tell()} bytes)")
+            if self.retain_inputs and not file_path.exists():
+                self._run_in_background(self._write_retained(file_path, self.read_input(file_path)))
+        
+        return self.acquire(file_path)
+    
+    def content_path(self, digest: str, extension: str) -> Path:
+        """
+        Путь входного файла по хэшу содержимого
+        
+        Двухуровневое шардирование (input/ab/cd/...) не даёт директориям
+        разрастаться до десятков тысяч записей.
+        
+        Args:
+            digest: SHA-256 содержимого (hex)
+            extension: Расширение файла
+            
+        Returns:
+            Путь в data/input
+        """
+        return self.input_dir / digest[:2] / digest[2:4] / f"{digest}.{extension}"
+    
+    def acquire(self, path: Path) -> Path:
+        """
+        Добавить ссылку живой задачи на входной файл
         
-        # Скачать
-        await bot.download_file(file.file_path, file_path)
-        logger.debug(f"Downloaded file: {file_path}")
+        Args:
+            path: Путь, возвращённый download_file (также для задач, восстановленных после рестарта)
+            
+        Returns:
+            Тот же путь
+        """
+        with self._refs_lock:
+            self._refs[str(path)] = self._refs.get(str(path), 0) + 1
+            self.index.pin(path)
+        self.track(path, pinned=True)
+        return path
+    
+    def discard_input(self, path: Path):
+        """
+        Снять ссылку задачи на входной файл; последняя ссылка освобождает и удаляет его
+        
+        Args:
+            path: Путь, возвращённый download_file
+        """
+        key = str(path)
+        with self._refs_lock:
+            refs = self._refs.pop(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+                return
+        self.release_input(path)
+        self._discard_file(path)
+    
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        """SHA-256 файла (выполняется в потоке)"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _store_buffer(buffer: BinaryIO, path: Path):
+        """Атомарно записать содержимое буфера в файл (выполняется в потоке)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        buffer.seek(0)
+        with open(temp_path, "wb") as f:
+            shutil.copyfileobj(buffer, f)
+        os.replace(temp_path, path)
+    
+    async def _write_retained(self, file_path: Path, data: bytes):
+        """Записать копию входного фото на диск (задача обрабатывается из буфера в памяти)"""
+        await asyncio.to_thread(self._store_buffer, io.BytesIO(data), file_path)
+        # Копия нужна ожидающей задаче для восстановления после рестарта — не вытеснять, пока есть ссылки
+        self.track(file_path, size=len(data), pinned=self._refs.get(str(file_path), 0) > 0)
+    
+    def _run_in_background(self, coro):
+        """Запустить фоновую задачу, сохранив ссылку на неё до завершения"""
+        task = asyncio.create_task(coro)
+        self._background_writes.add(task)
+        task.add_done_callback(self._background_writes.discard)
+    
+    def _area(self, path: Path) -> Optional[str]:
+        """Область хранилища, которой принадлежит файл (None — вне data_dir)"""
+        resolved = Path(path).resolve()
+        for directory, area in self._area_dirs.items():
+            if resolved.is_relative_to(directory):
+                return area
+        return None
+    
+    def track(self, path: Path, size: Optional[int] = None, pinned: bool = False):
+        """
+        Учесть записанный файл в индексе хранилища
         
-        return file_path
+        Если область превысила квоту, в фоне удаляются давно не
+        использованные файлы.
+        
+        Args:
+            path: Путь к файлу в data/input, data/output или data/temp
+            size: Размер файла (None — узнать через stat)
+            pinned: Не вытеснять файл до unpin / release_input
+        """
+        area = self._area(path)
+        if area is None:
+            return
+        if size is None:
+            try:
+                size = Path(path).stat().st_size
+            except OSError:
+                return
+        
+        self.index.add(area, path, size)
+        if pinned:
+            self.index.pin(path)
+        if self.index.over_quota(area) and area not in self._evicting:
+            self._evicting.add(area)
+            self._run_in_background(self._evict(area))
+    
+    def unpin(self, path: Path):
+        """Разрешить вытеснение файла (входное фото загружено, результат отправлен)"""
+        self.index.unpin(path)
+        if str(path) in self._release_on_unpin:
+            self._release_on_unpin.discard(str(path))
+            self._discard_file(path)
+    
+    def release_task(self, task: Task):
+        """
+        Освободить файлы задачи, которая больше не будет обрабатываться
+        
+        Хук жизненного цикла TaskQueue (add_release_hook): входное фото
+        удаляется, когда на него не остаётся ссылок живых задач, результат —
+        если keep_results выключен; результат,
+        ещё ожидающий доставки (альбом или архив пакета), удаляется после неё.
+        Периодическая очистка остаётся только для забытых файлов.
+        
+        Args:
+            task: Завершённая, отменённая или присоединённая к дубликату задача
+        """
+        if task.image_path:
+            self.discard_input(task.image_path)
+        
+        if task.result_path and not self.keep_results:
+            if self.index.is_pinned(task.result_path):
+                self._release_on_unpin.add(str(task.result_path))
+            else:
+                self._discard_file(task.result_path)
+    
+    def _discard_file(self, path: Path):
+        """Убрать файл из индекса и удалить его в фоне (только внутри data_dir)"""
+        area = self._area(path)
+        if area is None:
+            return
+        self.index.remove(area, path)
+        # Повторная проверка ссылок в потоке: то же фото могли успеть скачать снова
+        self._run_in_background(asyncio.to_thread(self._unlink_unused, [Path(path)]))
+    
+    async def _evict(self, area: str):
+        """Удалить давно не использованные файлы области, пока она не уложится в квоту"""
+        try:
+            candidates = self.index.eviction_candidates(area)
+            if not candidates:
+                if self.index.over_quota(area):
+                    logger.warning(f"Storage quota exceeded for {area}, but all files are in use")
+                return
+            
+            evicted = await asyncio.to_thread(self._unlink_unused, candidates)
+            freed = sum(self.index.remove(area, path) for path in evicted)
+            logger.info(
+                f"Storage quota exceeded for {area}: evicted {len(evicted)} files "
+                f"({freed / (1024 * 1024):.1f} MB)"
+            )
+        finally:
+            self._evicting.discard(area)
+    
+    def _unlink_unused(self, paths: List[Path]) -> List[Path]:
+        """
+        Удалить кандидатов на вытеснение, которые всё ещё не используются (выполняется в потоке)
+        
+        Между выбором кандидатов и удалением то же фото могло быть скачано
+        снова (acquire), поэтому закрепление и ссылки проверяются заново
+        под той же блокировкой, что и в acquire.
+        
+        Returns:
+            Фактически удалённые файлы
+        """
+        evicted = []
+        for path in paths:
+            with self._refs_lock:
+                if self._refs.get(str(path)) or self.index.is_pinned(path):
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Failed to evict {path}: {e}")
+                    continue
+            evicted.append(path)
+        return evicted
+    
+    async def build_index(self):
+        """
+        Построить индекс хранилища по содержимому директорий (при запуске)
+        
+        Квоты здесь не применяются: входы задач, восстанавливаемых после
+        рестарта, ещё не закреплены. После TaskQueue.restore нужно вызвать
+        enforce_quotas.
+        """
+        for area, directory in self._areas.items():
+            for path, size, _ in await asyncio.to_thread(StorageIndex.scan, directory):
+                self.index.add(area, Path(path), size)
+            files, total = self.index.usage(area)
+            logger.debug(f"Storage index: {area} — {files} files, {total / (1024 * 1024):.1f} MB")
+    
+    async def enforce_quotas(self):
+        """Вытеснить файлы областей, превысивших квоту (при запуске, после восстановления задач)"""
+        for area in self._areas:
+            if self.index.over_quota(area) and area not in self._evicting:
+                self._evicting.add(area)
+                await self._evict(area)
+    
+    @staticmethod
+    def _link_local_file(source: Path, destination: Path):
+        """Жёсткая ссылка на файл локального Bot API сервера (копия, если это другая ФС)"""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copyfile(source, destination)
+    
+    async def download_files(self, bot: Bot, files: List[Tuple[str, str]],
+                             user_id: int) -> List[Optional[Path]]:
+        """
+        Параллельное скачивание нескольких файлов (например, альбома)
+        
+        Args:
+            bot: Telegram Bot instance
+            files: Список (file_id, extension)
+            user_id: ID пользователя
+            
+        Returns:
+            Пути в том же порядке; None для файлов, которые не удалось скачать
+        """
+        async def download(file_id: str, extension: str) -> Optional[Path]:
+            async with self._download_semaphore:
+                try:
+                    return await self.download_file(bot, file_id, user_id, extension)
+                except Exception as e:
+                    logger.error(f"Failed to download file {file_id[:16]}...: {e}")
+                    return None
+        
+        return list(await asyncio.gather(*(download(file_id, ext) for file_id, ext in files)))
+    
+    def read_input(self, path: Path) -> bytes:
+        """
+        Содержимое входного файла — из буфера в памяти или с диска
+        
+        Args:
+            path: Путь, возвращённый download_file
+            
+        Returns:
+            Байты файла
+            
+        Raises:
+            FileNotFoundError: Файла нет ни в памяти, ни на диске
+        """
+        entry = self._buffers.get(str(path))
+        if entry is not None:
+            buffer = entry[0]
+            with self._buffer_lock:
+                # Буфер мог быть освобождён, пока чтение ждало в потоке
+                if not buffer.closed:
+                    buffer.seek(0)
+                    return buffer.read()
+        
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Image not found: {path}")
+        area = self._area(path)
+        if area is not None:
+            self.index.touch(area, path)
+        return Path(path).read_bytes()
+    
+    def open_input(self, path: Path, mode: str = "rb") -> BinaryIO:
+        """
+        Открыть входной файл на чтение (совместимо с open для PIL и хэширования)
+        
+        Args:
+            path: Путь, возвращённый download_file
+            mode: Режим (поддерживается только чтение)
+            
+        Returns:
+            Бинарный file-like объект
+        """
+        if str(path) in self._buffers:
+            return io.BytesIO(self.read_input(path))
+        return open(path, mode)
+    
+    def release_input(self, path: Path):
+        """
+        Освободить буфер входного файла (после загрузки в ComfyUI)
+        
+        Args:
+            path: Путь, возвращённый download_file
+            
+        Пока на файл ссылаются другие задачи (то же фото), он остаётся в памяти.
+        Копия на диске остаётся закреплённой, пока на неё есть ссылки: она нужна
+        задаче для повтора после рестарта; закрепление снимает discard_input.
+        """
+        refs = self._refs.get(str(path), 0)
+        if refs > 1:
+            return
+        entry = self._buffers.pop(str(path), None)
+        if entry is not None:
+            with self._buffer_lock:
+                entry[0].close()
+        if refs == 0:
+            self.index.unpin(path)
     
     def get_output_path(self, task_id: str, extension: str = "png") -> Path:
         """
@@ -72,66 +511,162 @@ class FileManager:
         return self.output_dir / filename
     
     async def cleanup_old_files(self, max_age_hours: int = 24, 
-                               keep_results: bool = True):
+                               keep_results: bool = True,
+                               live_inputs: Optional[Set[str]] = None) -> Dict[str, Dict[str, int]]:
         """
         Очистка старых файлов
         
         Args:
             max_age_hours: Максимальный возраст файла в часах (из config.storage.cleanup_after_hours)
             keep_results: Сохранять результаты (из config.storage.keep_results)
+            live_inputs: Входные файлы ожидающих и выполняемой задач (TaskQueue.live_inputs);
+                ссылки на остальные старые входы держат только брошенные диалоги
+                (FSM состояние) и истекают. None — сохранять все файлы со ссылками
+            
+        Returns:
+            Dict по директориям: {"input": {"files": N, "bytes": M}, ...}
+            (плюс "buffers" — освобождённые буферы входных фото в памяти)
         """
         cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-        total_removed = 0
+        report: Dict[str, Dict[str, int]] = {}
         
-        # Очистить input и temp
-        for directory in [self.input_dir, self.temp_dir]:
-            removed = await self._cleanup_directory(directory, cutoff_time)
-            total_removed += removed
+        # Буферы задач, которые так и не были обработаны (отменены, дубликаты)
+        # Буферы задач, ещё ждущих в очереди, не трогаются: копии на диске может не быть
+        stale = [
+            p for p, (_, created_at) in self._buffers.items()
+            if created_at < cutoff_time and (live_inputs is None or p not in live_inputs)
+        ]
+        for path in stale:
+            if live_inputs is not None:
+                # Буфер брошенного диалога: его ссылки истекают (см. _cleanup_chunk)
+                with self._refs_lock:
+                    self._refs.pop(path, None)
+            self.release_input(Path(path))
+        report["buffers"] = {"files": len(stale), "bytes": 0}
         
-        # Очистить output если keep_results=False
+        # Ссылки, которые не истекают: задачи в очереди и свежие буферы в памяти
+        # (копия на диске могла остаться старой, а диалог с этим фото — только начаться)
+        keep_refs = None
+        if live_inputs is not None:
+            keep_refs = set(live_inputs) | {p for p, (_, created_at) in self._buffers.items() if created_at >= cutoff_time}
+        
+        # Очистить input и temp, output — только если keep_results=False
+        directories = [("input", self.input_dir), ("temp", self.temp_dir)]
         if not keep_results:
-            removed = await self._cleanup_directory(self.output_dir, cutoff_time)
-            total_removed += removed
+            directories.append(("output", self.output_dir))
+        
+        for name, directory in directories:
+            removed, freed = await self._cleanup_directory(directory, cutoff_time, keep_refs)
+            report[name] = {"files": removed, "bytes": freed}
         
+        total_removed = sum(item["files"] for item in report.values())
         if total_removed > 0:
-            logger.info(f"Cleaned up {total_removed} old files")
+            total_freed = sum(item["bytes"] for item in report.values())
+            details = ", ".join(f"{name}: {item['files']}" for name, item in report.items() if item["files"])
+            logger.info(
+                f"Cleaned up {total_removed} old files ({details}), "
+                f"freed {total_freed / (1024 * 1024):.1f} MB"
+            )
+        
+        return report
     
-    async def _cleanup_directory(self, directory: Path, cutoff_time: datetime) -> int:
+    async def _cleanup_directory(self, directory: Path, cutoff_time: datetime,
+                                 keep_refs: Optional[Set[str]] = None) -> Tuple[int, int]:
         """
         Очистка одной директории
         
+        Обход (рекурсивный, см. StorageIndex.walk) идёт в отдельном потоке порциями по
+        CLEANUP_CHUNK_SIZE записей; между порциями управление возвращается
+        в event loop, поэтому даже большие директории не блокируют бота.
+        
         Args:
             directory: Путь к директории
             cutoff_time: Время отсечки (файлы старше удаляются)
+            keep_refs: Файлы, чьи ссылки сохраняются (см. _cleanup_chunk)
             
         Returns:
-            Количество удаленных файлов
+            Tuple (количество удалённых файлов, освобождено байт)
         """
+        if not directory.exists():
+            return 0, 0
+        
+        cutoff = cutoff_time.timestamp()
+        area = self._area_dirs[directory.resolve()]
         removed_count = 0
+        freed_bytes = 0
         
-        if not directory.exists():
-            return 0
+        entries = StorageIndex.walk(directory)
+        try:
+            while True:
+                removed, freed, exhausted = await asyncio.to_thread(
+                    self._cleanup_chunk, entries, cutoff, CLEANUP_CHUNK_SIZE, keep_refs
+                )
+                for path in removed:
+                    self.index.remove(area, Path(path))
+                removed_count += len(removed)
+                freed_bytes += freed
+                if exhausted:
+                    break
+                await asyncio.sleep(0)
+        finally:
+            entries.close()
         
-        for file_path in directory.iterdir():
-            if not file_path.is_file():
-                continue
+        return removed_count, freed_bytes
+    
+    def _cleanup_chunk(self, entries: Iterator[os.DirEntry], cutoff: float, limit: int,
+                       keep_refs: Optional[Set[str]] = None) -> Tuple[List[str], int, bool]:
+        """
+        Обработать до limit записей директории (выполняется в потоке)
+        
+        Возраст файла не означает, что он не нужен: повторно присланное фото
+        переиспользует старый файл с тем же хэшем. Файлы со ссылками живых
+        задач и закреплённые (входы ожидающих задач, неотправленные
+        результаты) пропускаются — проверка под той же блокировкой, что и
+        в acquire (см. _unlink_unused).
+        
+        Если задан keep_refs, ссылки на файлы вне него истекают: фото,
+        скачанное в диалог, который так и не стал задачей, удерживает ссылку
+        до _discard_state, а без истечения не удалилось бы до рестарта.
+        
+        Returns:
+            Tuple (удалённые пути, освобождено байт, директория пройдена до конца)
+        """
+        removed = []
+        freed = 0
+        for _ in range(limit):
+            entry = next(entries, None)
+            if entry is None:
+                return removed, freed, True
             
-            # Проверить возраст файла
             try:
-                file_mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
-                
-                if file_mtime < cutoff_time:
-                    file_path.unlink()
-                    removed_count += 1
-                    logger.debug(f"Removed old file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete {file_path}: {e}")
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime >= cutoff:
+                    continue
+                with self._refs_lock:
+                    if self._refs.get(entry.path):
+                        if keep_refs is None or entry.path in keep_refs:
+                            continue
+                        logger.info(f"Expired input references of an abandoned dialog: {entry.path}")
+                        self.index.unpin(Path(entry.path))
+                    elif self.index.is_pinned(Path(entry.path)):
+                        continue
+                    os.unlink(entry.path)
+                    self._refs.pop(entry.path, None)
+                removed.append(entry.path)
+                freed += stat.st_size
+                logger.debug(f"Removed old file: {entry.path}")
+            except OSError as e:
+                logger.warning(f"Failed to delete {entry.path}: {e}")
         
-        return removed_count
+        return removed, freed, False
     
     async def start_cleanup_task(self, interval_hours: int = 1, 
                                  max_age_hours: int = 24, 
-                                 keep_results: bool = True):
+                                 keep_results: bool = True,
+                                 on_cleanup: Optional[Callable[[], Awaitable]] = None,
+                                 live_inputs: Optional[Callable[[], Set[str]]] = None):
         """
         Запуск периодической очистки файлов
         
@@ -139,6 +674,8 @@ class FileManager:
             interval_hours: Интервал проверки в часах
             max_age_hours: Максимальный возраст файлов
             keep_results: Сохранять результаты
+            on_cleanup: Дополнительная очистка на каждом проходе (например, TaskQueue.purge_finished)
+            live_inputs: Входные файлы живых задач (TaskQueue.live_inputs, см. cleanup_old_files)
         """
         logger.info(
             f"Starting file cleanup task "
@@ -149,7 +686,11 @@ class FileManager:
             while True:
                 await asyncio.sleep(interval_hours * 3600)
                 try:
-                    await self.cleanup_old_files(max_age_hours, keep_results)
+                    await self.cleanup_old_files(
+                        max_age_hours, keep_results, live_inputs() if live_inputs else None
+                    )
+                    if on_cleanup is not None:
+                        await on_cleanup()
                 except Exception as e:
                     logger.error(f"Cleanup task error: {e}")
         
@@ -167,26 +708,18 @@ class FileManager:
         Получить статистику использования хранилища
         
         Returns:
-            Dict со статистикой по директориям
+            Dict со статистикой по директориям (из индекса, без обхода диска)
         """
         stats = {}
         
-        for name, directory in [
-            ("input", self.input_dir),
-            ("output", self.output_dir),
-            ("temp", self.temp_dir)
-        ]:
-            if not directory.exists():
-                stats[name] = {"files": 0, "size_mb": 0}
-                continue
-            
-            files = list(directory.iterdir())
-            file_count = len([f for f in files if f.is_file()])
-            total_size = sum(f.stat().st_size for f in files if f.is_file())
+        for name in self._areas:
+            file_count, total_size = self.index.usage(name)
+            quota = self.index.quotas[name]
             
             stats[name] = {
                 "files": file_count,
-                "size_mb": round(total_size / (1024 * 1024), 2)
+                "size_mb": round(total_size / (1024 * 1024), 2),
+                "quota_mb": round(quota / (1024 * 1024), 2) if quota else None
             }
         
         return stats
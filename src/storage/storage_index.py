@@ -0,0 +1,138 @@
+"""Индекс файлов хранилища с квотами и LRU вытеснением"""
+
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Set, Tuple
+
+
+class StorageIndex:
+    """
+    Учёт файлов по областям хранилища (input / output / temp)
+
+    Для каждой области хранится размер файлов в порядке последнего
+    обращения (LRU) и суммарный объём, поэтому статистика не требует
+    обхода директорий. Индекс обновляется при записи, чтении и удалении
+    файлов; при превышении квоты области кандидатами на удаление
+    становятся давно не использованные файлы, кроме закреплённых
+    (входные фото ожидающих задач, ещё не отправленные результаты).
+    """
+
+    def __init__(self, quotas: Dict[str, int]):
+        """
+        Args:
+            quotas: Квота в байтах для каждой области (0 — без ограничения)
+        """
+        self.quotas = quotas
+        self._files: Dict[str, "OrderedDict[str, int]"] = {area: OrderedDict() for area in quotas}
+        self._bytes: Dict[str, int] = {area: 0 for area in quotas}
+        self._pinned: Set[str] = set()
+
+    def add(self, area: str, path: Path, size: int):
+        """Учесть записанный файл (становится самым свежим)"""
+        key = str(path)
+        files = self._files[area]
+        self._bytes[area] += size - files.get(key, 0)
+        files[key] = size
+        files.move_to_end(key)
+
+    def touch(self, area: str, path: Path):
+        """Отметить обращение к файлу"""
+        files = self._files[area]
+        if str(path) in files:
+            files.move_to_end(str(path))
+
+    def remove(self, area: str, path: Path) -> int:
+        """
+        Убрать файл из индекса
+
+        Returns:
+            Размер файла (0 если не был учтён)
+        """
+        key = str(path)
+        size = self._files[area].pop(key, 0)
+        self._bytes[area] -= size
+        self._pinned.discard(key)
+        return size
+
+    def pin(self, path: Path):
+        """Запретить вытеснение файла"""
+        self._pinned.add(str(path))
+
+    def unpin(self, path: Path):
+        """Разрешить вытеснение файла"""
+        self._pinned.discard(str(path))
+
+    def is_pinned(self, path: Path) -> bool:
+        """Закреплён ли файл"""
+        return str(path) in self._pinned
+
+    def usage(self, area: str) -> Tuple[int, int]:
+        """Количество файлов и суммарный размер области (O(1))"""
+        return len(self._files[area]), self._bytes[area]
+
+    def over_quota(self, area: str) -> bool:
+        """Превышена ли квота области"""
+        quota = self.quotas.get(area, 0)
+        return quota > 0 and self._bytes[area] > quota
+
+    def eviction_candidates(self, area: str) -> List[Path]:
+        """
+        Файлы, удаление которых вернёт область в пределы квоты
+
+        Returns:
+            Пути от давно не использованных к свежим (закреплённые пропускаются)
+        """
+        if not self.over_quota(area):
+            return []
+
+        excess = self._bytes[area] - self.quotas[area]
+        candidates = []
+        for key, size in self._files[area].items():
+            if excess <= 0:
+                break
+            if key in self._pinned:
+                continue
+            candidates.append(Path(key))
+            excess -= size
+        return candidates
+
+    @staticmethod
+    def walk(directory: Path) -> Iterator[os.DirEntry]:
+        """
+        Рекурсивный обход файлов области (входные фото лежат в шардах input/ab/cd/)
+
+        Returns:
+            Генератор записей os.scandir (вызывать close(), если обход прерван)
+        """
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield from StorageIndex.walk(Path(entry.path))
+                        continue
+                except OSError:
+                    continue
+                yield entry
+
+    @staticmethod
+    def scan(directory: Path) -> List[Tuple[str, int, float]]:
+        """
+        Обход директории для первичного построения индекса (выполнять в потоке)
+
+        Returns:
+            Список (путь, размер, время последнего обращения) от старых к новым
+        """
+        if not directory.exists():
+            return []
+
+        found = []
+        for entry in StorageIndex.walk(directory):
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    found.append((entry.path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+            except OSError:
+                continue
+        found.sort(key=lambda item: item[2])
+        return found
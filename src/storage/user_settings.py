@@ -1,8 +1,10 @@
 """Хранение пользовательских настроек"""
 
+import asyncio
 import json
+import sqlite3
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set, Tuple
 from dataclasses import dataclass, asdict
 from loguru import logger
 
@@ -30,57 +32,150 @@ class UserSettings:
 
 
 class UserSettingsManager:
-    """Менеджер пользовательских настроек"""
+    """
+    Менеджер пользовательских настроек
     
-    def __init__(self, storage_path: Path):
+    Настройки читаются из кэша в памяти; на диске они хранятся в SQLite
+    (одна строка на пользователя, WAL). Изменения помечают пользователя
+    как изменённого, а запись выполняется пачкой через flush_delay секунд
+    в отдельном потоке одной транзакцией — стоимость записи не зависит от
+    числа пользователей, а сбой посреди записи не повреждает базу.
+    """
+    
+    def __init__(self, storage_path: Path, flush_delay: float = 1.0):
         """
         Args:
             storage_path: Путь к директории для хранения настроек
+            flush_delay: Задержка (сек) перед записью изменений (из config.storage.settings_flush_seconds)
         """
         self.storage_path = storage_path
         self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.storage_path / "user_settings.db"
+        # Прежний формат (весь словарь в одном JSON), импортируется при первом запуске
         self.settings_file = self.storage_path / "user_settings.json"
+        self.flush_delay = flush_delay
+        
+        # Запись идёт из потока flush, поэтому соединение не привязано к потоку
+        self._conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL
+            )
+            """
+        )
         
         # Загрузить существующие настройки
         self._settings_cache: Dict[int, UserSettings] = {}
+        self._dirty: Set[int] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
         self._load_all()
     
     def _load_all(self):
-        """Загрузить все настройки из файла"""
-        if not self.settings_file.exists():
-            logger.info("User settings file not found, creating new one")
-            self._save_all()
-            return
+        """Загрузить все настройки из базы (и импортировать прежний JSON файл)"""
+        try:
+            rows = self._conn.execute("SELECT user_id, payload FROM user_settings").fetchall()
+            for user_id, payload in rows:
+                self._settings_cache[user_id] = UserSettings.from_dict(json.loads(payload))
+        except Exception as e:
+            logger.error(f"Failed to load user settings: {e}")
+            self._settings_cache = {}
         
+        if self.settings_file.exists():
+            self._migrate_json()
+        
+        logger.info(f"Loaded settings for {len(self._settings_cache)} users")
+    
+    def _migrate_json(self):
+        """Перенести настройки из user_settings.json в базу"""
         try:
             with open(self.settings_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                
+            
             for user_id_str, settings_dict in data.items():
                 user_id = int(user_id_str)
-                self._settings_cache[user_id] = UserSettings.from_dict(settings_dict)
+                if user_id not in self._settings_cache:
+                    self._settings_cache[user_id] = UserSettings.from_dict(settings_dict)
+                    self._dirty.add(user_id)
             
-            logger.info(f"Loaded settings for {len(self._settings_cache)} users")
+            self._write(self._take_dirty())
+            self.settings_file.rename(self.settings_file.with_suffix(".json.migrated"))
+            logger.info(f"Migrated user settings from {self.settings_file.name}")
             
         except Exception as e:
-            logger.error(f"Failed to load user settings: {e}")
-            self._settings_cache = {}
+            logger.error(f"Failed to migrate user settings: {e}")
+    
+    def _take_dirty(self) -> List[Tuple[int, str]]:
+        """Снимок изменённых настроек для записи (сериализуется в event loop)"""
+        rows = [
+            (user_id, json.dumps(self._settings_cache[user_id].to_dict(), ensure_ascii=False))
+            for user_id in self._dirty
+        ]
+        self._dirty.clear()
+        return rows
     
-    def _save_all(self):
-        """Сохранить все настройки в файл"""
+    def _write(self, rows: List[Tuple[int, str]]):
+        """Записать настройки одной транзакцией (выполняется в потоке)"""
+        if not rows:
+            return
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                """
+                INSERT INTO user_settings (user_id, payload) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET payload = excluded.payload
+                """,
+                rows
+            )
+        logger.debug(f"Saved settings for {len(rows)} users")
+    
+    def _mark_dirty(self, user_id: int):
+        """Отметить изменение и запланировать отложенную запись"""
+        self._dirty.add(user_id)
+        if self._flush_handle is not None:
+            return
+        
         try:
-            data = {
-                str(user_id): settings.to_dict()
-                for user_id, settings in self._settings_cache.items()
-            }
-            
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            logger.debug(f"Saved settings for {len(self._settings_cache)} users")
-            
-        except Exception as e:
-            logger.error(f"Failed to save user settings: {e}")
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, тесты) — записать сразу
+            self._write(self._take_dirty())
+            return
+        
+        def start_flush():
+            self._flush_handle = None
+            self._flush_task = loop.create_task(self.flush())
+        
+        self._flush_handle = loop.call_later(self.flush_delay, start_flush)
+    
+    async def flush(self):
+        """Записать накопленные изменения в базу (в отдельном потоке)"""
+        async with self._flush_lock:
+            rows = self._take_dirty()
+            if not rows:
+                return
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                # Вернуть в очередь изменений — запишутся при следующем flush
+                self._dirty.update(user_id for user_id, _ in rows)
+                logger.error(f"Failed to save user settings: {e}")
+    
+    async def close(self):
+        """Записать оставшиеся изменения и закрыть базу"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        self._conn.close()
+        logger.info("User settings saved")
     
     def get_settings(self, user_id: int) -> UserSettings:
         """
@@ -93,8 +188,8 @@ class UserSettingsManager:
             UserSettings для данного пользователя
         """
         if user_id not in self._settings_cache:
+            # Настройки по умолчанию не записываются: они восстанавливаются при следующем обращении
             self._settings_cache[user_id] = UserSettings(user_id=user_id)
-            self._save_all()
             logger.info(f"Created default settings for user {user_id}")
         
         return self._settings_cache[user_id]
@@ -115,7 +210,7 @@ class UserSettingsManager:
                 logger.debug(f"Updated {key} for user {user_id}: {value}")
         
         self._settings_cache[user_id] = settings
-        self._save_all()
+        self._mark_dirty(user_id)
     
     def has_default_prompt(self, user_id: int) -> bool:
         """
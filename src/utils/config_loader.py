@@ -36,6 +36,13 @@ def load_config() -> Config:
         **{k: v for k, v in yaml_config.items() if k != "comfyui"}
     }
     
+    # Секрет webhook лучше держать в .env, а не в config.yaml
+    webhook_secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    if webhook_secret:
+        telegram = dict(config_data.get("telegram") or {})
+        telegram["webhook"] = {**(telegram.get("webhook") or {}), "secret_token": webhook_secret}
+        config_data["telegram"] = telegram
+    
     return Config(**config_data)
 
 
@@ -58,5 +65,8 @@ def _build_comfyui_config(yaml_comfyui: dict) -> ComfyUIConfig:
         venv=Path(comfyui_venv) if comfyui_venv else None,
         auto_start=auto_start,
         args=comfyui_args,
-        startup_timeout=int(yaml_comfyui.get("startup_timeout", 300))
+        startup_timeout=int(yaml_comfyui.get("startup_timeout", 300)),
+        upload_subfolder=yaml_comfyui.get("upload_subfolder", "telegram_bot"),
+        cleanup_hook=yaml_comfyui.get("cleanup_hook", ""),
+        cleanup_interval_minutes=float(yaml_comfyui.get("cleanup_interval_minutes", 60))
     )
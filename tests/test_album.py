@@ -0,0 +1,59 @@
+"""
+Тесты для приёма альбомов: AlbumCollector и параллельное скачивание FileManager
+"""
+import pytest
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+from src.bot.album import AlbumCollector
+from src.storage.file_manager import FileManager
+
+
+def album_message(message_id: int, group: str = "album1") -> MagicMock:
+    """Сообщение альбома"""
+    message = MagicMock()
+    message.message_id = message_id
+    message.media_group_id = group
+    message.chat.id = 1
+    return message
+
+
+@pytest.mark.asyncio
+async def test_album_collected_by_first_message():
+    """Тест: первое сообщение альбома получает все сообщения группы, остальные — None"""
+    collector = AlbumCollector(window=0.05)
+
+    async def arrive(message_id: int, delay: float):
+        await asyncio.sleep(delay)
+        return await collector.collect(album_message(message_id))
+
+    results = await asyncio.gather(arrive(1, 0), arrive(3, 0.02), arrive(2, 0.04))
+
+    assert [m.message_id for m in results[0]] == [1, 2, 3]
+    assert results[1] is None and results[2] is None
+
+
+@pytest.mark.asyncio
+async def test_download_files_runs_concurrently(tmp_path):
+    """Тест: альбом из 10 фото скачивается примерно за время одного скачивания"""
+    bot = AsyncMock()
+    bot.get_file.side_effect = lambda file_id: MagicMock(file_path=f"photos/{file_id}.jpg")
+
+    async def download_file(file_path, destination, **kwargs):
+        await asyncio.sleep(0.1)
+        if "bad" in file_path:
+            raise RuntimeError("download failed")
+        destination.write(file_path.encode())
+
+    bot.download_file = download_file
+    file_manager = FileManager(tmp_path, max_concurrent_downloads=10)
+    files = [(f"file_{i:02d}_id", "jpg") for i in range(9)] + [("bad_file_id", "jpg")]
+
+    started = time.monotonic()
+    paths = await file_manager.download_files(bot, files, user_id=1)
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.5
+    assert all(path.exists() for path in paths[:9])
+    assert len(set(paths[:9])) == 9
+    assert paths[9] is None
@@ -0,0 +1,41 @@
+"""
+Тесты для ComfyUIArtifacts
+"""
+import pytest
+from src.comfyui.artifacts import ComfyUIArtifacts
+
+
+@pytest.mark.asyncio
+async def test_local_artifacts_removed_on_release(tmp_path):
+    """Тест: у локального ComfyUI файлы задачи удаляются сразу после release"""
+    upload = tmp_path / "input" / "telegram_bot" / "task1.jpg"
+    output = tmp_path / "output" / "result_00001_.png"
+    other = tmp_path / "output" / "not_ours.png"
+    for path in (upload, output, other):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+
+    artifacts = ComfyUIArtifacts(comfyui_dir=tmp_path)
+    artifacts.record("task1", "input", "task1.jpg", "telegram_bot")
+    artifacts.record("task1", "output", "result_00001_.png")
+
+    await artifacts.release("task1")
+
+    assert not upload.exists() and not output.exists()
+    assert other.exists()
+
+
+@pytest.mark.asyncio
+async def test_remote_artifacts_passed_to_cleanup_hook(tmp_path):
+    """Тест: для удалённого ComfyUI пути передаются cleanup_hook построчно"""
+    listing = tmp_path / "listing.txt"
+    artifacts = ComfyUIArtifacts(cleanup_hook=f"cat > {listing}")
+    artifacts.record("task1", "input", "task1.jpg", "telegram_bot")
+    artifacts.record("task1", "output", "result_00001_.png")
+    await artifacts.release("task1")
+
+    removed = await artifacts.run_cleanup_hook()
+
+    assert removed == 2
+    assert listing.read_text().splitlines() == ["input/telegram_bot/task1.jpg", "output/result_00001_.png"]
+    assert await artifacts.run_cleanup_hook() == 0
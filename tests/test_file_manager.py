@@ -0,0 +1,360 @@
+"""
+Тесты для FileManager
+"""
+import pytest
+import asyncio
+import os
+import time
+from unittest.mock import AsyncMock, MagicMock
+from aiogram.client.telegram import TelegramAPIServer
+from src.models.task import Task, WorkflowParams
+from src.queue.task_queue import TaskQueue
+from src.storage.file_manager import FileManager
+
+
+def local_api_bot(server_file) -> MagicMock:
+    """Бот, работающий через локальный Bot API сервер (get_file возвращает путь на диске)"""
+    bot = MagicMock()
+    bot.session.api = TelegramAPIServer.from_base("http://127.0.0.1:8081", is_local=True)
+    bot.get_file = AsyncMock(return_value=MagicMock(file_path=str(server_file)))
+    bot.download_file = AsyncMock()
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_local_api_download_is_hardlinked(tmp_path):
+    """Тест: с локальным Bot API файл не качается по HTTP, а связывается жёсткой ссылкой"""
+    server_file = tmp_path / "server" / "documents" / "file_1.png"
+    server_file.parent.mkdir(parents=True)
+    server_file.write_bytes(b"large document")
+
+    bot = local_api_bot(server_file)
+    file_manager = FileManager(tmp_path / "data", local_api=True)
+
+    path = await file_manager.download_file(bot, "file_id_1", user_id=1, extension="png")
+
+    assert path.read_bytes() == b"large document"
+    assert path.stat().st_ino == server_file.stat().st_ino
+    bot.download_file.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cleanup_removes_old_files_in_chunks(tmp_path, monkeypatch):
+    """Тест: очистка порциями удаляет только старые файлы и сообщает, сколько удалено"""
+    monkeypatch.setattr("src.storage.file_manager.CLEANUP_CHUNK_SIZE", 7)
+    file_manager = FileManager(tmp_path)
+
+    old_time = time.time() - 48 * 3600
+    for i in range(20):
+        path = file_manager.input_dir / f"old_{i}.jpg"
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (old_time, old_time))
+    (file_manager.input_dir / "fresh.jpg").write_bytes(b"fresh")
+    await file_manager.build_index()
+
+    report = await file_manager.cleanup_old_files(max_age_hours=24)
+
+    assert report["input"] == {"files": 20, "bytes": 200}
+    assert [p.name for p in file_manager.input_dir.iterdir()] == ["fresh.jpg"]
+
+    stats = await file_manager.get_storage_stats()
+    assert stats["input"]["files"] == 1
+    assert file_manager.index.usage("input") == (1, 5)
+
+
+@pytest.mark.asyncio
+async def test_cleanup_skips_referenced_and_pinned_files(tmp_path):
+    """Тест: старый входной файл ожидающей задачи и неотправленный результат переживают очистку по возрасту"""
+    file_manager = FileManager(tmp_path, keep_results=False)
+    old_time = time.time() - 48 * 3600
+
+    referenced = file_manager.content_path("ab" * 32, "jpg")
+    unused = file_manager.content_path("cd" * 32, "jpg")
+    result = file_manager.output_dir / "result.png"
+    for path in (referenced, unused, result):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (old_time, old_time))
+    await file_manager.build_index()
+
+    file_manager.acquire(referenced)  # Повторно присланное фото в очереди
+    file_manager.track(result, size=10, pinned=True)  # Результат ещё не доставлен
+
+    report = await file_manager.cleanup_old_files(max_age_hours=24, keep_results=False)
+
+    assert referenced.exists() and result.exists()
+    assert not unused.exists()
+    assert report["input"] == {"files": 1, "bytes": 10}
+    assert report["output"] == {"files": 0, "bytes": 0}
+
+
+
+@pytest.mark.asyncio
+async def test_cleanup_expires_references_of_abandoned_dialogs(tmp_path):
+    """Тест: старое фото брошенного диалога удаляется, фото задачи в очереди — нет"""
+    file_manager = FileManager(tmp_path)
+    old_time = time.time() - 48 * 3600
+
+    abandoned = file_manager.content_path("ab" * 32, "jpg")
+    queued = file_manager.content_path("cd" * 32, "jpg")
+    for path in (abandoned, queued):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (old_time, old_time))
+        file_manager.acquire(path)
+
+    queue = TaskQueue()
+    await queue.add_task(Task(
+        user_id=1,
+        chat_id=1,
+        image_path=queued,
+        workflow_params=WorkflowParams(input_image=queued.name, positive_prompt="test")
+    ))
+
+    report = await file_manager.cleanup_old_files(max_age_hours=24, live_inputs=queue.live_inputs())
+
+    assert not abandoned.exists()
+    assert not file_manager.index.is_pinned(abandoned)
+    assert str(abandoned) not in file_manager._refs
+    assert queued.exists() and file_manager.index.is_pinned(queued)
+    assert report["input"] == {"files": 1, "bytes": 10}
+
+
+@pytest.mark.asyncio
+async def test_quota_evicts_least_recently_used(tmp_path):
+    """Тест: при превышении квоты удаляется давно не использованный файл, закреплённые сохраняются"""
+    file_manager = FileManager(tmp_path, quotas_mb={"input": 1500 / (1024 * 1024)})
+
+    def write(name: str, pinned: bool = False):
+        path = file_manager.input_dir / name
+        path.write_bytes(b"x" * 500)
+        file_manager.track(path, pinned=pinned)
+        return path
+
+    pinned = write("pinned.jpg", pinned=True)
+    first = write("first.jpg")
+    second = write("second.jpg")
+    file_manager.read_input(first)  # first теперь свежее second
+
+    write("third.jpg")
+    await asyncio.gather(*file_manager._background_writes)
+
+    assert pinned.exists() and first.exists()
+    assert not second.exists()
+    assert file_manager.index.usage("input") == (3, 1500)
+
+
+@pytest.mark.asyncio
+async def test_startup_quota_keeps_inputs_of_restored_tasks(tmp_path):
+    """Тест: квота, превышенная к рестарту, не вытесняет входы восстановленных задач"""
+    from src.queue.task_store import TaskStore
+
+    quotas = {"input": 1000 / (1024 * 1024)}
+    file_manager = FileManager(tmp_path / "data", quotas_mb=quotas)
+    store = TaskStore(tmp_path / "tasks.db")
+    queue = TaskQueue(store=store)
+    inputs = []
+    for i in range(2):
+        path = file_manager.input_dir / f"task_{i}.jpg"
+        path.write_bytes(b"x" * 500)
+        inputs.append(path)
+        await queue.add_task(Task(
+            user_id=i,
+            chat_id=i,
+            image_path=path,
+            workflow_params=WorkflowParams(input_image=path.name, positive_prompt="test")
+        ))
+    unused = file_manager.input_dir / "unused.jpg"
+    unused.write_bytes(b"x" * 500)
+    await queue.flush_store()
+    store.close()
+
+    # Новый процесс: порядок запуска как в main.py
+    store = TaskStore(tmp_path / "tasks.db")
+    file_manager = FileManager(tmp_path / "data", quotas_mb=quotas)
+    await file_manager.build_index()
+    assert all(path.exists() for path in inputs + [unused])
+
+    restored = await TaskQueue(store=store).restore(on_restore=lambda task: file_manager.acquire(task.image_path))
+    await file_manager.enforce_quotas()
+    await asyncio.gather(*file_manager._background_writes)
+    store.close()
+
+    assert len(restored) == 2
+    assert all(path.exists() for path in inputs)
+    assert not unused.exists()
+    assert file_manager.index.usage("input") == (2, 1000)
+
+
+@pytest.mark.asyncio
+async def test_release_hook_removes_task_artifacts(tmp_path):
+    """Тест: по завершении задачи вход удаляется сразу, результат — после доставки (keep_results=False)"""
+    file_manager = FileManager(tmp_path, keep_results=False)
+    queue = TaskQueue()
+    queue.add_release_hook(file_manager.release_task)
+
+    input_path = file_manager.input_dir / "input.jpg"
+    input_path.write_bytes(b"input")
+    file_manager.track(input_path, pinned=True)
+
+    await queue.add_task(Task(
+        user_id=1,
+        image_path=input_path,
+        workflow_params=WorkflowParams(input_image="input.jpg", positive_prompt="test")
+    ))
+    task = await queue.get_task()
+
+    result_path = file_manager.get_output_path(task.id)
+    result_path.write_bytes(b"result")
+    file_manager.track(result_path, pinned=True)  # Ожидает отправки альбомом пакета
+
+    await queue.task_done(task, success=True, result_path=result_path)
+    await asyncio.gather(*file_manager._background_writes)
+    assert not input_path.exists()
+    assert result_path.exists()
+
+    file_manager.unpin(result_path)
+    await asyncio.gather(*file_manager._background_writes)
+    assert not result_path.exists()
+    assert file_manager.index.usage("input") == (0, 0)
+    assert file_manager.index.usage("output") == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_same_content_stored_once(tmp_path):
+    """Тест: одинаковые фото хранятся один раз по хэшу и удаляются после освобождения последней задачи"""
+    bot = AsyncMock()
+    bot.get_file.side_effect = lambda file_id: MagicMock(file_path=f"photos/{file_id}.jpg")
+
+    async def download_file(file_path, destination, **kwargs):
+        destination.write(b"same photo")
+
+    bot.download_file = download_file
+    file_manager = FileManager(tmp_path)
+
+    first = await file_manager.download_file(bot, "file_id_1", user_id=1, extension="jpg")
+    second = await file_manager.download_file(bot, "file_id_2", user_id=2, extension="jpg")
+
+    assert first == second
+    assert first.relative_to(file_manager.input_dir).parts[:2] == (first.stem[:2], first.stem[2:4])
+    assert file_manager.index.usage("input") == (1, len(b"same photo"))
+
+    params = WorkflowParams(input_image=first.name, positive_prompt="test")
+    file_manager.release_task(Task(user_id=1, image_path=first, workflow_params=params))
+    await asyncio.gather(*file_manager._background_writes)
+    assert first.exists()
+    assert file_manager.index.is_pinned(first)
+
+    file_manager.release_task(Task(user_id=2, image_path=second, workflow_params=params))
+    await asyncio.gather(*file_manager._background_writes)
+    assert not first.exists()
+    assert file_manager.index.usage("input") == (0, 0)
+
+
+def test_eviction_skips_reacquired_file(tmp_path):
+    """Тест: файл, снова взятый задачей после выбора кандидатов на вытеснение, не удаляется"""
+    file_manager = FileManager(tmp_path)
+    path = file_manager.input_dir / "ab" / "cd" / "abcd.jpg"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"x" * 10)
+    file_manager.track(path)
+
+    file_manager.acquire(path)  # Параллельное скачивание того же фото
+
+    assert file_manager._unlink_unused([path]) == []
+    assert path.exists()
+
+
+@pytest.mark.asyncio
+async def test_retained_input_pinned_while_referenced(tmp_path):
+    """Тест: копия входного фото в памяти не вытесняется, пока задача на неё ссылается"""
+    bot = AsyncMock()
+    bot.get_file.return_value = MagicMock(file_path="photos/file_1.jpg")
+
+    async def download_file(file_path, destination, **kwargs):
+        destination.write(b"photo")
+
+    bot.download_file = download_file
+    file_manager = FileManager(tmp_path, in_memory_inputs=True, retain_inputs=True)
+
+    path = await file_manager.download_file(bot, "file_id_1", user_id=1, extension="jpg")
+    await asyncio.gather(*file_manager._background_writes)
+    file_manager.release_input(path)  # Загружено в ComfyUI, задача ещё не завершена
+
+    assert file_manager.index.is_pinned(path)
+    assert file_manager._unlink_unused([path]) == []
+
+    params = WorkflowParams(input_image=path.name, positive_prompt="test")
+    file_manager.release_task(Task(user_id=1, image_path=path, workflow_params=params))
+    await asyncio.gather(*file_manager._background_writes)
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_discarded_fsm_state_releases_inputs(tmp_path):
+    """Тест: сброс FSM состояния (/cancel) снимает ссылки на фото, не ставшие задачами"""
+    from src.bot.handlers import _discard_state
+
+    file_manager = FileManager(tmp_path)
+    paths = []
+    for name in ("single.jpg", "batch_1.jpg", "batch_2.jpg"):
+        path = file_manager.input_dir / name
+        path.write_bytes(b"photo")
+        paths.append(file_manager.acquire(path))
+
+    state = AsyncMock()
+    state.get_data.return_value = {"image_path": str(paths[0]), "batch_images": [str(p) for p in paths[1:]]}
+
+    await _discard_state(state, file_manager)
+    await asyncio.gather(*file_manager._background_writes)
+
+    state.clear.assert_awaited_once()
+    assert not any(file_manager.index.is_pinned(path) for path in paths)
+    assert not any(path.exists() for path in paths)
+
+
+@pytest.mark.asyncio
+async def test_cleanup_keeps_buffers_of_queued_tasks(tmp_path):
+    """Тест: старый буфер задачи, ждущей в очереди, не освобождается очисткой; буфер брошенного диалога — да"""
+    from datetime import datetime, timedelta
+
+    payloads = {"file_queued": b"queued photo", "file_abandoned": b"abandoned photo"}
+    bot = AsyncMock()
+    bot.get_file.side_effect = lambda file_id: MagicMock(file_path=file_id)
+
+    async def download_file(file_path, destination, **kwargs):
+        destination.write(payloads[file_path])
+
+    bot.download_file = download_file
+    file_manager = FileManager(tmp_path, in_memory_inputs=True, retain_inputs=False)
+    queued = await file_manager.download_file(bot, "file_queued", user_id=1, extension="jpg")
+    abandoned = await file_manager.download_file(bot, "file_abandoned", user_id=1, extension="jpg")
+    for path in (queued, abandoned):
+        buffer, _ = file_manager._buffers[str(path)]
+        file_manager._buffers[str(path)] = (buffer, datetime.now() - timedelta(hours=2))
+
+    report = await file_manager.cleanup_old_files(max_age_hours=1, live_inputs={str(queued)})
+
+    assert report["buffers"]["files"] == 1
+    assert file_manager.read_input(queued) == b"queued photo"
+    with pytest.raises(FileNotFoundError):
+        file_manager.read_input(abandoned)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_buffer_reads_are_consistent(tmp_path):
+    """Тест: параллельное чтение одного буфера из потоков и event loop не портит данные"""
+    bot = AsyncMock()
+    bot.get_file.return_value = MagicMock(file_path="photos/file_1.jpg")
+    payload = os.urandom(256 * 1024)
+
+    async def download_file(file_path, destination, **kwargs):
+        destination.write(payload)
+
+    bot.download_file = download_file
+    file_manager = FileManager(tmp_path, in_memory_inputs=True, retain_inputs=False)
+    path = await file_manager.download_file(bot, "file_id_1", user_id=1, extension="jpg")
+
+    reads = await asyncio.gather(*(asyncio.to_thread(file_manager.read_input, path) for _ in range(20)))
+
+    assert all(data == payload for data in reads)
@@ -0,0 +1,62 @@
+"""
+Тесты для ProgressNotifier (с использованием mock)
+"""
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from aiogram.exceptions import TelegramRetryAfter
+from src.bot.notifier import ProgressNotifier
+
+
+@pytest.mark.asyncio
+async def test_notifier_coalesces_updates():
+    """Тест: из серии обновлений одного сообщения отправляется только последнее"""
+    bot = AsyncMock()
+    notifier = ProgressNotifier(bot, min_interval=0.05)
+
+    for step in range(1, 11):
+        notifier.update(1, 100, f"Шаг {step}/10")
+
+    await asyncio.sleep(0.2)
+
+    texts = [call.kwargs["text"] for call in bot.edit_message_text.call_args_list]
+    assert texts == ["Шаг 10/10"]
+
+    await notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_notifier_skips_identical_text():
+    """Тест: правка с уже показанным текстом не отправляется"""
+    bot = AsyncMock()
+    notifier = ProgressNotifier(bot, min_interval=0.01)
+
+    notifier.update(1, 100, "В очереди")
+    await asyncio.sleep(0.05)
+    notifier.update(1, 100, "В очереди")
+    await asyncio.sleep(0.05)
+
+    assert bot.edit_message_text.call_count == 1
+
+    await notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_notifier_respects_retry_after():
+    """Тест: после TelegramRetryAfter отправляется актуальный текст после паузы"""
+    bot = AsyncMock()
+    bot.edit_message_text.side_effect = [
+        TelegramRetryAfter(method=MagicMock(), message="Too Many Requests", retry_after=0),
+        None,
+    ]
+    notifier = ProgressNotifier(bot, min_interval=0.01)
+
+    notifier.update(1, 100, "Шаг 1/10")
+    await asyncio.sleep(0)
+    notifier.update(1, 100, "Шаг 2/10")
+    await asyncio.sleep(0.1)
+
+    assert bot.edit_message_text.call_count == 2
+    assert bot.edit_message_text.call_args.kwargs["text"] == "Шаг 2/10"
+
+    await notifier.close()
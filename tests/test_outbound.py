@@ -0,0 +1,73 @@
+"""
+Тесты для OutboundScheduler (без сети: make_request подменяется)
+"""
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, GetMe, SendMessage, SendPhoto
+from src.bot.outbound import OutboundScheduler
+from src.models.config import TelegramConfig
+
+
+def make_recorder(calls: list, fail_times: int = 0):
+    """make_request, записывающий порядок запросов (и падающий с 429 первые fail_times раз)"""
+    failures = {"left": fail_times}
+
+    async def make_request(bot, method):
+        if failures["left"] > 0:
+            failures["left"] -= 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        calls.append(type(method).__name__)
+        return True
+
+    return make_request
+
+
+@pytest.mark.asyncio
+async def test_results_served_before_progress_edits():
+    """Тест: при ограничении чата доставка результата обгоняет правки прогресса"""
+    scheduler = OutboundScheduler(TelegramConfig(chat_rate=20, chat_burst=1))
+    calls = []
+    make_request = make_recorder(calls)
+    bot = MagicMock()
+
+    # Первый запрос забирает единственный маркер чата, остальные ждут
+    first = asyncio.create_task(scheduler(make_request, bot, SendMessage(chat_id=1, text="start")))
+    await asyncio.sleep(0)
+    edit = asyncio.create_task(scheduler(make_request, bot, EditMessageText(chat_id=1, message_id=1, text="50%")))
+    photo = asyncio.create_task(scheduler(make_request, bot, SendPhoto(chat_id=1, photo="file_id")))
+
+    await asyncio.wait_for(asyncio.gather(first, edit, photo), timeout=2)
+
+    assert calls == ["SendMessage", "SendPhoto", "EditMessageText"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_retried():
+    """Тест: запрос повторяется после TelegramRetryAfter"""
+    scheduler = OutboundScheduler(TelegramConfig(max_retries=2))
+    calls = []
+
+    result = await asyncio.wait_for(
+        scheduler(make_recorder(calls, fail_times=1), MagicMock(), SendMessage(chat_id=1, text="hi")),
+        timeout=2
+    )
+
+    assert result is True
+    assert calls == ["SendMessage"]
+
+
+@pytest.mark.asyncio
+async def test_requests_without_chat_bypass_limits():
+    """Тест: служебные запросы без chat_id не проходят через корзины"""
+    scheduler = OutboundScheduler(TelegramConfig(global_rate=1))
+    calls = []
+    make_request = make_recorder(calls)
+
+    await asyncio.wait_for(
+        asyncio.gather(*(scheduler(make_request, MagicMock(), GetMe()) for _ in range(5))),
+        timeout=1
+    )
+
+    assert calls == ["GetMe"] * 5
@@ -0,0 +1,466 @@
+"""
+Тесты для TaskProcessor (с использованием mock)
+"""
+import pytest
+import asyncio
+import io
+from pathlib import Path
+from PIL import Image
+from unittest.mock import AsyncMock, MagicMock
+from src.queue.task_queue import TaskQueue
+from src.queue.processor import TaskProcessor
+from src.models.config import DeadlinesConfig
+from src.models.task import Task, TaskStatus, WorkflowParams
+from src.storage.file_manager import FileManager
+
+
+def make_processor(queue: TaskQueue, comfyui=None, deadlines=None) -> TaskProcessor:
+    """Процессор с mock-зависимостями"""
+    return TaskProcessor(
+        task_queue=queue,
+        comfyui_client=comfyui or MagicMock(),
+        workflow_manager=MagicMock(),
+        bot=AsyncMock(),
+        timeout=300,
+        deadlines=deadlines
+    )
+
+
+@pytest.mark.asyncio
+async def test_execution_deadline_scales_with_steps():
+    """Тест дедлайна генерации по прогнозу steps × мегапиксели"""
+    queue = TaskQueue()
+    processor = make_processor(queue, deadlines=DeadlinesConfig(execution_base_seconds=10, execution_slack=2.0))
+
+    def make_task(steps: int) -> Task:
+        task = Task(
+            image_path=Path("test.png"),
+            workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test", steps=steps)
+        )
+        task.input_megapixels = 1.0
+        return task
+
+    # Без замеров — полный timeout (первая задача после рестарта грузит модель)
+    assert processor.execution_deadline(make_task(4)) == 300
+
+    queue.estimator.observe(make_task(4), 20)
+    queue.estimator.observe(make_task(40), 200)
+    short = processor.execution_deadline(make_task(4))
+    long = processor.execution_deadline(make_task(40))
+
+    assert 10 < short < long
+    assert long == 300  # Ограничено timeout_seconds
+
+
+@pytest.mark.asyncio
+async def test_hung_upload_fails_by_phase_deadline():
+    """Тест: зависшая загрузка обрывается дедлайном фазы, а не общим таймаутом"""
+    queue = TaskQueue()
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    comfyui = MagicMock()
+    comfyui.upload_image = hang
+    processor = make_processor(queue, comfyui=comfyui, deadlines=DeadlinesConfig(upload_seconds=0.05))
+
+    await queue.add_task(Task(
+        user_id=1,
+        chat_id=1,
+        image_path=Path("test.png"),
+        workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test")
+    ))
+    task = await queue.get_task()
+
+    await asyncio.wait_for(processor.process_task(task), timeout=2)
+
+    assert task.status == TaskStatus.FAILED
+    assert "upload" in task.error
+    assert queue.current_task is None
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_execution_timeout_cancels_comfyui_prompt(monkeypatch):
+    """Тест: при таймауте генерации задача снимается с ComfyUI, а прогноз не учится на ней"""
+    queue = TaskQueue()
+
+    async def hang(**kwargs):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr("src.queue.processor.track_progress", hang)
+    comfyui = MagicMock()
+    comfyui.upload_image = AsyncMock(return_value={"name": "input.png"})
+    comfyui.queue_prompt = AsyncMock(return_value="prompt-1")
+    comfyui.cancel_prompt = AsyncMock()
+    processor = make_processor(queue, comfyui=comfyui)
+    processor.workflow_manager.create_workflow.return_value = ({}, {})
+    processor.timeout = 0.05
+
+    await queue.add_task(Task(
+        user_id=1,
+        chat_id=1,
+        image_path=Path("test.png"),
+        workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test")
+    ))
+    task = await queue.get_task()
+
+    await asyncio.wait_for(processor.process_task(task), timeout=2)
+
+    assert task.status == TaskStatus.FAILED
+    assert "execution" in task.error
+    comfyui.cancel_prompt.assert_awaited_once_with("prompt-1")
+    assert not queue.estimator.is_observed(task)
+
+    await processor.notifier.close()
+
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_unpins_result(tmp_path, monkeypatch):
+    """Тест: результат, который не удалось доставить, снова доступен для вытеснения"""
+    input_path = tmp_path / "input.png"
+    input_path.write_bytes(b"input image")
+    file_manager = FileManager(tmp_path / "data")
+    queue = TaskQueue()
+
+    async def finished(**kwargs):
+        return {"outputs": {"102": {"images": [{"filename": "result.png", "type": "output"}]}}}
+
+    monkeypatch.setattr("src.queue.processor.track_progress", finished)
+    comfyui = MagicMock()
+    comfyui.upload_image = AsyncMock(return_value={"name": "input.png"})
+    comfyui.queue_prompt = AsyncMock(return_value="prompt-1")
+    comfyui.get_image = AsyncMock(return_value=b"result image")
+    processor = make_processor(queue, comfyui=comfyui)
+    processor.workflow_manager.create_workflow.return_value = ({}, {})
+    processor.file_manager = file_manager
+    processor.send_result = AsyncMock(side_effect=RuntimeError("network error"))
+
+    await queue.add_task(Task(
+        user_id=1,
+        chat_id=1,
+        image_path=input_path,
+        workflow_params=WorkflowParams(input_image="input.png", positive_prompt="test")
+    ))
+    task = await queue.get_task()
+
+    await processor.process_task(task)
+
+    assert task.status == TaskStatus.FAILED
+    assert task.result_path.exists()
+    assert not file_manager.index.is_pinned(task.result_path)
+    assert file_manager._unlink_unused([task.result_path]) == [task.result_path]
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_delivery_deadline_excludes_outbound_waits():
+    """Тест: ожидание лимита чата в OutboundScheduler не съедает дедлайн доставки, зависшая отправка — съедает"""
+    from aiogram.methods import SendPhoto
+    from src.bot.outbound import OutboundScheduler
+    from src.models.config import TelegramConfig
+    from src.queue.processor import PhaseTimeoutError
+
+    processor = make_processor(TaskQueue(), deadlines=DeadlinesConfig(delivery_seconds=0.1))
+    scheduler = OutboundScheduler(TelegramConfig(chat_rate=4, chat_burst=1))
+
+    async def make_request(bot, method):
+        return True
+
+    async def hang(bot, method):
+        await asyncio.sleep(1)
+
+    async def send_twice():
+        # Второй запрос ждёт маркер чата ~0.25 с — дольше дедлайна
+        await scheduler(make_request, MagicMock(), SendPhoto(chat_id=1, photo="file_id"))
+        return await scheduler(make_request, MagicMock(), SendPhoto(chat_id=1, photo="file_id"))
+
+    assert await processor._run_delivery(send_twice()) is True
+
+    with pytest.raises(PhaseTimeoutError):
+        await processor._run_delivery(scheduler(hang, MagicMock(), SendPhoto(chat_id=2, photo="file_id")))
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_send_result_reuses_file_id(tmp_path):
+    """Тест: повторная отправка того же результата идёт по file_id без загрузки файла"""
+    processor = make_processor(TaskQueue())
+    result_path = tmp_path / "result.png"
+    result_path.write_bytes(b"result image")
+    content_hash = processor.file_id_cache.content_hash(b"result image")
+
+    sent = MagicMock()
+    sent.photo = [MagicMock(file_id="small"), MagicMock(file_id="large")]
+    processor.bot.send_photo.return_value = sent
+
+    await processor.send_result(1, result_path, content_hash, "caption")
+    await processor.send_result(2, result_path, content_hash, "caption")
+
+    first, second = processor.bot.send_photo.call_args_list
+    assert first.kwargs["photo"].path == result_path
+    assert second.kwargs["photo"] == "large"
+    assert processor.file_id_cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_in_memory_input_uploaded_from_buffer(tmp_path):
+    """Тест: фото из памяти читается очередью и загружается в ComfyUI без файла на диске"""
+    image = io.BytesIO()
+    Image.new("RGB", (1000, 500)).save(image, format="PNG")
+
+    bot = AsyncMock()
+    bot.get_file.return_value = MagicMock(file_path="photos/file_1.png")
+
+    async def download_file(file_path, destination, seek=True):
+        destination.write(image.getvalue())
+
+    bot.download_file = download_file
+
+    file_manager = FileManager(tmp_path, in_memory_inputs=True, retain_inputs=False)
+    image_path = await file_manager.download_file(bot, "file_id_1", user_id=1, extension="png")
+    assert not image_path.exists()
+
+    queue = TaskQueue(input_opener=file_manager.open_input)
+    await queue.add_task(Task(
+        user_id=1,
+        chat_id=1,
+        image_path=image_path,
+        workflow_params=WorkflowParams(input_image=image_path.name, positive_prompt="test")
+    ))
+    task = await queue.get_task()
+    assert task.input_megapixels == 0.5
+
+    comfyui = MagicMock()
+    comfyui.upload_image = AsyncMock(side_effect=RuntimeError("stop after upload"))
+    processor = make_processor(queue, comfyui=comfyui)
+    processor.file_manager = file_manager
+
+    await processor.process_task(task)
+
+    assert comfyui.upload_image.call_args.kwargs["image_data"] == image.getvalue()
+
+    await processor.notifier.close()
+
+
+def make_batch_results(processor: TaskProcessor, tmp_path, count: int):
+    """Пакет из count задач, все результаты которого уже накоплены, кроме завершения последней"""
+    batch = processor.task_queue.batches.create(chat_id=1, message_id=100)
+    batch.total = count
+    batch.done = count - 1
+    for i in range(count):
+        result_path = tmp_path / f"result_{i}.png"
+        result_path.write_bytes(f"result {i}".encode())
+        batch.add_result(result_path, f"hash_{i}")
+    last = Task(user_id=1, chat_id=1, batch_id=batch.id, status=TaskStatus.COMPLETED)
+    return batch, last
+
+
+@pytest.mark.asyncio
+async def test_batch_results_sent_as_media_groups(tmp_path):
+    """Тест: 12 результатов пакета уходят двумя sendMediaGroup (10 + 2)"""
+    processor = make_processor(TaskQueue())
+    processor.batch_delivery = "album"
+    processor.bot.send_media_group.return_value = []
+    batch, last = make_batch_results(processor, tmp_path, 12)
+
+    await processor.report_batch_progress(last)
+
+    sizes = [len(call.kwargs["media"]) for call in processor.bot.send_media_group.call_args_list]
+    assert sizes == [10, 2]
+    assert processor.bot.send_photo.call_count == 0
+    assert batch.delivered == 12
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_results_sent_as_single_archive(tmp_path):
+    """Тест: в режиме zip результаты пакета отправляются одним архивом в конце"""
+    processor = make_processor(TaskQueue())
+    processor.batch_delivery = "zip"
+    batch, last = make_batch_results(processor, tmp_path, 5)
+
+    await processor.report_batch_progress(last)
+
+    assert processor.bot.send_document.call_count == 1
+    assert processor.bot.send_media_group.call_count == 0
+    assert not list(tmp_path.glob("*.zip"))  # Архив удалён после отправки
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_results_flushed_by_window_timer(tmp_path):
+    """Тест: накопленные результаты пакета уходят по истечении окна, без завершения следующей задачи"""
+    processor = make_processor(TaskQueue())
+    processor.batch_delivery = "album"
+    processor.batch_flush_seconds = 0.05
+    processor.bot.send_media_group.return_value = []
+    batch = processor.task_queue.batches.create(chat_id=1, message_id=100)
+    batch.total = 5
+    for i in range(2):
+        result_path = tmp_path / f"result_{i}.png"
+        result_path.write_bytes(f"result {i}".encode())
+        batch.add_result(result_path, f"hash_{i}")
+        processor._schedule_batch_flush(batch)
+
+    await asyncio.sleep(0.2)
+
+    assert processor.bot.send_media_group.call_count == 1
+    assert batch.delivered == 2 and not batch.results
+    assert not processor._flush_timers
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_stop_delivers_results_inside_flush_window(tmp_path):
+    """Тест: при остановке результаты пакета, ждущие окна альбома, отправляются, а не теряются"""
+    processor = make_processor(TaskQueue())
+    processor.batch_delivery = "album"
+    processor.batch_flush_seconds = 60
+    processor.bot.send_media_group.return_value = []
+    batch = processor.task_queue.batches.create(chat_id=1, message_id=100)
+    batch.total = 5
+    for i in range(2):
+        result_path = tmp_path / f"result_{i}.png"
+        result_path.write_bytes(f"result {i}".encode())
+        batch.add_result(result_path, f"hash_{i}")
+        processor._schedule_batch_flush(batch)
+
+    await processor.stop()
+    await asyncio.sleep(0)
+
+    assert processor.bot.send_media_group.call_count == 1
+    assert batch.delivered == 2 and not batch.results
+    assert not processor._flush_timers
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_album_caption_marks_degraded_results(tmp_path):
+    """Тест: подпись альбома пакета сообщает о результатах быстрого режима"""
+    processor = make_processor(TaskQueue())
+    processor.batch_delivery = "album"
+    processor.bot.send_media_group.return_value = []
+    batch, last = make_batch_results(processor, tmp_path, 3)
+    path, content_hash, _ = batch.results[1]
+    batch.results[1] = (path, content_hash, True)
+
+    await processor.report_batch_progress(last)
+
+    media = processor.bot.send_media_group.call_args.kwargs["media"]
+    assert "Быстрый режим" in media[0].caption
+    assert "(1 из 3)" in media[0].caption
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_batch_item_completes_batch(tmp_path):
+    """Тест: отменённая задача пакета учитывается, и пакет завершается с отправкой архива"""
+    processor = make_processor(TaskQueue())
+    processor.batch_delivery = "zip"
+    batch = processor.task_queue.batches.create(chat_id=1, message_id=100)
+    batch.total = 3
+    batch.done = 1
+    for i in range(2):
+        result_path = tmp_path / f"result_{i}.png"
+        result_path.write_bytes(f"result {i}".encode())
+        batch.add_result(result_path, f"hash_{i}")
+
+    await processor.report_batch_progress(Task(user_id=1, chat_id=1, batch_id=batch.id, status=TaskStatus.CANCELLED))
+    assert processor.bot.send_document.call_count == 0
+
+    await processor.report_batch_progress(Task(user_id=1, chat_id=1, batch_id=batch.id, status=TaskStatus.COMPLETED))
+
+    assert processor.bot.send_document.call_count == 1
+    assert batch.cancelled == 1 and batch.finished
+    assert "Отменено: 1" in batch.last_text
+    assert processor.task_queue.batches.get(batch.id) is None
+
+    await processor.notifier.close()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_inside_batch_counts_toward_batch():
+    """Тест: одно фото дважды в пакете — 2/2 в пакете, прогресс задачи не правит сообщение пакета"""
+    queue = TaskQueue(dedupe_window_seconds=60)
+    processor = make_processor(queue)
+    processor.notifier = MagicMock()
+    batch = queue.batches.create(chat_id=1, message_id=100)
+    tasks = [
+        Task(
+            user_id=1,
+            chat_id=1,
+            message_id=100,
+            image_path=Path("same.png"),
+            workflow_params=WorkflowParams(input_image="same.png", positive_prompt="batch"),
+            batch_id=batch.id,
+            fingerprint="same"
+        )
+        for _ in range(2)
+    ]
+
+    positions, rejection = await queue.add_tasks(tasks)
+    assert positions == [1, 1] and rejection is None
+    assert batch.total == 2
+
+    original = await queue.get_task()
+    await processor.notify_user(original, "⏳ Генерация: 50%")
+    processor.notifier.update.assert_not_called()
+
+    original.status = TaskStatus.COMPLETED
+    await processor.report_batch_progress(original)
+    assert batch.done == 2 and batch.finished
+
+
+@pytest.mark.asyncio
+async def test_cancel_original_cancels_batched_follower():
+    """Тест: отмена задачи, к которой присоединено фото из пакета, завершает этот пакет"""
+    queue = TaskQueue(dedupe_window_seconds=60)
+    processor = make_processor(queue)
+    processor.notifier = MagicMock()
+    batch = queue.batches.create(chat_id=2, message_id=200)
+    params = WorkflowParams(input_image="same.png", positive_prompt="test")
+    original = Task(user_id=1, chat_id=1, message_id=100, image_path=Path("same.png"),
+                    workflow_params=params, fingerprint="same")
+    follower = Task(user_id=2, chat_id=2, message_id=200, image_path=Path("same.png"),
+                    workflow_params=params, batch_id=batch.id, fingerprint="same")
+    plain_follower = Task(user_id=3, chat_id=3, message_id=300, image_path=Path("same.png"),
+                          workflow_params=params, fingerprint="same")
+
+    await queue.add_task(original)
+    await queue.add_task(follower)
+    await queue.add_task(plain_follower)
+    assert follower.duplicate_of == original.id and batch.total == 1
+
+    cancelled = await queue.cancel_task(original.id, user_id=1)
+    await processor.report_cancelled(cancelled, "🚫 Задача отменена")
+
+    # Пакет получил итог своего фото и завершён, обычный дубликат уведомлён
+    assert batch.cancelled == 1 and batch.finished
+    assert queue.batches.get(batch.id) is None
+    notified = [call.args[:2] for call in processor.notifier.update.call_args_list]
+    assert (1, 100) in notified and (3, 300) in notified and (2, 200) in notified
+    assert "Отменено: 1" in batch.last_text
+
+
+@pytest.mark.asyncio
+async def test_local_api_sends_file_uri(tmp_path):
+    """Тест: с локальным Bot API результат отправляется путём file:// без загрузки байтов"""
+    processor = make_processor(TaskQueue())
+    processor.local_api = True
+    result_path = tmp_path / "result.png"
+    result_path.write_bytes(b"result image")
+    processor.bot.send_photo.return_value = MagicMock(photo=[])
+
+    await processor.send_result(1, result_path, "hash", "caption")
+
+    assert processor.bot.send_photo.call_args.kwargs["photo"] == result_path.as_uri()
@@ -6,7 +6,10 @@ import asyncio
 from pathlib import Path
 from datetime import datetime
 from src.queue.task_queue import TaskQueue
-from src.models.task import Task, TaskStatus, WorkflowParams
+from src.queue.admission import AdmissionRejected
+from src.queue.degradation import DegradationPolicy
+from src.models.config import DegradationConfig, DegradationLevel, WorkflowLimits
+from src.models.task import Task, TaskStatus, TaskLane, WorkflowParams
 
 
 @pytest.mark.asyncio
@@ -192,3 +195,619 @@ async def test_fifo_order():
         retrieved = await queue.get_task()
         assert retrieved.user_id == i
         await queue.task_done(retrieved, success=True)
+
+
+@pytest.mark.asyncio
+async def test_fair_scheduling_interleaves_users():
+    """Тест справедливой очереди: пакет одного пользователя не блокирует других"""
+    queue = TaskQueue(scheduling="fair")
+    
+    for i in range(5):
+        await queue.add_task(Task(
+            user_id=1,
+            chat_id=1,
+            image_path=Path(f"batch{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"batch{i}.png", positive_prompt="batch")
+        ))
+    
+    other = Task(
+        user_id=2,
+        chat_id=2,
+        image_path=Path("single.png"),
+        workflow_params=WorkflowParams(input_image="single.png", positive_prompt="single")
+    )
+    position = await queue.add_task(other)
+    
+    # Задача второго пользователя встаёт сразу за первой задачей пакета
+    assert position == 2
+    
+    order = []
+    for _ in range(6):
+        retrieved = await queue.get_task()
+        order.append(retrieved.user_id)
+        await queue.task_done(retrieved, success=True)
+    
+    assert order == [1, 2, 1, 1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_fair_scheduling_positions():
+    """Тест актуальности позиций в справедливой очереди"""
+    queue = TaskQueue(scheduling="fair")
+    
+    tasks = []
+    for user_id in (1, 1, 1, 2, 3):
+        task = Task(
+            user_id=user_id,
+            chat_id=user_id,
+            image_path=Path("test.png"),
+            workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test")
+        )
+        tasks.append(task)
+        await queue.add_task(task)
+    
+    # Порядок выдачи: u1, u2, u3, u1, u1
+    assert [queue.get_position(t.id) for t in tasks] == [1, 4, 5, 2, 3]
+    
+    await queue.get_task()
+    
+    assert queue.get_position(tasks[0].id) is None
+    assert queue.get_position(tasks[3].id) == 1
+
+
+def test_unknown_scheduling_policy():
+    """Тест неизвестной политики планирования"""
+    with pytest.raises(ValueError):
+        TaskQueue(scheduling="lifo")
+
+
+@pytest.mark.parametrize("policy", ["fifo", "fair"])
+def test_scheduler_positions_after_compaction(policy):
+    """Тест: позиции и порядок сохраняются после сжатия списка ключей"""
+    from src.queue.scheduler import create_scheduler
+    
+    scheduler = create_scheduler(policy)
+    tasks = [
+        Task(
+            user_id=i % 3,
+            chat_id=i,
+            image_path=Path("test.png"),
+            workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test")
+        )
+        for i in range(3000)
+    ]
+    for task in tasks:
+        scheduler.push(task)
+    for task in tasks[::2]:
+        scheduler.remove(task.id)
+    
+    expected = tasks[1::2]
+    popped = [scheduler.pop() for _ in range(1200)]
+    remaining = scheduler.tasks()
+    
+    assert scheduler.qsize() == len(expected) - 1200 == len(remaining)
+    assert sorted(t.chat_id for t in popped + remaining) == [t.chat_id for t in expected]
+    if policy == "fifo":
+        assert popped == expected[:1200]
+    for position, task in enumerate(remaining, 1):
+        assert scheduler.position(task.id) == position
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_first_with_bulk_share():
+    """Тест полос: интерактивные задачи первыми, пакетные получают гарантированную долю"""
+    queue = TaskQueue(bulk_min_share=0.25)  # 1 пакетная на 3 интерактивные
+    
+    bulk_tasks = []
+    for i in range(3):
+        task = Task(
+            user_id=1,
+            chat_id=1,
+            image_path=Path(f"batch{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"batch{i}.png", positive_prompt="batch"),
+            lane=TaskLane.BULK
+        )
+        bulk_tasks.append(task)
+        await queue.add_task(task)
+    
+    interactive_tasks = []
+    for i in range(7):
+        task = Task(
+            user_id=2,
+            chat_id=2,
+            image_path=Path(f"single{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"single{i}.png", positive_prompt="single")
+        )
+        interactive_tasks.append(task)
+        await queue.add_task(task)
+    
+    expected = ["i", "i", "i", "b", "i", "i", "i", "b", "i", "b"]
+    
+    # Позиции совпадают с фактическим порядком выдачи
+    order = [t.id for t in queue.queue.tasks()]
+    for task in bulk_tasks + interactive_tasks:
+        assert queue.get_position(task.id) == order.index(task.id) + 1
+    
+    lanes = []
+    for _ in range(10):
+        retrieved = await queue.get_task()
+        lanes.append("b" if retrieved.lane == TaskLane.BULK else "i")
+        await queue.task_done(retrieved, success=True)
+    
+    assert lanes == expected
+
+
+@pytest.mark.asyncio
+async def test_strict_interactive_priority():
+    """Тест строгого приоритета интерактивной полосы (bulk_min_share=0)"""
+    queue = TaskQueue(bulk_min_share=0)
+    
+    bulk = Task(
+        user_id=1,
+        chat_id=1,
+        image_path=Path("batch.png"),
+        workflow_params=WorkflowParams(input_image="batch.png", positive_prompt="batch"),
+        lane=TaskLane.BULK
+    )
+    await queue.add_task(bulk)
+    
+    for i in range(3):
+        await queue.add_task(Task(
+            user_id=2,
+            chat_id=2,
+            image_path=Path(f"single{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"single{i}.png", positive_prompt="single")
+        ))
+    
+    assert queue.get_position(bulk.id) == 4
+    assert queue.get_status()["lane_sizes"] == {"interactive": 3, "bulk": 1}
+
+
+@pytest.mark.asyncio
+async def test_persistent_queue_restore(tmp_path):
+    """Тест восстановления задач из SQLite после рестарта"""
+    from src.queue.task_store import TaskStore
+    
+    store = TaskStore(tmp_path / "tasks.db")
+    queue = TaskQueue(store=store)
+    
+    tasks = []
+    for i in range(3):
+        task = Task(
+            user_id=i,
+            chat_id=i,
+            image_path=Path(f"test{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"test{i}.png", positive_prompt=f"test{i}", steps=12)
+        )
+        tasks.append(task)
+        await queue.add_task(task)
+    
+    done = await queue.get_task()
+    await queue.task_done(done, success=True)
+    interrupted = await queue.get_task()  # "Падение" во время обработки
+    await queue.flush_store()
+    store.close()
+    
+    # Новый процесс
+    store = TaskStore(tmp_path / "tasks.db")
+    restored_queue = TaskQueue(store=store)
+    restored = await restored_queue.restore(max_attempts=2)
+    
+    assert [t.id for t in restored] == [interrupted.id, tasks[2].id]
+    assert restored[0].status == TaskStatus.PENDING
+    assert restored[0].workflow_params.steps == 12
+    
+    retried = await restored_queue.get_task()
+    assert retried.id == interrupted.id
+    assert retried.attempts == 2
+    await restored_queue.flush_store()
+    store.close()
+    
+    # Повторно прерванная задача больше не перезапускается
+    store = TaskStore(tmp_path / "tasks.db")
+    restored = await TaskQueue(store=store).restore(max_attempts=2)
+    assert [t.id for t in restored] == [tasks[2].id]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_store_purge_finished(tmp_path):
+    """Тест: запись в хранилище идёт в фоне, завершённые задачи удаляются периодической очисткой"""
+    from src.queue.task_store import TaskStore
+    
+    store = TaskStore(tmp_path / "tasks.db")
+    queue = TaskQueue(store=store)
+    for i in range(2):
+        await queue.add_task(Task(
+            user_id=i,
+            chat_id=i,
+            image_path=Path(f"test{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"test{i}.png", positive_prompt=f"test{i}")
+        ))
+    task = await queue.get_task()
+    await queue.task_done(task, success=True)
+    await queue.flush_store()
+    
+    assert await queue.purge_finished(max_age_hours=0) == 1
+    assert len(store.load_unfinished()) == 1
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_restore_rebuilds_batches(tmp_path):
+    """Тест: после рестарта пакет пересоздаётся по восстановленным задачам"""
+    from src.queue.task_store import TaskStore
+    
+    store = TaskStore(tmp_path / "tasks.db")
+    queue = TaskQueue(store=store)
+    batch = queue.batches.create(chat_id=1, message_id=50)
+    await queue.add_tasks([
+        Task(
+            user_id=1,
+            chat_id=1,
+            message_id=50,
+            image_path=Path(f"batch{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"batch{i}.png", positive_prompt="batch"),
+            lane=TaskLane.BULK,
+            batch_id=batch.id
+        )
+        for i in range(3)
+    ])
+    await queue.flush_store()
+    store.close()
+    
+    store = TaskStore(tmp_path / "tasks.db")
+    restored_queue = TaskQueue(store=store)
+    await restored_queue.restore()
+    
+    restored_batch = restored_queue.batches.get(batch.id)
+    assert restored_batch is not None
+    assert (restored_batch.chat_id, restored_batch.message_id, restored_batch.total) == (1, 50, 3)
+    assert restored_queue.batches.find_by_message(1, 50) is restored_batch
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_eta_learns_service_time():
+    """Тест ETA: оценка учится на фактическом времени обработки"""
+    from datetime import timedelta
+    
+    queue = TaskQueue()
+    
+    tasks = []
+    for i in range(3):
+        task = Task(
+            user_id=i,
+            chat_id=i,
+            image_path=Path(f"missing{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"missing{i}.png", positive_prompt="test", steps=10)
+        )
+        tasks.append(task)
+        await queue.add_task(task)
+    
+    # Генерация первой задачи заняла 30 секунд (замер TaskProcessor), вся задача — дольше
+    first = await queue.get_task()
+    first.started_at = datetime.now() - timedelta(seconds=45)
+    queue.estimator.observe(first, 30.0)
+    await queue.task_done(first, success=True)
+    
+    task = Task(
+        user_id=9,
+        chat_id=9,
+        image_path=Path("missing9.png"),
+        workflow_params=WorkflowParams(input_image="missing9.png", positive_prompt="test", steps=10)
+    )
+    await queue.add_task(task)
+    assert task.estimated_seconds == pytest.approx(30.0)
+    
+    # Ожидающие задачи: два старых + новый, ETA растёт с позицией
+    snapshot = queue.snapshot()
+    assert [position for _, position, _ in snapshot] == [1, 2, 3]
+    assert snapshot[0][2] == 0.0
+    assert queue.get_eta(task.id) == pytest.approx(snapshot[2][2])
+    assert queue.get_eta(first.id) is None
+
+
+@pytest.mark.asyncio
+async def test_input_size_read_outside_lock(tmp_path):
+    """Тест: размер входного фото читается до взятия блокировки очереди"""
+    from PIL import Image
+    
+    image_path = tmp_path / "input.png"
+    Image.new("RGB", (1000, 500)).save(image_path)
+    
+    queue = None
+    locked = []
+    
+    def opener(path, mode="rb"):
+        locked.append(queue._lock.locked())
+        return open(path, mode)
+    
+    queue = TaskQueue(input_opener=opener)
+    task = Task(
+        user_id=1,
+        chat_id=1,
+        image_path=image_path,
+        workflow_params=WorkflowParams(input_image="input.png", positive_prompt="test")
+    )
+    await queue.add_task(task)
+    
+    assert task.input_megapixels == pytest.approx(0.5)
+    assert locked and not any(locked)
+
+
+@pytest.mark.asyncio
+async def test_cancel_task_tombstone():
+    """Тест отмены ожидающей задачи: задача пропускается при выдаче, позиции пересчитываются"""
+    queue = TaskQueue(max_size=3)
+    
+    tasks = []
+    for i in range(3):
+        task = Task(
+            user_id=1,
+            chat_id=1,
+            image_path=Path(f"test{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"test{i}.png", positive_prompt=f"test{i}")
+        )
+        tasks.append(task)
+        await queue.add_task(task)
+    
+    # Чужую задачу отменить нельзя
+    assert await queue.cancel_task(tasks[1].id, user_id=2) is None
+    
+    cancelled = await queue.cancel_task(tasks[1].id, user_id=1)
+    assert cancelled is tasks[1]
+    assert cancelled.status == TaskStatus.CANCELLED
+    assert queue.queue.qsize() == 2
+    assert queue.get_position(tasks[1].id) is None
+    assert queue.get_position(tasks[2].id) == 2
+    assert queue.find_user_task(1, tasks[2].id[:8]) is tasks[2]
+    
+    # Освободившееся место доступно сразу
+    await asyncio.wait_for(queue.add_task(Task(
+        user_id=2,
+        chat_id=2,
+        image_path=Path("extra.png"),
+        workflow_params=WorkflowParams(input_image="extra.png", positive_prompt="extra")
+    )), timeout=1)
+    
+    assert (await queue.get_task()).id == tasks[0].id
+    await queue.task_done(queue.current_task, success=True)
+    assert (await queue.get_task()).id == tasks[2].id
+
+
+@pytest.mark.asyncio
+async def test_supersede_pending():
+    """Тест замены ожидающей одиночной задачи новой"""
+    queue = TaskQueue(max_pending_per_user=2)
+    
+    batch = Task(
+        user_id=1,
+        chat_id=1,
+        image_path=Path("batch.png"),
+        workflow_params=WorkflowParams(input_image="batch.png", positive_prompt="batch"),
+        lane=TaskLane.BULK
+    )
+    single = Task(
+        user_id=1,
+        chat_id=1,
+        image_path=Path("single.png"),
+        workflow_params=WorkflowParams(input_image="single.png", positive_prompt="single")
+    )
+    replacement = Task(
+        user_id=1,
+        chat_id=1,
+        image_path=Path("replacement.png"),
+        workflow_params=WorkflowParams(input_image="replacement.png", positive_prompt="replacement")
+    )
+    await queue.add_task(batch)
+    await queue.add_task(single)
+    
+    # Квота заполнена, но замена освобождает место под новую задачу
+    position, superseded = await queue.replace_pending(replacement)
+    
+    # Пакетные задачи не заменяются
+    assert superseded == [single]
+    assert single.status == TaskStatus.CANCELLED
+    assert position == 1
+    assert queue.find_user_tasks(1) == [batch, replacement]
+
+
+@pytest.mark.asyncio
+async def test_completed_history_is_bounded():
+    """Тест ограниченной истории и инкрементальной статистики"""
+    queue = TaskQueue(history_size=3)
+    
+    for i in range(5):
+        await queue.add_task(Task(
+            user_id=i,
+            chat_id=i,
+            image_path=Path(f"test{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"test{i}.png", positive_prompt=f"test{i}")
+        ))
+        retrieved = await queue.get_task()
+        await queue.task_done(retrieved, success=(i != 0), error=None if i else "boom")
+    
+    status = queue.get_status()
+    
+    assert len(queue.completed_tasks) == 3
+    assert status["total_completed"] == 5
+    assert status["completed_today"] == 5
+    assert status["success_rate"] == 80.0
+    assert status["completed_last_hour"] == 5
+
+
+def test_completed_last_hour_is_sliding_window():
+    """Тест: «за час» — последние 60 минут, а не текущий час по часам"""
+    from datetime import timedelta
+    from src.queue.stats import QueueStats
+    
+    stats = QueueStats()
+    now = datetime.now()
+    for minutes_ago in (70, 50, 5):
+        task = Task(
+            user_id=1,
+            chat_id=1,
+            image_path=Path("test.png"),
+            workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test"),
+            status=TaskStatus.COMPLETED
+        )
+        task.completed_at = now - timedelta(minutes=minutes_ago)
+        stats.record(task)
+    
+    assert stats.completed_last_hour() == 2
+
+
+@pytest.mark.asyncio
+async def test_admission_user_quota():
+    """Тест квоты пользователя: отказ сразу, с временем повтора и учётом в статистике"""
+    queue = TaskQueue(max_size=10, max_pending_per_user=2)
+    
+    def make_task(user_id: int, name: str) -> Task:
+        return Task(
+            user_id=user_id,
+            chat_id=user_id,
+            image_path=Path(f"{name}.png"),
+            workflow_params=WorkflowParams(input_image=f"{name}.png", positive_prompt=name)
+        )
+    
+    await queue.add_task(make_task(1, "a1"))
+    await queue.add_task(make_task(1, "a2"))
+    
+    with pytest.raises(AdmissionRejected) as exc_info:
+        await asyncio.wait_for(queue.add_task(make_task(1, "a3")), timeout=1)
+    
+    assert exc_info.value.reason == AdmissionRejected.USER_QUOTA
+    assert exc_info.value.retry_after > 0
+    
+    # Другой пользователь квотой не ограничен
+    assert await queue.add_task(make_task(2, "b1")) == 3
+    
+    status = queue.get_status()
+    assert status["queue_size"] == 3
+    assert status["rejected_total"] == 1
+    assert queue.stats.rejected == {AdmissionRejected.USER_QUOTA: 1}
+
+
+@pytest.mark.asyncio
+async def test_dedupe_attaches_duplicate(tmp_path):
+    """Тест дедупликации: повторная отправка присоединяется к существующей задаче"""
+    queue = TaskQueue(dedupe_window_seconds=60)
+    
+    first_image = tmp_path / "first.png"
+    second_image = tmp_path / "second.png"
+    first_image.write_bytes(b"same image")
+    second_image.write_bytes(b"same image")
+    
+    def make_task(image: Path, message_id: int, seed: int = 0) -> Task:
+        return Task(
+            user_id=1,
+            chat_id=10,
+            message_id=message_id,
+            image_path=image,
+            workflow_params=WorkflowParams(input_image=str(image), positive_prompt="test", seed=seed)
+        )
+    
+    original = make_task(first_image, 100)
+    duplicate = make_task(second_image, 101)
+    other_seed = make_task(second_image, 102, seed=42)
+    
+    assert await queue.add_task(original) == 1
+    assert await queue.add_task(duplicate) == 1
+    assert await queue.add_task(other_seed) == 2
+    
+    assert duplicate.duplicate_of == original.id
+    assert original.followers == [(10, 101)]
+    assert other_seed.duplicate_of is None
+    assert queue.queue.qsize() == 2
+    
+    # Пока исходная задача выполняется, дубликат присоединяется к ней
+    retrieved = await queue.get_task()
+    late = make_task(second_image, 103)
+    assert await queue.add_task(late) == 0
+    assert late.duplicate_of == original.id
+    
+    # После завершения такая же отправка — снова новая задача
+    await queue.task_done(retrieved, success=True)
+    again = make_task(second_image, 104)
+    await queue.add_task(again)
+    assert again.duplicate_of is None
+
+
+def test_degradation_policy_levels():
+    """Тест быстрого режима: steps и разрешение понижаются по уровням в пределах лимитов"""
+    config = DegradationConfig(
+        enabled=True,
+        levels=[
+            DegradationLevel(queue_depth=5, steps_factor=0.5),
+            DegradationLevel(queue_depth=10, wait_seconds=600, steps_factor=0.1, max_megapixels=0.5),
+        ]
+    )
+    policy = DegradationPolicy(config, WorkflowLimits(min_steps=2), base_megapixels=1.0)
+    
+    def make_task() -> Task:
+        return Task(
+            image_path=Path("test.png"),
+            workflow_params=WorkflowParams(input_image="test.png", positive_prompt="test", steps=8)
+        )
+    
+    idle = make_task()
+    assert policy.apply(idle, queue_depth=2, predicted_wait=60) is False
+    assert idle.workflow_params.steps == 8
+    assert idle.degraded is False
+    
+    busy = make_task()
+    assert policy.apply(busy, queue_depth=6, predicted_wait=60) is True
+    assert busy.workflow_params.steps == 4
+    assert busy.workflow_params.megapixels is None
+    assert busy.degraded is True
+    
+    # Второй уровень срабатывает по прогнозу ожидания; steps не ниже min_steps
+    overloaded = make_task()
+    assert policy.apply(overloaded, queue_depth=6, predicted_wait=900) is True
+    assert overloaded.workflow_params.steps == 2
+    assert overloaded.workflow_params.megapixels == 0.5
+    
+    # Выключенная политика ничего не меняет
+    disabled = DegradationPolicy(DegradationConfig(levels=config.levels), WorkflowLimits())
+    task = make_task()
+    assert disabled.apply(task, queue_depth=100, predicted_wait=10_000) is False
+
+
+@pytest.mark.asyncio
+async def test_add_tasks_bulk_with_batch_status():
+    """Тест пакетной постановки: одна операция, частичный допуск и сводный статус пакета"""
+    queue = TaskQueue(max_size=3)
+    batch = queue.batches.create(chat_id=1, message_id=50)
+    
+    tasks = [
+        Task(
+            user_id=1,
+            chat_id=1,
+            message_id=50,
+            image_path=Path(f"batch{i}.png"),
+            workflow_params=WorkflowParams(input_image=f"batch{i}.png", positive_prompt="batch"),
+            lane=TaskLane.BULK,
+            batch_id=batch.id
+        )
+        for i in range(5)
+    ]
+    
+    positions, rejection = await queue.add_tasks(tasks)
+    
+    # Принят префикс до заполнения очереди
+    assert positions == [1, 2, 3]
+    assert rejection is not None
+    assert rejection.reason == AdmissionRejected.QUEUE_FULL
+    assert batch.total == 3
+    assert queue.batch_eta(batch.id) > 0
+    
+    for expected_done in range(1, 4):
+        task = await queue.get_task()
+        await queue.task_done(task, success=True)
+        queue.batches.record(batch, task.status)
+        assert batch.done == expected_done
+    
+    assert batch.finished
+    assert "3/3" in batch.render()
+    assert queue.batch_eta(batch.id) is None
@@ -0,0 +1,45 @@
+"""
+Тесты для UserSettingsManager
+"""
+import pytest
+import json
+from src.storage.user_settings import UserSettingsManager
+
+
+@pytest.mark.asyncio
+async def test_updates_are_flushed_in_batch(tmp_path):
+    """Тест: изменения пишутся в базу пачкой после задержки и переживают перезапуск"""
+    manager = UserSettingsManager(tmp_path, flush_delay=60)
+
+    manager.update_settings(1, default_prompt="first")
+    manager.update_settings(2, auto_confirm=True)
+    manager.update_settings(1, default_steps=8)
+    assert manager.get_settings(1).default_steps == 8
+
+    reopened = UserSettingsManager(tmp_path)
+    assert 1 not in reopened._settings_cache  # Ещё не записано: ждёт flush_delay
+    await reopened.close()
+
+    await manager.close()
+
+    reopened = UserSettingsManager(tmp_path)
+    assert reopened.get_settings(1).default_prompt == "first"
+    assert reopened.get_settings(1).default_steps == 8
+    assert reopened.is_auto_confirm_enabled(2)
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_legacy_json_is_migrated(tmp_path):
+    """Тест: настройки из прежнего user_settings.json переносятся в базу"""
+    legacy = tmp_path / "user_settings.json"
+    legacy.write_text(json.dumps({"7": {"user_id": 7, "default_prompt": "old", "auto_confirm": True}}))
+
+    manager = UserSettingsManager(tmp_path)
+    assert manager.get_default_prompt(7) == "old"
+    assert not legacy.exists()
+    await manager.close()
+
+    reopened = UserSettingsManager(tmp_path)
+    assert reopened.is_auto_confirm_enabled(7)
+    await reopened.close()
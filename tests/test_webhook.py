@@ -0,0 +1,87 @@
+"""
+Тесты для WebhookServer (записанные обновления отправляются через aiohttp TestClient)
+"""
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Dispatcher, Router
+from aiogram.types import Message
+from src.bot.webhook import SECRET_HEADER, WebhookServer
+from src.models.config import WebhookConfig
+
+
+def recorded_update(update_id: int, text: str) -> dict:
+    """Обновление в формате, который присылает Telegram"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def make_server(handled: list, workers: int = 4, queue_size: int = 100) -> WebhookServer:
+    """Сервер с диспетчером, записывающим тексты полученных сообщений"""
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message):
+        await asyncio.sleep(0.05)
+        handled.append(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    config = WebhookConfig(secret_token="secret", workers=workers, queue_size=queue_size)
+    return WebhookServer(dp, MagicMock(), config)
+
+
+@pytest.mark.asyncio
+async def test_webhook_processes_updates_concurrently():
+    """Тест: обновления принимаются сразу и обрабатываются пулом параллельно"""
+    handled = []
+    server = make_server(handled, workers=4)
+    server.start_workers()
+
+    async with TestClient(TestServer(server.app)) as client:
+        for i in range(4):
+            response = await client.post("/webhook", json=recorded_update(i, f"msg {i}"),
+                                         headers={SECRET_HEADER: "secret"})
+            assert response.status == 200
+
+        # 4 обработчика по 50 мс параллельно укладываются в ~одну задержку
+        await asyncio.wait_for(server.updates.join(), timeout=0.15)
+
+    assert sorted(handled) == [f"msg {i}" for i in range(4)]
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_invalid_secret():
+    """Тест: запрос без верного secret token отклоняется и не обрабатывается"""
+    handled = []
+    server = make_server(handled)
+
+    async with TestClient(TestServer(server.app)) as client:
+        response = await client.post("/webhook", json=recorded_update(1, "hi"),
+                                     headers={SECRET_HEADER: "wrong"})
+        assert response.status == 401
+
+    assert server.updates.qsize() == 0
+
+
+@pytest.mark.asyncio
+async def test_webhook_queue_overflow_returns_503():
+    """Тест: при переполненной очереди Telegram получает 503 и повторит доставку"""
+    server = make_server([], queue_size=1)
+
+    async with TestClient(TestServer(server.app)) as client:
+        first = await client.post("/webhook", json=recorded_update(1, "a"), headers={SECRET_HEADER: "secret"})
+        second = await client.post("/webhook", json=recorded_update(2, "b"), headers={SECRET_HEADER: "secret"})
+
+    assert first.status == 200
+    assert second.status == 503
@@ -122,3 +122,17 @@ def test_workflow_with_ui_workflow():
     assert "workflow" in extra_pnginfo
     assert isinstance(extra_pnginfo["workflow"], dict)
     assert "nodes" in extra_pnginfo["workflow"]  # UI формат содержит nodes
+
+
+def test_workflow_megapixels():
+    """Тест установки целевого разрешения (Node 93)"""
+    workflow_path = Path("workflows/qwen_image_edit.json")
+    manager = WorkflowManager(workflow_path)
+    
+    workflow, _ = manager.create_workflow(WorkflowParams(input_image="test.png", positive_prompt="test"))
+    assert workflow["93"]["inputs"]["megapixels"] == 1
+    
+    workflow, _ = manager.create_workflow(
+        WorkflowParams(input_image="test.png", positive_prompt="test", megapixels=0.5)
+    )
+    assert workflow["93"]["inputs"]["megapixels"] == 0.5